@@ -7,10 +7,78 @@ from typing import Optional
 class Settings(BaseSettings):
     """Application settings"""
     database_url: str = "sqlite:///./ar_backend.db"
+    storage_flush_interval: float = 0.05  # seconds between batched database writes
+    storage_batch_size: int = 256  # pending writes that trigger an early flush
+    frame_cache_size: int = 10000  # detection frames held in memory per worker; older ones are read from the database
     api_port: int = 8000
     api_host: str = "0.0.0.0"
     debug: bool = True
     cors_origins: list[str] = ["*"]
+    enabled_modules: list[str] = ["detection", "stream", "navigation", "device"]  # feature routers to load
+    yolov5_repo: Optional[str] = None  # local ultralytics/yolov5 checkout for offline loading
+    model_weights: Optional[str] = None  # local .pt weights (default: pretrained yolov5s)
+    workers: int = 0  # production worker processes (0 = one per core)
+    torch_threads: int = 0  # intra-op threads per worker (0 = cores / workers)
+    inference_process: bool = False  # run detection in a separate process fed over shared memory
+    hazard_classes: list[str] = [  # classes reported in hazards/navigation detection modes
+        "person", "bicycle", "car", "motorcycle", "bus", "train", "truck", "traffic light",
+        "fire hydrant", "stop sign", "parking meter", "bench", "dog", "horse", "chair",
+        "potted plant", "suitcase", "skateboard"
+    ]
+    walking_corridor: list[float] = [0.2, 0.35, 0.8, 1.0]  # navigation mode region: x0, y0, x1, y1 frame fractions
+    tile_size: int = 640  # tiled detection: tile side in pixels (frames larger than this are tiled)
+    tile_overlap: float = 0.2  # tiled detection: minimum overlap between neighbouring tiles
+    tile_min_texture: float = 4.0  # tiles with a lower grey level std dev are not run
+    tile_change_threshold: float = 3.0  # tiles changing less (mean grey levels) reuse their last detections
+    tile_max_reuse: int = 5  # frames a tile's detections may be reused before it runs again
+    tile_merge_threshold: float = 0.7  # cross-tile NMS overlap (intersection over smaller box)
+    camera_height_m: float = 0.9  # default camera lens height above the ground (cane mount)
+    camera_pitch_deg: float = 10.0  # default downward tilt of the camera
+    camera_hfov_deg: float = 55.0  # OV2640 with the stock ESP32-CAM lens (~66 deg diagonal)
+    scene_memory: bool = True  # remember static hazards by location and preload them on routes
+    static_hazard_classes: list[str] = [  # classes remembered by scene memory
+        "bench", "fire hydrant", "stop sign", "parking meter", "traffic light", "potted plant", "chair"
+    ]
+    scene_merge_radius_m: float = 4.0  # sightings of a class this close are the same object
+    scene_half_life_days: float = 14.0  # an unseen object's score halves this often
+    scene_known_score: float = 1.5  # score from which an object is preloaded onto routes
+    scene_forget_score: float = 0.2  # objects decayed below this are deleted
+    scene_max_range_m: float = 15.0  # farther detections are too imprecise to place
+    scene_sighting_interval: float = 60.0  # one sighting per object per this many seconds
+    scene_corridor_m: float = 10.0  # preload hazards this close to the route
+    scene_prune_interval: float = 3600.0  # seconds between sweeps deleting decayed objects
+    alert_cluster_radius_m: float = 25.0  # obstacle reports this close to an alert join it
+    alert_cluster_window: float = 1800.0  # ...if it was last reported within this many seconds
+    alert_report_reliability: float = 0.5  # chance a single report is right, for alert confidence
+    model_input_size: int = 640  # model input resolution at full quality
+    light_model_weights: Optional[str] = None  # lighter .pt used when degraded (default: pretrained yolov5n)
+    adaptive_quality: bool = True  # degrade detection quality under load instead of queueing
+    quality_interval: float = 1.0  # seconds between quality control decisions
+    quality_wait_high: float = 0.5  # inference queue wait (s) above which quality steps down
+    quality_wait_low: float = 0.15  # queue wait (s) below which quality may step back up
+    quality_cpu_high: float = 0.9  # CPU utilization above which quality steps down
+    quality_cpu_low: float = 0.6  # CPU utilization below which quality may step back up
+    inference_concurrency: int = 1  # detections run at once (the model is not shared across threads)
+    inference_queue_limit: int = 64  # waiting detections per priority class before 503
+    frame_ring_slots: int = 8  # shared-memory frame slots
+    frame_ring_slot_bytes: int = 1920 * 1080 * 3  # largest decoded frame a slot holds
+    inference_timeout: float = 30.0  # seconds to wait for the inference process before 504
+    inference_max_restarts: int = 3  # inference process restarts before falling back to in-process detection
+    heartbeat_stale_after: float = 30.0  # seconds without heartbeat before a device is stale
+    heartbeat_offline_after: float = 120.0  # seconds without heartbeat before a device is offline
+    profiling_enabled: bool = False  # expose /api/debug profiling and X-Debug-Trace request tracing
+    admin_token: Optional[str] = None  # required by the debug endpoints and trace header
+    compression_min_size: int = 1024  # smallest response body worth gzip/brotli compressing (bytes)
+    snapshot_max_age: float = 0.5  # seconds a cached camera frame is served for (camera sees 1 / this req/s)
+    snapshot_idle_after: float = 10.0  # stop polling a camera this long after its last snapshot request
+    snapshot_fetch_timeout: float = 5.0  # seconds to wait for /capture.jpg
+    esp32_cam_url: str = "http://192.168.4.1:80/stream"  # default camera, served by the /api/stream endpoints without a device id
+    camera_max_connections: int = 4  # HTTP connections per camera (stream, snapshot, status, trigger)
+    camera_inference_fps: float = 2.0  # detections per second allowed on one camera's frames
+    camera_inference_burst: float = 2.0  # detections a camera may run back to back
+    camera_probe_interval: float = 5.0  # seconds between /status probes of a healthy camera
+    camera_probe_timeout: float = 2.0  # seconds to wait for /status
+    camera_probe_max_backoff: float = 60.0  # longest delay between probes of an unreachable camera
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,167 @@
+"""
+Production launcher
+Loads the detection model once in a parent process and forks uvicorn
+workers that share its weights copy-on-write
+"""
+from typing import Dict
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+# Env vars read by the BLAS/OpenMP runtimes when torch is first imported
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def threads_per_worker(workers: int, torch_threads: int = 0) -> int:
+    """Intra-op threads per worker; 0 splits the cores evenly across workers"""
+    if torch_threads > 0:
+        return torch_threads
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def configure_torch_threads(threads: int):
+    """
+    Pin torch's thread pools for this process
+
+    Must run before the first inference in the process; inter-op threads are
+    kept at one because requests already provide the concurrency.
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+    try:
+        import torch
+    except ImportError:
+        return
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set once per process, before any parallel work
+        pass
+
+
+def _bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(app, sock: socket.socket, threads: int, log_level: str):
+    import uvicorn
+
+    configure_torch_threads(threads)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_production(
+    app_path: str = "main:app",
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = 0,
+    torch_threads: int = 0,
+    preload_model: bool = True,
+    log_level: str = "info"
+):
+    """
+    Run several uvicorn workers sharing one preloaded model
+
+    The parent imports the app and loads the model, freezes the GC so
+    collections in the children don't dirty the shared pages, binds the
+    listening socket and forks. Dead workers are respawned; SIGINT/SIGTERM
+    are forwarded to all workers.
+
+    Args:
+        app_path: "module:attribute" of the FastAPI app
+        host: Interface to bind
+        port: Port to bind
+        workers: Number of worker processes (0 = one per core)
+        torch_threads: Intra-op threads per worker (0 = cores / workers)
+        preload_model: Load the detection model before forking
+        log_level: uvicorn log level
+    """
+    import importlib
+
+    workers = workers or os.cpu_count() or 1
+    threads = threads_per_worker(workers, torch_threads)
+
+    # Keep the parent's own pools small; it never runs inference
+    for var in THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+
+    module_name, attr = app_path.split(":")
+    app = getattr(importlib.import_module(module_name), attr)
+
+    if preload_model:
+        from app.services.ai_detection import ai_service
+
+        started = time.perf_counter()
+        try:
+            ai_service.load_model()
+            logger.info(f"Model preloaded in {time.perf_counter() - started:.1f}s, shared by {workers} workers")
+        except Exception as e:
+            logger.warning(f"Model preload failed, workers will load on demand: {e}")
+
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind_socket(host, port)
+    logger.info(f"Listening on {host}:{port} with {workers} workers x {threads} torch threads")
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                _serve(app, sock, threads, log_level)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+        return pid
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, respawning")
+            time.sleep(0.5)
+            spawn(slot)
+
+    sock.close()
+    logger.info("All workers stopped")
@@ -25,6 +25,7 @@ class ObjectDetectionFrame(BaseModel):
     """Model for object detection results from a frame"""
     frame_id: str
     timestamp: datetime
+    device_id: Optional[str] = Field(None, description="Device that captured the frame (selects its camera calibration)")
     image_path: Optional[str] = Field(None, description="Path to saved frame image")
     objects: List[DetectedObject] = Field(default=[], description="Detected objects in frame")
     frame_size: Dict[str, int] = Field(..., description="Frame dimensions {width, height}")
@@ -72,6 +73,8 @@ class ObstacleAlert(BaseModel):
     location: Optional[GPSLocation] = Field(None, description="Location of obstacle")
     recommended_action: str = Field(..., description="Recommended action for user")
     detected_objects: List[DetectedObject] = Field(default=[], description="Related detected objects")
+    report_count: int = Field(default=1, description="Reports merged into this alert")
+    confidence: Optional[float] = Field(None, ge=0.0, le=1.0, description="Probability the hazard is real")
 
 class DeviceStatus(BaseModel):
     """Model for device status (Arduino + ESP32-CAM)"""
@@ -84,6 +87,24 @@ class DeviceStatus(BaseModel):
     active_sensors: List[str] = Field(default=[], description="Active sensors (camera, gps, etc.)")
     errors: List[str] = Field(default=[], description="Any active error messages")
 
+class CalibrationReference(BaseModel):
+    """An object at a measured distance in a frame from the camera"""
+    label: str = Field(..., description="Object class (e.g. person)")
+    bbox: List[float] = Field(..., min_length=4, max_length=4, description="Box [x, y, width, height] in pixels")
+    frame_width: int = Field(..., gt=0, description="Frame width in pixels")
+    frame_height: int = Field(..., gt=0, description="Frame height in pixels")
+    distance_m: float = Field(..., gt=0, description="Measured distance to the object in meters")
+    object_height_m: Optional[float] = Field(None, gt=0, description="Real object height (default: class prior)")
+
+class CameraCalibration(BaseModel):
+    """Camera mounting and optics used for distance estimation"""
+    height_m: Optional[float] = Field(None, gt=0, description="Lens height above the ground in meters")
+    pitch_deg: Optional[float] = Field(None, ge=-45, le=90, description="Downward tilt in degrees")
+    hfov_deg: Optional[float] = Field(None, gt=10, lt=170, description="Horizontal field of view in degrees")
+    reference: Optional[CalibrationReference] = Field(
+        None, description="Solve pitch and field of view from this object instead"
+    )
+
 class Session(BaseModel):
     """Model for user session/navigation session"""
     session_id: str
@@ -2,23 +2,152 @@
 AI processing endpoints
 Handles image processing with YOLO object detection
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse, Response
-from app.services.ai_detection import ai_service
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import Response
+from app.config import settings
+from app.services.ai_detection import ai_service, mode_options
+from app.services.camera_registry import DEFAULT_CAMERA, UnknownCamera, camera_registry
+from app.services.camera_snapshots import CameraUnavailable
+from app.services.distance import distance_estimator
+from app.services.frame_transport import RingFullError
+from app.services.http_cache import file_response, make_etag, not_modified, validator_headers
+from app.services.image_variants import MaxWidth, Quality, image_variants
+from app.services.inference_process import InferenceTimeoutError, inference_client
+from app.services.inference_scheduler import (
+    INTERACTIVE, LIVE, FrameSuperseded, SchedulerFull, inference_scheduler
+)
+from app.services.quality_control import quality_controller
+from app.services.scene_memory import scene_memory
+from app.services.serialization import Fields, json_response
 from pathlib import Path
+from typing import Annotated, Dict, Literal, Optional
+import asyncio
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+Priority = Annotated[Literal["live", "interactive", "background"], Query(
+    description="Scheduling class: live (walking user's frames), interactive or background"
+)]
+
+Mode = Annotated[Literal["full", "hazards", "navigation"], Query(
+    description="full: all classes, whole frame; hazards: hazard classes only; "
+                "navigation: hazard classes inside the walking corridor"
+)]
+
+# Latest live result per device, answered for frames skipped under load
+_latest_live: Dict[str, dict] = {}
+
+async def _detect(image_data: bytes, priority: str = INTERACTIVE, device_id: Optional[str] = None,
+                  mode: str = "full", tiled: bool = False, session_id: Optional[str] = None) -> dict:
+    """
+    Run detection through the inference scheduler, out of process when the
+    inference process runs
+    
+    Quality options come from the adaptive quality controller when the job
+    starts. Under load, live frames beyond the frame-skip ratio are answered
+    with the device's latest result, marked "skipped". The detection mode
+    adds its class filter and region of interest on top, and tiled frames
+    are tracked per device for tile change skipping. Distances are filled in
+    here, with the device's camera calibration, and static hazards are
+    remembered at the session's GPS location.
+    """
+    live = priority == LIVE and device_id is not None
+    if live and device_id in _latest_live and quality_controller.skip_frame(device_id):
+        return {**_latest_live[device_id], "skipped": True}
+    
+    async def work():
+        options = {**quality_controller.options(priority), **mode_options(mode)}
+        if tiled:
+            options.update(tiled=True, tile_key=device_id)
+        result = await run(options)
+        frame = result.get("frame_size")
+        if frame:
+            distance_estimator.annotate(result["detections"], frame["width"], frame["height"], device_id)
+            if settings.scene_memory:
+                _remember(result["detections"], frame, session_id, device_id)
+        result["quality"] = quality_controller.describe()
+        result["mode"] = mode
+        return result
+    
+    async def run(options: dict):
+        if inference_client.running:
+            import cv2
+            import numpy as np
+            
+            frame = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                raise HTTPException(status_code=400, detail="Invalid image format")
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            return await inference_client.process_frame(frame, options)
+        # Off the event loop; the scheduler keeps the model to one job at a time
+        return await asyncio.to_thread(ai_service.process_image, image_data, options)
+    
+    try:
+        result = await inference_scheduler.submit(work, priority, device_id)
+    except FrameSuperseded as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (SchedulerFull, RingFullError):
+        raise HTTPException(status_code=503, detail="Inference busy, retry shortly")
+    except InferenceTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    if live:
+        _latest_live[device_id] = result
+    return result
+
+def _remember(detections: list, frame: dict, session_id: Optional[str], device_id: Optional[str]):
+    """Record static hazards in scene memory when the walker's location is known"""
+    location = scene_memory.locate(session_id, device_id)
+    if location is None or not detections:
+        return
+    focal = distance_estimator.calibration(device_id).focal(frame["width"], frame["height"])
+    bearings = [
+        math.degrees(math.atan((x + w / 2 - frame["width"] / 2) / focal))
+        for x, y, w, h in (d["bbox"] for d in detections)
+    ]
+    scene_memory.observe(location, detections, bearings)
+
+def _detection_response(result: dict, fields: Optional[str], **extra):
+    return json_response({
+        "status": "success",
+        **extra,
+        "detections": result["detections"],
+        "description": result["description"],
+        "image_url": result["image_url"],
+        "audio_url": result["audio_url"],
+        "count": result["count"],
+        "frame_size": result.get("frame_size"),
+        "processing_time_ms": result.get("processing_time_ms"),
+        "timings_ms": result.get("timings_ms", {}),
+        "quality": result.get("quality"),
+        "mode": result.get("mode", "full"),
+        "roi": result.get("roi"),
+        "tiles": result.get("tiles"),
+        "skipped": result.get("skipped", False)
+    }, fields=fields)
+
 @router.post("/detect")
-async def detect_objects(file: UploadFile = File(...)):
+async def detect_objects(file: UploadFile = File(...), fields: Fields = None,
+                         priority: Priority = INTERACTIVE, device_id: Optional[str] = None,
+                         mode: Mode = "full", tiled: bool = False, session_id: Optional[str] = None):
     """
     Process uploaded image with AI model for object detection
     
     Args:
         file: Image file to process
+        fields: Optional field projection (e.g. count,detections.class)
+        priority: Scheduling class; live frames replace the same device's
+            frame that is still waiting (the replaced request gets 409)
+        device_id: Device the image comes from, for fair sharing between devices
+        mode: Detection mode; hazards/navigation skip irrelevant classes and
+            navigation only looks at the walking corridor
+        tiled: Detect on full-resolution tiles (for uploads larger than
+            TILE_SIZE), so small distant objects aren't lost to downscaling
+        session_id: Session whose GPS location tags the frame for scene
+            memory (default: the device's active session)
         
     Returns:
         Detection results with bounding boxes, description, and audio
@@ -29,64 +158,105 @@ async def detect_objects(file: UploadFile = File(...)):
         
         logger.info(f"Processing image: {file.filename} ({len(image_data)} bytes)")
         
-        # Process with AI model
-        result = ai_service.process_image(image_data)
-        
-        return {
-            "status": "success",
-            "detections": result["detections"],
-            "description": result["description"],
-            "image_url": result["image_url"],
-            "audio_url": result["audio_url"],
-            "count": result["count"]
-        }
+        result = await _detect(image_data, priority, device_id, mode, tiled, session_id)
+        return _detection_response(result, fields)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/camera/{device_id}/detect")
+async def detect_camera_frame(device_id: str, fields: Fields = None, priority: Priority = LIVE,
+                              mode: Mode = "navigation"):
+    """
+    Run detection on a registered camera's latest frame
+    
+    Limited by the camera's inference budget (CAMERA_INFERENCE_FPS);
+    requests over it get 429 with Retry-After. Scheduled as live and run in
+    navigation mode by default.
+    """
+    try:
+        camera = await camera_registry.get(device_id)
+    except UnknownCamera as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    if not camera.budget.try_acquire():
+        retry_after = camera.budget.retry_after()
+        raise HTTPException(
+            status_code=429, detail=f"Inference budget of {device_id} exhausted",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+    
+    try:
+        snapshot = await camera.snapshots.get()
+    except CameraUnavailable as e:
+        raise HTTPException(status_code=504 if e.timeout else 503, detail=str(e))
+    
+    try:
+        result = await _detect(snapshot.data, priority, device_id, mode)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing frame from {device_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return _detection_response(result, fields, device_id=device_id, frame_age_s=round(snapshot.age, 3))
+
+async def _image_response(request: Request, path: Path, max_width: Optional[int],
+                          quality: Optional[int]) -> Response:
+    """Serve a JPEG artifact, re-encoded on request, with 304s while it is unchanged"""
+    if max_width is None and quality is None:
+        return file_response(request, path, "image/jpeg")
+    
+    stat = path.stat()
+    etag = make_etag(path, stat.st_mtime_ns, stat.st_size, max_width, quality)
+    cached = not_modified(request, etag, stat.st_mtime)
+    if cached is not None:
+        return cached
+    
+    data = await asyncio.to_thread(path.read_bytes)
+    variant = await image_variants.get((str(path), stat.st_mtime_ns), data, max_width, quality)
+    return Response(content=variant, media_type="image/jpeg", headers=validator_headers(etag, stat.st_mtime))
+
 @router.get("/detected_image.jpg")
-async def get_detected_image():
+async def get_detected_image(request: Request, max_width: MaxWidth = None, quality: Quality = None):
     """Serve the latest detected image with bounding boxes"""
     image_path = Path("detected_outputs/detected_image.jpg")
     if not image_path.exists():
         raise HTTPException(status_code=404, detail="No detected image available")
-    return FileResponse(image_path, media_type="image/jpeg")
+    return await _image_response(request, image_path, max_width, quality)
 
 @router.get("/detected_audio.mp3")
-async def get_detected_audio():
+async def get_detected_audio(request: Request):
     """Serve the latest audio description"""
     audio_path = Path("detected_outputs/detected_audio.mp3")
     if not audio_path.exists():
         raise HTTPException(status_code=404, detail="No audio available")
-    return FileResponse(audio_path, media_type="audio/mpeg")
+    return file_response(request, audio_path, "audio/mpeg")
 
 @router.post("/trigger-capture")
-async def trigger_esp32_capture():
+async def trigger_esp32_capture(device_id: str = DEFAULT_CAMERA):
     """
     Trigger ESP32-CAM to capture an image
     Proxies the request to the ESP32-CAM device
+    
+    Args:
+        device_id: Registered camera (default: the camera at ESP32_CAM_URL)
     """
     try:
-        import requests
-        import os
-        
-        esp32_url = os.getenv("ESP32_CAM_URL", "http://192.168.4.1:80/stream")
-        trigger_url = esp32_url.replace('/stream', '/trigger-capture')
-        
-        response = requests.post(trigger_url, timeout=5)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(status_code=response.status_code, detail="ESP32 capture failed")
+        camera = await camera_registry.get(device_id)
+    except UnknownCamera as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
-    except Exception as e:
+    try:
+        return await camera.trigger_capture()
+    except CameraUnavailable as e:
         logger.error(f"Error triggering ESP32 capture: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=504 if e.timeout else 502, detail=str(e))
 
 @router.get("/test-image")
-async def get_test_image():
+async def get_test_image(request: Request, max_width: MaxWidth = None, quality: Quality = None):
     """Serve test image for development"""
     test_image_path = Path("backend/test.jpg")
     if not test_image_path.exists():
@@ -96,4 +266,4 @@ async def get_test_image():
     if not test_image_path.exists():
         raise HTTPException(status_code=404, detail="Test image not found")
     
-    return FileResponse(test_image_path, media_type="image/jpeg")
+    return await _image_response(request, test_image_path, max_width, quality)
@@ -0,0 +1,81 @@
+"""
+Debug endpoints
+Admin-only profiling surface: sampling profiles, allocation snapshots and
+request traces. Only mounted when PROFILING_ENABLED is set.
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import hmac
+import logging
+import os
+
+from app.config import settings
+from app.services.profiler import (
+    ProfilerBusyError, memory_profiler, render_collapsed, sampling_profiler, trace_log
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 60.0
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject requests without the configured admin token"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def sample_profile(
+    seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5.0, ge=1.0, le=100.0)
+):
+    """
+    Sample every thread of this worker for a while
+
+    Returns collapsed stacks; pipe into flamegraph.pl or open in speedscope.
+    """
+    logger.info(f"Sampling profile for {seconds}s every {interval_ms}ms (pid {os.getpid()})")
+    try:
+        stacks = await sampling_profiler.profile(seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(render_collapsed(stacks), headers={"X-Worker-Pid": str(os.getpid())})
+
+@router.post("/memory/start")
+async def start_memory_tracing(frames: int = Query(10, ge=1, le=100)):
+    """Start tracemalloc (slows every allocation until stopped)"""
+    memory_profiler.start(frames)
+    return {"status": "tracing", "frames": frames, "pid": os.getpid()}
+
+@router.post("/memory/stop")
+async def stop_memory_tracing():
+    """Stop tracemalloc"""
+    memory_profiler.stop()
+    return {"status": "stopped", "pid": os.getpid()}
+
+@router.get("/memory/snapshot")
+async def memory_snapshot(limit: int = Query(20, ge=1, le=200)):
+    """Top allocation sites and growth since the previous snapshot"""
+    if not memory_profiler.tracing:
+        raise HTTPException(status_code=409, detail="Start tracing with POST /memory/start first")
+    return {"pid": os.getpid(), **memory_profiler.snapshot(limit)}
+
+@router.get("/traces")
+async def list_traces(limit: int = Query(50, ge=1, le=200)):
+    """Recent requests traced with the X-Debug-Trace header"""
+    traces = trace_log.recent(limit)
+    return {"pid": os.getpid(), "traces": [t.as_dict() for t in traces], "count": len(traces)}
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Stage spans of one traced request"""
+    trace = trace_log.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found")
+    return trace.as_dict()
@@ -2,7 +2,7 @@
 Camera and object detection endpoints
 Handles frames from ESP32-CAM and processes object detection
 """
-from fastapi import APIRouter, status, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, status, HTTPException, UploadFile, File, Form, Request
 from fastapi.responses import StreamingResponse
 from app.models import (
     ObjectDetectionFrame, DetectedObject, CameraFrameUpload
@@ -12,14 +12,22 @@ from datetime import datetime
 import io
 import base64
 from pathlib import Path
-import cv2
-import numpy as np
+from app.config import settings
+from app.services.distance import distance_estimator
+from app.services.http_cache import make_etag, not_modified, with_validators
+from app.services.pagination import (
+    CreatedBefore, CreatedFrom, Cursor, Limit, Since, all_of, matches_any, paginate
+)
+from app.services.records import DetectedObjectState, FrameState
+from app.services.serialization import Fields, json_response
+from app.services.storage import storage
 
 router = APIRouter()
 
-# Mock storage for detected frames and objects
-detected_frames_store: List[dict] = []
-frame_id_counter = 1
+# Detected frames, persisted to the database with the most recent cached in memory
+detected_frames_store = storage.collection(
+    "frames", FrameState, max_records=settings.frame_cache_size, partition_by=("device_id",)
+)
 
 @router.post("/camera/upload", status_code=status.HTTP_201_CREATED)
 async def upload_camera_frame(frame_data: CameraFrameUpload):
@@ -32,10 +40,7 @@ async def upload_camera_frame(frame_data: CameraFrameUpload):
     Returns:
         Confirmation with frame processing status
     """
-    global frame_id_counter
-    
-    frame_id = f"frame_{frame_id_counter}"
-    frame_id_counter += 1
+    frame_id = f"frame_{await storage.next_id('frame')}"
     
     # Create directory for frames if it doesn't exist
     frames_dir = Path("saved_frames")
@@ -52,15 +57,15 @@ async def upload_camera_frame(frame_data: CameraFrameUpload):
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid frame data: {str(e)}")
     
-    frame_record = {
-        "frame_id": frame_id,
-        "device_id": frame_data.device_id,
-        "timestamp": frame_data.timestamp,
-        "frame_path": str(frame_path) if frame_path else None,
-        "metadata": frame_data.metadata,
-        "status": "received"
-    }
-    detected_frames_store.append(frame_record)
+    frame_record = FrameState(
+        frame_id=frame_id,
+        device_id=frame_data.device_id,
+        timestamp=frame_data.timestamp,
+        frame_path=str(frame_path) if frame_path else None,
+        metadata=frame_data.metadata,
+        status="received"
+    )
+    detected_frames_store.put(frame_id, frame_record)
     
     return {
         "status": "received",
@@ -86,10 +91,7 @@ async def upload_camera_image(
     Returns:
         Confirmation with frame processing status and image info
     """
-    global frame_id_counter
-    
-    frame_id = f"frame_{frame_id_counter}"
-    frame_id_counter += 1
+    frame_id = f"frame_{await storage.next_id('frame')}"
     timestamp = datetime.utcnow().isoformat()
     
     # Create directory for frames
@@ -106,6 +108,9 @@ async def upload_camera_image(
             f.write(image_bytes)
         
         # Decode image with OpenCV for analysis
+        import cv2
+        import numpy as np
+        
         nparr = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
@@ -115,56 +120,68 @@ async def upload_camera_image(
         height, width, channels = img.shape
         
         # Store frame record
-        frame_record = {
-            "frame_id": frame_id,
-            "device_id": device_id,
-            "timestamp": timestamp,
-            "frame_path": str(frame_path),
-            "image_info": {
+        frame_record = FrameState(
+            frame_id=frame_id,
+            device_id=device_id,
+            timestamp=timestamp,
+            frame_path=str(frame_path),
+            image_info={
                 "width": int(width),
                 "height": int(height),
                 "channels": int(channels),
                 "size_bytes": len(image_bytes)
             },
-            "metadata": metadata,
-            "status": "received"
-        }
-        detected_frames_store.append(frame_record)
+            metadata=metadata,
+            status="received"
+        )
+        detected_frames_store.put(frame_id, frame_record)
         
         return {
             "status": "success",
             "frame_id": frame_id,
             "timestamp": timestamp,
             "message": "Image received and saved",
-            "image_info": frame_record["image_info"]
+            "image_info": frame_record.image_info
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 @router.get("/detection/latest")
-async def get_latest_detection():
-    """Get the latest object detection results"""
+async def get_latest_detection(request: Request, fields: Fields = None):
+    """Get the latest object detection results, optionally projected to `fields`"""
     if not detected_frames_store:
         raise HTTPException(status_code=404, detail="No detection results available")
     
-    latest_frame = detected_frames_store[-1]
-    return latest_frame
+    # Polled by clients; the collection version changes with every new frame
+    modified = detected_frames_store.last_modified
+    etag = make_etag("frames", detected_frames_store.version, fields)
+    cached = not_modified(request, etag, modified)
+    if cached is not None:
+        return cached
+    
+    latest_frame = detected_frames_store.latest()
+    return with_validators(json_response(latest_frame, fields=fields), etag, modified)
 
 @router.get("/detection/{frame_id}")
-async def get_detection_results(frame_id: str):
+async def get_detection_results(frame_id: str, request: Request, fields: Fields = None):
     """
     Get object detection results for a specific frame
     
     Args:
         frame_id: Frame identifier
+        fields: Optional field projection (e.g. objects.label,objects.distance)
     
     Returns:
         Detection results with detected objects
     """
-    for frame in detected_frames_store:
-        if frame["frame_id"] == frame_id:
-            return frame
+    frame = await detected_frames_store.fetch(frame_id)
+    if frame is not None:
+        modified = detected_frames_store.modified_at(frame_id)
+        etag = make_etag("frame", frame_id, modified, fields)
+        return not_modified(request, etag, modified) or with_validators(
+            json_response(frame, fields=fields), etag, modified
+        )
     
     raise HTTPException(status_code=404, detail=f"Frame {frame_id} not found")
 
@@ -179,14 +196,30 @@ async def process_detection_frame(detection_result: ObjectDetectionFrame):
     Args:
         detection_result: Detection results with objects and frame info
     
+    Objects without a distance get one estimated from their box and the
+    frame size, with the camera calibration of `device_id` when given.
+    
     Returns:
         Stored detection frame with processing details
     """
-    detection_dict = detection_result.dict()
-    detection_dict["stored_at"] = datetime.utcnow()
-    detected_frames_store.append(detection_dict)
+    width, height = detection_result.frame_size.get("width"), detection_result.frame_size.get("height")
+    if width and height:
+        distance_estimator.fill(detection_result.objects, width, height, detection_result.device_id)
     
-    return detection_result
+    frame = FrameState(
+        frame_id=detection_result.frame_id,
+        device_id=detection_result.device_id,
+        timestamp=detection_result.timestamp,
+        image_path=detection_result.image_path,
+        objects=[DetectedObjectState.from_model(obj) for obj in detection_result.objects],
+        frame_size=detection_result.frame_size,
+        processing_time_ms=detection_result.processing_time_ms,
+        stored_at=datetime.utcnow()
+    )
+    detected_frames_store.put(frame.frame_id, frame)
+    
+    # Already validated on the way in; dump it once instead of re-validating
+    return json_response(detection_result)
 
 @router.get("/detection/stream/latest")
 async def get_detection_stream():
@@ -197,39 +230,56 @@ async def get_detection_stream():
             "message": "No detection data available yet"
         }
     
-    latest = detected_frames_store[-1]
+    latest = detected_frames_store.latest()
     return {
         "status": "active",
-        "latest_frame_id": latest.get("frame_id"),
-        "timestamp": latest.get("timestamp"),
-        "object_count": len(latest.get("objects", []))
+        "latest_frame_id": latest.frame_id,
+        "timestamp": latest.timestamp,
+        "object_count": len(latest.objects)
     }
 
 @router.delete("/detection/{frame_id}")
 async def delete_detection_frame(frame_id: str):
     """Delete a specific detection frame record"""
-    for i, frame in enumerate(detected_frames_store):
-        if frame["frame_id"] == frame_id:
-            detected_frames_store.pop(i)
-            return {"status": "deleted", "frame_id": frame_id}
+    if await detected_frames_store.fetch(frame_id) is not None:
+        detected_frames_store.delete(frame_id)
+        return {"status": "deleted", "frame_id": frame_id}
     
     raise HTTPException(status_code=404, detail=f"Frame {frame_id} not found")
 
 @router.get("/detection/device/{device_id}")
-async def get_device_detections(device_id: str, limit: int = 10):
+async def get_device_detections(
+    device_id: str,
+    request: Request,
+    status: Optional[str] = None,
+    created_from: CreatedFrom = None,
+    created_before: CreatedBefore = None,
+    limit: Limit = 10,
+    cursor: Cursor = None,
+    since: Since = None,
+    fields: Fields = None
+):
     """
-    Get recent detection frames from a specific device
+    Get recent detection frames from a specific device, newest first
     
     Args:
         device_id: ESP32-CAM device identifier
-        limit: Maximum number of recent frames to return
+        status: Optional comma-separated frame statuses
+        created_from: Only frames captured at or after this time
+        created_before: Only frames captured before this time
+        limit: Maximum number of frames per page
+        cursor: X-Next-Cursor of the previous page, for older frames
+        since: X-Sync-Cursor of an earlier response, for frames stored since
+        fields: Optional field projection
     
     Returns:
-        List of recent detection frames from device
+        List of detection frames from device
     """
-    device_frames = [
-        frame for frame in detected_frames_store 
-        if frame.get("device_id") == device_id
-    ]
-    
-    return device_frames[-limit:] if device_frames else []
+    # Pages walk the device's own creation index; syncs filter the recent changes
+    where = matches_any("status", status)
+    if since is not None:
+        where = all_of(lambda frame: frame.device_id == device_id, where)
+    return paginate(
+        request, detected_frames_store, limit, cursor, since, where, created_from, created_before,
+        newest_first=True, fields=fields, partition=("device_id", device_id)
+    )
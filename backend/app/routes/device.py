@@ -2,17 +2,54 @@
 Device management endpoints
 Handles Arduino and ESP32-CAM device status, connectivity, and configuration
 """
-from fastapi import APIRouter, status, HTTPException
-from app.models import DeviceStatus, Session
+from fastapi import APIRouter, status, HTTPException, Query, Request
+from app.models import CameraCalibration, DeviceStatus, Session
+from app.services.http_cache import make_etag, not_modified, with_validators
+from app.services.liveness import liveness_monitor
+from app.services.pagination import (
+    PAGE_LIMIT_DEFAULT, CreatedBefore, CreatedFrom, Cursor, Limit, Since,
+    all_of, matches_any, paginate, status_filter
+)
+from app.services.records import DeviceState
+from app.services.serialization import Fields, json_response
+from app.services.storage import storage
 from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
 
-# Mock storage for devices and sessions
-connected_devices: List[dict] = {}
-active_sessions: List[dict] = []
-session_id_counter = 1
+# Devices and sessions, cached in memory and persisted to the database
+connected_devices = storage.collection("devices", DeviceState)
+active_sessions = storage.collection("sessions")
+
+def _on_liveness_transition(event: dict):
+    """Mirror liveness monitor transitions onto the device record"""
+    device = connected_devices.get(event["device_id"])
+    if device is not None:
+        device.connectivity = event["to"]
+        device.connectivity_changed_at = event["timestamp"]
+        connected_devices.save(event["device_id"])
+
+def _seconds_since_heartbeat(device_id: str) -> Optional[float]:
+    """Silence according to the shared record, which other workers also update"""
+    device = connected_devices.get(device_id)
+    if device is None or not isinstance(device.last_heartbeat, datetime):
+        return None
+    return (datetime.utcnow() - device.last_heartbeat).total_seconds()
+
+_devices_seen = None
+
+def _changed_devices() -> List[str]:
+    """Devices changed since the last call, including ones registered by other workers"""
+    global _devices_seen
+    changed, position, _ = connected_devices.changes(_devices_seen, limit=len(connected_devices))
+    if position is not None:
+        _devices_seen = position
+    return [device.device_id for device in changed]
+
+liveness_monitor.add_listener(_on_liveness_transition)
+liveness_monitor.silence_probe = _seconds_since_heartbeat
+liveness_monitor.discover = _changed_devices
 
 @router.post("/device/register", status_code=status.HTTP_201_CREATED)
 async def register_device(
@@ -31,19 +68,17 @@ async def register_device(
     Returns:
         Device registration confirmation
     """
-    device = {
-        "device_id": device_id,
-        "device_type": device_type,
-        "registered_at": datetime.utcnow(),
-        "last_heartbeat": datetime.utcnow(),
-        "connectivity": "online",
-        "battery_level": 100,
-        "active_sensors": [],
-        "errors": [],
-        "metadata": metadata
-    }
+    now = datetime.utcnow()
+    device = DeviceState(
+        device_id=device_id,
+        device_type=device_type,
+        registered_at=now,
+        last_heartbeat=now,
+        metadata=metadata
+    )
     
-    connected_devices[device_id] = device
+    connected_devices.put(device_id, device)
+    liveness_monitor.track(device_id)
     
     return {
         "status": "registered",
@@ -63,34 +98,67 @@ async def send_heartbeat(device_id: str, battery_level: Optional[float] = None):
     Returns:
         Heartbeat acknowledgment
     """
-    if device_id not in connected_devices:
+    device = await connected_devices.fetch(device_id)
+    if device is None:
         raise HTTPException(status_code=404, detail=f"Device {device_id} not registered")
     
-    device = connected_devices[device_id]
-    device["last_heartbeat"] = datetime.utcnow()
-    device["connectivity"] = "online"
+    device.last_heartbeat = datetime.utcnow()
+    device.connectivity = "online"
+    liveness_monitor.heartbeat(device_id)
     
     if battery_level is not None:
-        device["battery_level"] = battery_level
+        device.battery_level = battery_level
+    connected_devices.save(device_id)
     
     return {
         "status": "acknowledged",
         "device_id": device_id,
-        "timestamp": device["last_heartbeat"]
+        "timestamp": device.last_heartbeat
     }
 
+@router.get("/device/fleet/status")
+async def get_fleet_status():
+    """Get device counts per liveness state (online, stale, offline)"""
+    return liveness_monitor.fleet_counts()
+
+@router.get("/device/fleet/events")
+async def get_fleet_events(limit: int = 50):
+    """Get recent device liveness transitions"""
+    return liveness_monitor.recent_events(limit)
+
+@router.get("/device/list")
+async def list_all_devices(
+    request: Request,
+    device_type: Optional[str] = Query(None, description="Comma-separated device types"),
+    connectivity: Optional[str] = Query(None, description="Comma-separated liveness states (online, stale, offline)"),
+    created_from: CreatedFrom = None,
+    created_before: CreatedBefore = None,
+    limit: Limit = PAGE_LIMIT_DEFAULT,
+    cursor: Cursor = None,
+    since: Since = None,
+    fields: Fields = None
+):
+    """
+    List registered devices in registration order, one page at a time
+    
+    Follow X-Next-Cursor for further pages, then pass X-Sync-Cursor as
+    `since` to fetch only the devices that changed.
+    """
+    where = all_of(matches_any("device_type", device_type), matches_any("connectivity", connectivity))
+    return paginate(request, connected_devices, limit, cursor, since, where, created_from, created_before, fields=fields)
+
 @router.get("/device/{device_id}")
-async def get_device_status(device_id: str):
-    """Get current status of a specific device"""
-    if device_id not in connected_devices:
+async def get_device_status(device_id: str, request: Request, fields: Fields = None):
+    """Get current status of a specific device, optionally projected to `fields`"""
+    device = await connected_devices.fetch(device_id)
+    if device is None:
         raise HTTPException(status_code=404, detail=f"Device {device_id} not registered")
     
-    return connected_devices[device_id]
-
-@router.get("/device/list")
-async def list_all_devices():
-    """Get list of all registered devices"""
-    return list(connected_devices.values())
+    modified = connected_devices.modified_at(device_id)
+    etag = make_etag("device", device_id, modified, fields)
+    return not_modified(request, etag, modified) or with_validators(
+        json_response(device, fields=fields), etag, modified
+    )
 
 @router.put("/device/{device_id}/update-sensors")
 async def update_device_sensors(device_id: str, active_sensors: List[str]):
@@ -104,11 +172,55 @@ async def update_device_sensors(device_id: str, active_sensors: List[str]):
     Returns:
         Updated device status
     """
-    if device_id not in connected_devices:
+    device = await connected_devices.fetch(device_id)
+    if device is None:
         raise HTTPException(status_code=404, detail=f"Device {device_id} not registered")
     
-    connected_devices[device_id]["active_sensors"] = active_sensors
-    return connected_devices[device_id]
+    device.active_sensors = active_sensors
+    connected_devices.save(device_id)
+    return json_response(device)
+
+@router.put("/device/{device_id}/camera-calibration")
+async def calibrate_device_camera(device_id: str, calibration: CameraCalibration):
+    """
+    Set the camera calibration used to estimate object distances
+    
+    Args:
+        device_id: Device identifier
+        calibration: Explicit height / pitch / field of view, or a reference
+            object at a measured distance to solve pitch and field of view from
+    
+    Returns:
+        The calibration now in effect
+    """
+    # Deferred: distance estimation pulls in numpy, which device-only nodes never load
+    from app.services.distance import calibrate_from_reference, distance_estimator
+    
+    device = await connected_devices.fetch(device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail=f"Device {device_id} not registered")
+    
+    current = distance_estimator.calibration(device_id).to_dict()
+    height_m = calibration.height_m or current["height_m"]
+    if calibration.reference is not None:
+        ref = calibration.reference
+        try:
+            solved = calibrate_from_reference(
+                ref.label, ref.bbox, ref.frame_width, ref.frame_height, ref.distance_m,
+                ref.object_height_m, height_m
+            ).to_dict()
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    else:
+        solved = {
+            "height_m": height_m,
+            "pitch_deg": calibration.pitch_deg if calibration.pitch_deg is not None else current["pitch_deg"],
+            "hfov_deg": calibration.hfov_deg or current["hfov_deg"]
+        }
+    
+    device.metadata = {**(device.metadata or {}), "camera_calibration": solved}
+    connected_devices.save(device_id)
+    return {"status": "calibrated", "device_id": device_id, "camera_calibration": solved}
 
 @router.post("/device/{device_id}/error")
 async def report_device_error(device_id: str, error_message: str):
@@ -122,12 +234,13 @@ async def report_device_error(device_id: str, error_message: str):
     Returns:
         Error acknowledgment
     """
-    if device_id not in connected_devices:
+    device = await connected_devices.fetch(device_id)
+    if device is None:
         raise HTTPException(status_code=404, detail=f"Device {device_id} not registered")
     
-    device = connected_devices[device_id]
-    if error_message not in device["errors"]:
-        device["errors"].append(error_message)
+    if error_message not in device.errors:
+        device.errors.append(error_message)
+        connected_devices.save(device_id)
     
     return {
         "status": "error_recorded",
@@ -138,10 +251,12 @@ async def report_device_error(device_id: str, error_message: str):
 @router.post("/device/{device_id}/clear-errors")
 async def clear_device_errors(device_id: str):
     """Clear all errors on a device"""
-    if device_id not in connected_devices:
+    device = await connected_devices.fetch(device_id)
+    if device is None:
         raise HTTPException(status_code=404, detail=f"Device {device_id} not registered")
     
-    connected_devices[device_id]["errors"] = []
+    device.errors = []
+    connected_devices.save(device_id)
     return {"status": "errors_cleared", "device_id": device_id}
 
 @router.post("/session/start", status_code=status.HTTP_201_CREATED)
@@ -155,10 +270,7 @@ async def start_session(user_id: Optional[str] = None):
     Returns:
         Session details
     """
-    global session_id_counter
-    
-    session_id = f"session_{session_id_counter}"
-    session_id_counter += 1
+    session_id = f"session_{await storage.next_id('session')}"
     
     session = {
         "session_id": session_id,
@@ -171,45 +283,58 @@ async def start_session(user_id: Optional[str] = None):
         "status": "active"
     }
     
-    active_sessions.append(session)
+    active_sessions.put(session_id, session)
     
     return session
 
 @router.get("/session/{session_id}")
 async def get_session(session_id: str):
     """Get details for a specific session"""
-    for session in active_sessions:
-        if session["session_id"] == session_id:
-            return session
+    session = await active_sessions.fetch(session_id)
+    if session is not None:
+        return session
     
     raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
 
 @router.post("/session/{session_id}/add-device")
 async def add_device_to_session(session_id: str, device_id: str):
     """Add a device to an active session"""
-    for session in active_sessions:
-        if session["session_id"] == session_id:
-            if device_id not in [d.get("device_id") for d in session["active_devices"]]:
-                if device_id in connected_devices:
-                    session["active_devices"].append(
-                        {"device_id": device_id, "connected_at": datetime.utcnow()}
-                    )
-            return session
+    session = await active_sessions.fetch(session_id)
+    if session is not None:
+        if device_id not in [d.get("device_id") for d in session["active_devices"]]:
+            if await connected_devices.fetch(device_id) is not None:
+                session["active_devices"].append(
+                    {"device_id": device_id, "connected_at": datetime.utcnow()}
+                )
+                active_sessions.save(session_id)
+        return session
     
     raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
 
 @router.post("/session/{session_id}/end")
 async def end_session(session_id: str):
     """End an active session"""
-    for session in active_sessions:
-        if session["session_id"] == session_id:
-            session["end_time"] = datetime.utcnow()
-            session["status"] = "completed"
-            return session
+    session = await active_sessions.fetch(session_id)
+    if session is not None:
+        session["end_time"] = datetime.utcnow()
+        session["status"] = "completed"
+        active_sessions.save(session_id)
+        return session
     
     raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
 
 @router.get("/session/list/active")
-async def list_active_sessions():
-    """Get all active sessions"""
-    return [s for s in active_sessions if s["status"] == "active"]
+async def list_active_sessions(
+    request: Request,
+    status: Optional[str] = Query(None, description="Comma-separated statuses, or all (default active)"),
+    user_id: Optional[str] = None,
+    created_from: CreatedFrom = None,
+    created_before: CreatedBefore = None,
+    limit: Limit = PAGE_LIMIT_DEFAULT,
+    cursor: Cursor = None,
+    since: Since = None,
+    fields: Fields = None
+):
+    """List sessions (active by default), paginated like /device/list"""
+    where = all_of(status_filter(status, since), matches_any("user_id", user_id))
+    return paginate(request, active_sessions, limit, cursor, since, where, created_from, created_before, fields=fields)
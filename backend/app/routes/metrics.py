@@ -0,0 +1,71 @@
+"""
+Metrics endpoint
+Exposes pipeline latency histograms, queue depths and cache statistics in
+the Prometheus text format
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from typing import Callable
+import sys
+from app.services.metrics import metrics
+from app.services.storage import storage
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _loaded(module: str, attr: str, read: Callable):
+    """
+    Gauge callback reading a service from a module an enabled router imported
+
+    Resolving the service at scrape time keeps this router from importing
+    feature modules (and the vision stack) a node doesn't run; the gauge is
+    skipped while the module isn't loaded.
+    """
+    def callback():
+        service = getattr(sys.modules.get(module), attr, None)
+        return read(service) if service is not None else None
+    return callback
+
+
+metrics.gauge(
+    "snc_model_load_seconds", "Time taken to load the detection model",
+    _loaded("app.services.ai_detection", "ai_service", lambda s: s.model_load_seconds)
+)
+metrics.gauge(
+    "snc_inference_queue_depth", "Frames submitted to the inference process and not answered yet",
+    _loaded("app.services.inference_process", "inference_client", lambda c: c.queue_depth())
+)
+metrics.gauge(
+    "snc_frame_ring_slots_in_use", "Shared-memory frame slots currently referenced",
+    _loaded("app.services.inference_process", "inference_client",
+            lambda c: c.ring.in_use() if c.ring else None)
+)
+metrics.gauge(
+    "snc_storage_pending_writes", "Writes waiting for the next batched flush",
+    lambda: len(storage._pending)
+)
+metrics.gauge(
+    "snc_route_cache_hit_ratio", "Route cache hit ratio",
+    _loaded("app.services.routing", "routing_service", lambda s: s.cache.stats()["hit_rate"])
+)
+metrics.gauge(
+    "snc_route_cache_entries", "Routes held in the route cache",
+    _loaded("app.services.routing", "routing_service", lambda s: s.cache.stats()["entries"])
+)
+metrics.gauge(
+    "snc_active_routes_tracked", "Active routes in the reroute spatial index",
+    _loaded("app.services.rerouting", "reroute_service", lambda s: s.stats()["tracked_routes"])
+)
+metrics.gauge(
+    "snc_devices", "Devices per liveness state",
+    _loaded("app.services.liveness", "liveness_monitor",
+            lambda m: {(state,): count for state, count in m.counts.items()}),
+    ("state",)
+)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -2,26 +2,45 @@
 Navigation and GPS guidance endpoints
 Integrates with Google Maps API for route planning and turn-by-turn guidance
 """
-from fastapi import APIRouter, status, HTTPException, Query
+from fastapi import APIRouter, status, HTTPException, Query, Request
 from app.models import (
     NavigationGuidance, GPSLocation, ObstacleAlert
 )
+from app.config import settings
+from app.services.alert_clustering import AlertClusterer
+from app.services.routing import routing_service
+from app.services.http_cache import make_etag, not_modified, with_validators
+from app.services.pagination import (
+    PAGE_LIMIT_DEFAULT, CreatedBefore, CreatedFrom, Cursor, Limit, Since,
+    all_of, matches_any, paginate, status_filter
+)
+from app.services.rerouting import reroute_service
+from app.services.scene_memory import scene_memory
+from app.services.records import AlertState, GeoPoint, RouteState
+from app.services.serialization import Fields, json_response
+from app.services.storage import storage
 from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
 
-# Mock storage for navigation sessions and routes
-active_routes: List[dict] = []
-obstacle_alerts_store: List[dict] = []
-route_id_counter = 1
-alert_id_counter = 1
+# Routes and alerts, cached in memory and persisted to the database
+active_routes = storage.collection("routes", RouteState)
+obstacle_alerts_store = storage.collection("alerts", AlertState)
+sessions = storage.collection("sessions")
+alert_clusterer = AlertClusterer(
+    obstacle_alerts_store,
+    radius_m=settings.alert_cluster_radius_m,
+    window=settings.alert_cluster_window,
+    reliability=settings.alert_report_reliability
+)
 
 @router.post("/navigation/start-route", status_code=status.HTTP_201_CREATED)
 async def start_navigation_route(
     origin: GPSLocation,
     destination: GPSLocation,
-    session_id: Optional[str] = None
+    session_id: Optional[str] = None,
+    profile: str = "walking"
 ):
     """
     Start a new navigation route from origin to destination
@@ -31,73 +50,100 @@ async def start_navigation_route(
         origin: Starting GPS location
         destination: Target destination GPS location
         session_id: Optional session identifier
+        profile: Routing profile (walking, wheelchair, ...)
     
     Returns:
-        Navigation guidance with step-by-step instructions
-    """
-    global route_id_counter
-    
-    route_id = f"route_{route_id_counter}"
-    route_id_counter += 1
-    
-    # Mock Google Maps integration
-    # In production, this would call Google Maps API
-    mock_instructions = [
-        "Head north on Main Street for 500 meters",
-        "Turn right onto Market Avenue",
-        "Continue for 300 meters to destination",
-        "Destination is on your left"
-    ]
-    
-    mock_waypoints = [
-        origin,
-        GPSLocation(latitude=origin.latitude + 0.005, longitude=origin.longitude),
-        GPSLocation(latitude=origin.latitude + 0.010, longitude=origin.longitude + 0.005),
-        destination
-    ]
-    
-    # Calculate mock distance and duration
-    mock_distance = 1200  # meters
-    mock_duration = 900  # seconds (15 minutes)
-    
-    route = {
-        "route_id": route_id,
-        "session_id": session_id,
-        "origin": origin.dict(),
-        "destination": destination.dict(),
-        "instructions": mock_instructions,
-        "distance_remaining": mock_distance,
-        "duration_remaining": mock_duration,
-        "current_step": 0,
-        "waypoints": [wp.dict() for wp in mock_waypoints],
-        "status": "active",
-        "created_at": datetime.utcnow()
-    }
+        Navigation guidance with step-by-step instructions, plus the static
+        hazards scene memory knows along the route
+    """
+    route_id = f"route_{await storage.next_id('route')}"
     
-    active_routes.append(route)
+    # Repeated commutes are served from the route cache
+    origin_point = GeoPoint.from_model(origin)
+    destination_point = GeoPoint.from_model(destination)
+    plan = routing_service.get_route(origin_point, destination_point, profile)
+    
+    route = RouteState(
+        route_id=route_id,
+        session_id=session_id,
+        origin=origin_point,
+        destination=destination_point,
+        profile=profile,
+        instructions=plan["instructions"],
+        distance_remaining=plan["distance"],
+        duration_remaining=plan["duration"],
+        waypoints=plan["waypoints"],
+        created_at=datetime.utcnow()
+    )
+    
+    active_routes.put(route_id, route)
+    reroute_service.track(route)
+    
+    known_hazards = []
+    if settings.scene_memory:
+        known_hazards = scene_memory.along_route(route.waypoints)
     
     return {
         "route_id": route_id,
         "status": "started",
-        "total_distance": mock_distance,
-        "estimated_duration": mock_duration,
-        "instructions": mock_instructions
+        "total_distance": plan["distance"],
+        "estimated_duration": plan["duration"],
+        "instructions": plan["instructions"],
+        "cached": plan["cached"],
+        "known_hazards": known_hazards
     }
 
+@router.get("/navigation/route/{route_id}/known-hazards")
+async def get_known_hazards(route_id: str, corridor_m: Optional[float] = Query(None, gt=0, le=100)):
+    """
+    Static hazards remembered along a route's remaining path, in route order
+    
+    Args:
+        route_id: Route identifier
+        corridor_m: Distance from the path to include (default SCENE_CORRIDOR_M)
+    """
+    route = await active_routes.fetch(route_id)
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"Route {route_id} not found")
+    return json_response({
+        "route_id": route_id,
+        "known_hazards": scene_memory.along_route(route.waypoints, corridor_m)
+    })
+
+@router.get("/navigation/scene-memory/stats")
+async def get_scene_memory_stats():
+    """Get scene memory statistics (remembered objects, known hazards, indexed cells)"""
+    return scene_memory.stats()
+
+@router.get("/navigation/alert-clusters/stats")
+async def get_alert_cluster_stats():
+    """Get obstacle report clustering statistics (live alerts, buckets, radius, window)"""
+    return alert_clusterer.stats()
+
+@router.get("/navigation/route-cache/stats")
+async def get_route_cache_stats():
+    """Get route cache statistics (entries, hit rate, evictions, invalidations)"""
+    return routing_service.cache.stats()
+
 @router.get("/navigation/route/{route_id}", response_model=dict)
-async def get_route_status(route_id: str):
+async def get_route_status(route_id: str, request: Request, fields: Fields = None):
     """
     Get current status and guidance for an active route
     
     Args:
         route_id: Route identifier
+        fields: Optional field projection
     
     Returns:
         Current navigation guidance
     """
-    for route in active_routes:
-        if route["route_id"] == route_id:
-            return route
+    route = await active_routes.fetch(route_id)
+    if route is not None:
+        modified = active_routes.modified_at(route_id)
+        etag = make_etag("route", route_id, modified, fields)
+        return not_modified(request, etag, modified) or with_validators(
+            json_response(route, fields=fields), etag, modified
+        )
     
     raise HTTPException(status_code=404, detail=f"Route {route_id} not found")
 
@@ -113,31 +159,80 @@ async def update_user_location(route_id: str, current_location: GPSLocation):
     Returns:
         Updated navigation guidance with next instruction
     """
-    for route in active_routes:
-        if route["route_id"] == route_id:
-            route["current_location"] = current_location.dict()
-            
-            # Mock distance calculation
-            # In production, calculate actual distance to destination
-            route["distance_remaining"] = max(0, route["distance_remaining"] - 50)
-            route["duration_remaining"] = max(0, route["duration_remaining"] - 30)
-            
-            # Auto-advance to next instruction if close enough
-            if route["distance_remaining"] < 100 and route["current_step"] < len(route["instructions"]) - 1:
-                route["current_step"] += 1
-            
-            if route["distance_remaining"] == 0:
-                route["status"] = "completed"
-            
-            return {
-                "route_id": route_id,
-                "current_instruction": route["instructions"][route["current_step"]],
-                "step_number": route["current_step"] + 1,
-                "total_steps": len(route["instructions"]),
-                "distance_remaining": route["distance_remaining"],
-                "duration_remaining": route["duration_remaining"],
-                "status": route["status"]
-            }
+    route = await active_routes.fetch(route_id)
+    if route is not None:
+        route.current_location = GeoPoint.from_model(current_location)
+        
+        # The session's fix tags its devices' frames for scene memory
+        session = sessions.get(route.session_id) if route.session_id else None
+        if session is not None:
+            session["current_location"] = route.current_location.to_dict()
+            sessions.save(route.session_id)
+        
+        # Mock distance calculation
+        # In production, calculate actual distance to destination
+        route.distance_remaining = max(0, route.distance_remaining - 50)
+        route.duration_remaining = max(0, route.duration_remaining - 30)
+        
+        # Auto-advance to next instruction if close enough
+        if route.distance_remaining < 100 and route.current_step < len(route.instructions) - 1:
+            route.current_step += 1
+        
+        if route.distance_remaining == 0:
+            route.status = "completed"
+            reroute_service.untrack(route_id)
+        
+        response = {
+            "route_id": route_id,
+            "current_instruction": route.instructions[route.current_step],
+            "step_number": route.current_step + 1,
+            "total_steps": len(route.instructions),
+            "distance_remaining": route.distance_remaining,
+            "duration_remaining": route.duration_remaining,
+            "guidance_version": route.guidance_version,
+            "status": route.status
+        }
+        
+        # Deliver reroutes triggered by obstacle alerts since the last update
+        if route.pending_updates:
+            response["rerouted"] = True
+            response["updates"] = route.pending_updates
+            route.pending_updates = []
+        
+        active_routes.save(route_id)
+        return json_response(response)
+    
+    raise HTTPException(status_code=404, detail=f"Route {route_id} not found")
+
+@router.get("/navigation/route/{route_id}/guidance-updates")
+async def get_guidance_updates(route_id: str, since_version: int = 0):
+    """
+    Get guidance changes pushed to a route (e.g. obstacle reroutes)
+    
+    Args:
+        route_id: Route identifier
+        since_version: Last guidance version the client has applied
+    
+    Returns:
+        Current guidance when it is newer than since_version
+    """
+    route = await active_routes.fetch(route_id)
+    if route is not None:
+        if route.guidance_version <= since_version:
+            return {"route_id": route_id, "guidance_version": route.guidance_version, "changed": False}
+        
+        route.pending_updates = []
+        active_routes.save(route_id)
+        return json_response({
+            "route_id": route_id,
+            "guidance_version": route.guidance_version,
+            "changed": True,
+            "instructions": route.instructions,
+            "waypoints": route.waypoints,
+            "current_step": route.current_step,
+            "distance_remaining": route.distance_remaining,
+            "avoided_alerts": route.avoided_alerts
+        })
     
     raise HTTPException(status_code=404, detail=f"Route {route_id} not found")
 
@@ -152,24 +247,48 @@ async def end_navigation_route(route_id: str):
     Returns:
         Route completion summary
     """
-    for route in active_routes:
-        if route["route_id"] == route_id:
-            route["status"] = "completed"
-            route["completed_at"] = datetime.utcnow()
-            
-            return {
-                "route_id": route_id,
-                "status": "completed",
-                "message": "Route navigation completed",
-                "completed_at": route["completed_at"]
-            }
+    route = await active_routes.fetch(route_id)
+    if route is not None:
+        route.status = "completed"
+        route.completed_at = datetime.utcnow()
+        reroute_service.untrack(route_id)
+        active_routes.save(route_id)
+        
+        return {
+            "route_id": route_id,
+            "status": "completed",
+            "message": "Route navigation completed",
+            "completed_at": route.completed_at
+        }
     
     raise HTTPException(status_code=404, detail=f"Route {route_id} not found")
 
 @router.get("/navigation/active-routes")
-async def get_active_routes():
-    """Get all active navigation routes"""
-    return [route for route in active_routes if route["status"] == "active"]
+async def get_active_routes(
+    request: Request,
+    status: Optional[str] = Query(None, description="Comma-separated statuses, or all (default active)"),
+    session_id: Optional[str] = None,
+    profile: Optional[str] = None,
+    created_from: CreatedFrom = None,
+    created_before: CreatedBefore = None,
+    limit: Limit = PAGE_LIMIT_DEFAULT,
+    cursor: Cursor = None,
+    since: Since = None,
+    fields: Fields = None
+):
+    """
+    List navigation routes, one page at a time
+    
+    Defaults to active routes in creation order. Follow X-Next-Cursor for
+    further pages, then pass X-Sync-Cursor as `since` to fetch only the
+    routes that changed.
+    """
+    where = all_of(
+        status_filter(status, since),
+        matches_any("session_id", session_id),
+        matches_any("profile", profile)
+    )
+    return paginate(request, active_routes, limit, cursor, since, where, created_from, created_before, fields=fields)
 
 @router.post("/navigation/obstacle-alert", status_code=status.HTTP_201_CREATED)
 async def report_obstacle(
@@ -177,53 +296,86 @@ async def report_obstacle(
     severity: str,
     description: str,
     location: Optional[GPSLocation] = None,
-    detected_objects: List[dict] = []
+    detected_objects: List[dict] = [],
+    device_id: Optional[str] = None
 ):
     """
     Report an obstacle or hazard detected on the route
     
+    Reports of the same type near a recently reported alert are merged into
+    it (report_count and confidence go up) instead of creating a new alert;
+    only new alerts and severity escalations trigger reroutes.
+    
     Args:
         alert_type: Type of obstacle (obstacle, hazard, pedestrian, vehicle, etc.)
         severity: Alert severity (low, medium, high, critical)
         description: Detailed description
         location: GPS location of obstacle
         detected_objects: Related detected objects from camera
+        device_id: Reporting device; repeat reports from one device don't raise confidence
     
     Returns:
-        Obstacle alert record
-    """
-    global alert_id_counter
-    
-    alert_id = f"alert_{alert_id_counter}"
-    alert_id_counter += 1
-    
-    alert = {
-        "alert_id": alert_id,
-        "timestamp": datetime.utcnow(),
-        "alert_type": alert_type,
-        "severity": severity,
-        "description": description,
-        "location": location.dict() if location else None,
-        "detected_objects": detected_objects,
-        "status": "active"
-    }
+        The canonical obstacle alert (201 when new, 200 when merged)
+    """
+    alert_id = f"alert_{await storage.next_id('alert')}"
     
-    obstacle_alerts_store.append(alert)
+    report = AlertState(
+        alert_id=alert_id,
+        timestamp=datetime.utcnow(),
+        alert_type=alert_type,
+        severity=severity,
+        description=description,
+        location=GeoPoint.from_model(location) if location else None,
+        detected_objects=detected_objects
+    )
     
-    return alert
+    alert, outcome = alert_clusterer.report(report, device_id)
+    merged = outcome in ("merged", "escalated")
+    
+    # Cached routes passing the obstacle must be recomputed next time
+    if outcome in ("new", "escalated"):
+        routing_service.obstacle_reported(alert.location.latitude, alert.location.longitude)
+    
+    # Only active routes passing the obstacle are recomputed, once per hazard
+    if outcome != "merged":
+        rerouted = reroute_service.handle_alert(alert)
+        if rerouted:
+            alert.rerouted_routes = list(dict.fromkeys(alert.rerouted_routes + rerouted))
+            alert_clusterer.save(alert)
+        for rerouted_id in rerouted:
+            active_routes.save(rerouted_id)
+    
+    return json_response(alert, status_code=status.HTTP_200_OK if merged else status.HTTP_201_CREATED)
 
 @router.get("/navigation/obstacles")
-async def get_active_obstacles():
-    """Get all active obstacle alerts"""
-    return [alert for alert in obstacle_alerts_store if alert["status"] == "active"]
+async def get_active_obstacles(
+    request: Request,
+    status: Optional[str] = Query(None, description="Comma-separated statuses, or all (default active)"),
+    severity: Optional[str] = Query(None, description="Comma-separated severities, e.g. high,critical"),
+    alert_type: Optional[str] = None,
+    created_from: CreatedFrom = None,
+    created_before: CreatedBefore = None,
+    limit: Limit = PAGE_LIMIT_DEFAULT,
+    cursor: Cursor = None,
+    since: Since = None,
+    fields: Fields = None
+):
+    """List obstacle alerts (active by default), paginated like /navigation/active-routes"""
+    where = all_of(
+        status_filter(status, since),
+        matches_any("severity", severity),
+        matches_any("alert_type", alert_type)
+    )
+    return paginate(request, obstacle_alerts_store, limit, cursor, since, where, created_from, created_before, fields=fields)
 
 @router.put("/navigation/obstacle/{alert_id}/resolve")
 async def resolve_obstacle_alert(alert_id: str):
     """Resolve an obstacle alert after it's cleared"""
-    for alert in obstacle_alerts_store:
-        if alert["alert_id"] == alert_id:
-            alert["status"] = "resolved"
-            alert["resolved_at"] = datetime.utcnow()
-            return alert
+    alert = await obstacle_alerts_store.fetch(alert_id)
+    if alert is not None:
+        alert.status = "resolved"
+        alert.resolved_at = datetime.utcnow()
+        alert_clusterer.save(alert)
+        return json_response(alert)
     
     raise HTTPException(status_code=404, detail=f"Alert {alert_id} not found")
@@ -2,129 +2,172 @@
 ESP32-CAM MJPEG Stream Proxy and Frame Processing
 Handles MJPEG stream from ESP32-CAM and provides proxy endpoint
 """
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
-import requests
-import cv2
-import numpy as np
-from typing import AsyncGenerator
+from typing import Annotated, Optional
 import logging
-import os
+
+from app.services.camera_registry import DEFAULT_CAMERA, Camera, UnknownCamera, camera_registry
+from app.services.camera_snapshots import CameraUnavailable
+from app.services.http_cache import make_etag, not_modified, validator_headers
+from app.services.image_variants import MaxWidth, Quality, image_variants
+from app.services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# ESP32-CAM stream URL (configurable via environment variable)
-# Set this after uploading Arduino code and getting the ESP32's IP
-ESP32_CAM_STREAM_URL = os.getenv("ESP32_CAM_URL", "http://192.168.4.1:80/stream")
+# Cameras are ESP32-CAM devices registered through /api/device with a
+# stream_url (or ip) in their metadata, addressed as /cameras/{device_id}/...
+# The endpoints without a device id serve the camera at ESP32_CAM_URL.
+
+MaxAge = Annotated[Optional[float], Query(
+    ge=0, le=60, description="Oldest acceptable frame in seconds (default and minimum SNAPSHOT_MAX_AGE)"
+)]
+
+stream_bytes = metrics.counter("snc_stream_proxied_bytes_total", "MJPEG bytes proxied to clients")
+
+async def _camera(device_id: str) -> Camera:
+    try:
+        return await camera_registry.get(device_id)
+    except UnknownCamera as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+async def _snapshot(request: Request, camera: Camera, max_width: Optional[int],
+                    quality: Optional[int], max_age: Optional[float]) -> Response:
+    """Latest frame of a camera from its snapshot cache, 304 when the client has it"""
+    try:
+        snapshot = await camera.snapshots.get(max_age)
+    except CameraUnavailable as e:
+        logger.error(f"Snapshot from {camera.device_id} failed: {e}")
+        return Response(status_code=504 if e.timeout else 503, content=str(e))
+    
+    etag = make_etag(snapshot.digest, max_width, quality)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    
+    content = await image_variants.get(snapshot.digest, snapshot.data, max_width, quality)
+    headers = validator_headers(etag)
+    headers["Access-Control-Allow-Origin"] = "*"
+    headers["Age"] = str(int(snapshot.age))
+    return Response(content=content, media_type="image/jpeg", headers=headers)
+
+def _mjpeg(camera: Camera) -> StreamingResponse:
+    """A viewer of the camera's shared upstream stream"""
+    async def generate():
+        async for frame in camera.hub.subscribe():
+            part = b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n" % (
+                len(frame), frame
+            )
+            stream_bytes.inc(len(part))
+            yield part
+    
+    return StreamingResponse(
+        generate(),
+        media_type="multipart/x-mixed-replace; boundary=frame"
+    )
+
+def _status(camera: Camera) -> dict:
+    """Camera availability from the background health prober (no network I/O)"""
+    health = camera.health
+    details = health.to_dict()
+    return {
+        "device_id": camera.device_id,
+        "status": health.state,
+        "stream_url": camera.stream_url,
+        "accessible": health.online,
+        "last_seen": details["last_seen"],
+        "seconds_since_seen": details["seconds_since_seen"],
+        "rtt_ms": details["rtt_ms"],
+        "consecutive_failures": details["consecutive_failures"],
+        "error": health.last_error,
+        "viewers": camera.hub.viewers
+    }
+
+async def _trigger(camera: Camera):
+    logger.info(f"Triggering capture at {camera.trigger_url}")
+    try:
+        return await camera.trigger_capture()
+    except CameraUnavailable as e:
+        logger.error(f"Error triggering capture on {camera.device_id}: {e}")
+        return Response(status_code=504 if e.timeout else 502, content=str(e))
+
+@router.get("/cameras")
+async def list_cameras():
+    """Cameras served by this node with their health, stream, snapshot and inference budget"""
+    return camera_registry.stats()
 
 @router.get("/snapshot")
-async def proxy_snapshot():
+async def proxy_snapshot(request: Request, max_width: MaxWidth = None, quality: Quality = None,
+                         max_age: MaxAge = None):
     """
-    Proxy single JPEG snapshot from ESP32-CAM to frontend
+    Latest JPEG snapshot from ESP32-CAM
     Much more reliable than continuous MJPEG stream
+    
+    Served from the snapshot cache: concurrent requests share one upstream
+    fetch and the camera is polled at a fixed rate, whatever the number of
+    viewers. Optionally downscaled/re-encoded (max_width, quality); answers
+    304 when the frame is the one the client already has.
     """
-    try:
-        # Request single frame from ESP32-CAM
-        snapshot_url = ESP32_CAM_STREAM_URL.replace('/stream', '/capture.jpg')
-        logger.info(f"Fetching snapshot from {snapshot_url}")
-        response = requests.get(snapshot_url, timeout=10)  # Increased timeout
-        
-        if response.status_code == 200:
-            logger.info("Snapshot fetched successfully")
-            return Response(
-                content=response.content,
-                media_type="image/jpeg",
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "no-cache, no-store, must-revalidate"
-                }
-            )
-        else:
-            logger.error(f"ESP32-CAM returned status {response.status_code}")
-            return Response(status_code=503, content="Camera unavailable")
-            
-    except requests.exceptions.Timeout:
-        logger.error(f"Timeout fetching snapshot from ESP32-CAM at {snapshot_url}")
-        return Response(status_code=504, content="Camera timeout")
-    except requests.exceptions.ConnectionError as e:
-        logger.error(f"Connection error to ESP32-CAM: {e}")
-        return Response(status_code=503, content="Cannot connect to camera")
-    except Exception as e:
-        logger.error(f"Snapshot error: {e}")
-        return Response(status_code=500, content=f"Error: {str(e)}")
+    return await _snapshot(request, await _camera(DEFAULT_CAMERA), max_width, quality, max_age)
+
+@router.get("/cameras/{device_id}/snapshot")
+async def proxy_device_snapshot(device_id: str, request: Request, max_width: MaxWidth = None,
+                                quality: Quality = None, max_age: MaxAge = None):
+    """Latest JPEG snapshot from a registered camera (see /snapshot)"""
+    return await _snapshot(request, await _camera(device_id), max_width, quality, max_age)
+
+@router.get("/snapshot/stats")
+async def get_snapshot_stats():
+    """Snapshot cache state (frame age, source, fetcher, last error)"""
+    return (await _camera(DEFAULT_CAMERA)).snapshots.stats()
+
+@router.get("/cameras/{device_id}/snapshot/stats")
+async def get_device_snapshot_stats(device_id: str):
+    """Snapshot cache state of a registered camera (see /snapshot/stats)"""
+    return (await _camera(device_id)).snapshots.stats()
 
 @router.get("/mjpeg")
 async def proxy_mjpeg_stream():
     """
     Proxy MJPEG stream from ESP32-CAM to frontend
     This allows frontend to access the stream without CORS issues
-    """
-    async def generate():
-        try:
-            logger.info(f"Connecting to ESP32-CAM stream at {ESP32_CAM_STREAM_URL}")
-            response = requests.get(ESP32_CAM_STREAM_URL, stream=True, timeout=10)
-            
-            if response.status_code != 200:
-                logger.error(f"ESP32-CAM returned status {response.status_code}")
-                return
-            
-            logger.info("Stream connected, proxying data...")
-            
-            for chunk in response.iter_content(chunk_size=4096):
-                if chunk:
-                    yield chunk
-                    
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error: {e}")
-        except requests.exceptions.Timeout as e:
-            logger.error(f"Timeout error: {e}")
-        except Exception as e:
-            logger.error(f"Stream error: {e}")
     
-    return StreamingResponse(
-        generate(),
-        media_type="multipart/x-mixed-replace; boundary=frame"
-    )
+    All viewers share one connection to the camera, and frames passing
+    through also refresh the snapshot cache.
+    """
+    return _mjpeg(await _camera(DEFAULT_CAMERA))
+
+@router.get("/cameras/{device_id}/mjpeg")
+async def proxy_device_mjpeg_stream(device_id: str):
+    """MJPEG stream of a registered camera (see /mjpeg)"""
+    return _mjpeg(await _camera(device_id))
 
 @router.get("/status")
 async def get_stream_status():
-    """Check if ESP32-CAM stream is available"""
-    try:
-        response = requests.get(ESP32_CAM_STREAM_URL, timeout=2)
-        return {
-            "status": "online",
-            "stream_url": ESP32_CAM_STREAM_URL,
-            "accessible": response.status_code == 200
-        }
-    except Exception as e:
-        return {
-            "status": "offline",
-            "stream_url": ESP32_CAM_STREAM_URL,
-            "accessible": False,
-            "error": str(e)
-        }
+    """
+    Check if ESP32-CAM stream is available
+    
+    Answered from the background health prober's last /status probe; the
+    camera itself is never contacted by this request.
+    """
+    return _status(await _camera(DEFAULT_CAMERA))
+
+@router.get("/cameras/{device_id}/status")
+async def get_device_stream_status(device_id: str):
+    """Availability of a registered camera (see /status)"""
+    return _status(await _camera(device_id))
 
 @router.post("/trigger-capture")
 async def trigger_capture():
     """Trigger ESP32-CAM to capture an image via software button"""
-    try:
-        import requests
-        
-        trigger_url = ESP32_CAM_STREAM_URL.replace('/stream', '/trigger-capture')
-        logger.info(f"Triggering capture at {trigger_url}")
-        response = requests.post(trigger_url, timeout=5)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"ESP32 returned status {response.status_code}")
-            return Response(status_code=response.status_code, content="Trigger failed")
-    
-    except Exception as e:
-        logger.error(f"Error triggering capture: {e}")
-        return Response(status_code=500, content=str(e))
+    return await _trigger(await _camera(DEFAULT_CAMERA))
+
+@router.post("/cameras/{device_id}/trigger-capture")
+async def trigger_device_capture(device_id: str):
+    """Trigger a registered camera to capture an image"""
+    return await _trigger(await _camera(device_id))
 
 @router.post("/process-frame")
 async def process_frame_backend(frame_data: dict):
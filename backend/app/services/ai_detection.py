@@ -2,22 +2,115 @@
 AI Object Detection Service using YOLOv5
 Processes images and generates audio descriptions
 """
-import cv2
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 import logging
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
+import threading
+import time
+
+from app.config import settings
+from app.services.metrics import StageTimings, metrics
+from app.services.tiling import TiledInference
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_INPUT_SIZE = 640  # YOLOv5 AutoShape's default inference size
+
+
+def _round_up(value: int, multiple: int) -> int:
+    return -(-value // multiple) * multiple
+
+
+def roi_box(image_size: Tuple[int, int], roi: Sequence[float]) -> Tuple[int, int, int, int]:
+    """Pixel box (left, top, right, bottom) of a region given as frame fractions"""
+    width, height = image_size
+    x0, y0, x1, y1 = roi
+    return (int(x0 * width), int(y0 * height), max(int(x1 * width), 1), max(int(y1 * height), 1))
+
+
+def class_ids(names, classes: Iterable[str]) -> List[int]:
+    """Model class indices of class names (unknown names are ignored)"""
+    wanted = set(classes)
+    items = names.items() if isinstance(names, dict) else enumerate(names)
+    return [index for index, name in items if name in wanted]
+
+
+class _ClassFilter:
+    """
+    Sets `classes` on the shared models for the requests running on them
+
+    YOLOv5's AutoShape reads its class filter from the model object, so
+    concurrent requests must agree on it: requests with the same filter
+    (the common case, one detection mode) run together, and one with a
+    different filter waits until those in flight finish.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._current: Optional[Tuple[int, ...]] = None
+        self._active = 0
+        self._models = {}  # id -> model whose filter is set
+
+    def acquire(self, model, ids: Optional[Tuple[int, ...]]):
+        with self._condition:
+            while self._active and self._current != ids:
+                self._condition.wait()
+            self._current = ids
+            self._active += 1
+            model.classes = list(ids) if ids is not None else None
+            self._models[id(model)] = model
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            if not self._active:
+                for model in self._models.values():
+                    model.classes = None
+                self._models.clear()
+                self._condition.notify_all()
+
+
+def mode_options(mode: str) -> Dict:
+    """
+    Detection options of a detection mode
+
+    full: every class on the whole frame. hazards: only HAZARD_CLASSES.
+    navigation: HAZARD_CLASSES inside the WALKING_CORRIDOR region.
+    """
+    if mode == "hazards":
+        return {"classes": settings.hazard_classes}
+    if mode == "navigation":
+        return {"classes": settings.hazard_classes, "roi": tuple(settings.walking_corridor)}
+    return {}
+
+
 class AIDetectionService:
     def __init__(self):
         self.model = None
         self.model_loaded = False
+        self.model_load_seconds = None
+        self.model_repo = settings.yolov5_repo
+        self.model_weights = settings.model_weights
+        # Lighter variant used when quality is degraded under load; loaded in
+        # the background the first time it is asked for
+        self.light_model = None
+        self.light_model_weights = settings.light_model_weights
+        self._light_loading = False
+        self._class_filter = _ClassFilter()
+        self._unknown_classes_warned = set()
+        self.tiler = TiledInference(
+            tile_size=settings.tile_size,
+            overlap=settings.tile_overlap,
+            min_texture=settings.tile_min_texture,
+            change_threshold=settings.tile_change_threshold,
+            max_reuse=settings.tile_max_reuse,
+            merge_threshold=settings.tile_merge_threshold
+        )
+        # Created on first write so importing the service has no side effects
         self.output_dir = Path("detected_outputs")
-        self.output_dir.mkdir(exist_ok=True)
         
     def load_model(self):
         """Load YOLOv5 model"""
@@ -25,26 +118,56 @@ class AIDetectionService:
             return
         
         try:
-            import torch
             logger.info("Loading YOLOv5 model...")
+            started = time.perf_counter()
             
-            # Load YOLOv5 model
-            self.model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True)
-            self.model.conf = 0.25  # Confidence threshold
-            self.model.iou = 0.45   # NMS IOU threshold
+            self.model = self._load(self.model_weights, 'yolov5s')
             
             self.model_loaded = True
-            logger.info("✅ YOLOv5 model loaded successfully")
+            self.model_load_seconds = time.perf_counter() - started
+            logger.info(f"✅ YOLOv5 model loaded successfully in {self.model_load_seconds:.1f}s")
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             raise
     
-    def process_image(self, image_bytes: bytes) -> Dict:
+    def _load(self, weights: Optional[str], pretrained: str):
+        """Load a YOLOv5 model, offline when a local repo checkout is configured"""
+        import torch
+        
+        repo = self.model_repo or 'ultralytics/yolov5'
+        source = 'local' if self.model_repo else 'github'
+        if weights:
+            model = torch.hub.load(repo, 'custom', path=weights, source=source)
+        else:
+            model = torch.hub.load(repo, pretrained, pretrained=True, source=source)
+        model.conf = 0.25  # Confidence threshold
+        model.iou = 0.45   # NMS IOU threshold
+        return model
+    
+    def _load_light_model(self):
+        try:
+            started = time.perf_counter()
+            self.light_model = self._load(self.light_model_weights, 'yolov5n')
+            logger.info(f"Light model loaded in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Error loading light model: {e}")
+    
+    def _model_for(self, light: bool):
+        """The light model when asked for and loaded, else the full model"""
+        if not light:
+            return self.model
+        if self.light_model is None and not self._light_loading:
+            self._light_loading = True
+            threading.Thread(target=self._load_light_model, name="snc-light-model", daemon=True).start()
+        return self.light_model or self.model
+    
+    def process_image(self, image_bytes: bytes, options: Optional[Dict] = None) -> Dict:
         """
         Process image with AI detection
         
         Args:
             image_bytes: Raw image bytes
+            options: Quality options (input_size, light_model, annotate, speak)
             
         Returns:
             Dict containing detections, description, image_url, and audio_url
@@ -54,62 +177,180 @@ class AIDetectionService:
             if not self.model_loaded:
                 self.load_model()
             
-            # Convert bytes to PIL Image
-            image = Image.open(BytesIO(image_bytes))
+            timings = metrics.timings()
             
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            with timings.stage("decode"):
+                # Convert bytes to PIL Image
+                image = Image.open(BytesIO(image_bytes))
+                image.load()
+                
+                # Convert to RGB if needed
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
             
-            # Run detection
-            logger.info("Running object detection...")
-            results = self.model(image)
+            return self._detect(image, timings, options or {})
             
-            # Extract detections
-            detections = []
-            for pred in results.xyxy[0]:  # xyxy format: [x1, y1, x2, y2, conf, class]
-                x1, y1, x2, y2, conf, cls = pred.tolist()
-                
-                # Convert to [x, y, width, height]
-                x, y = int(x1), int(y1)
-                w, h = int(x2 - x1), int(y2 - y1)
-                
-                class_name = self.model.names[int(cls)]
-                confidence = float(conf)
-                
-                detections.append({
-                    'class': class_name,
-                    'confidence': confidence,
-                    'bbox': [x, y, w, h]
-                })
+        except Exception as e:
+            logger.error(f"Error processing image: {e}")
+            raise
+    
+    def process_frame(self, frame: np.ndarray, options: Optional[Dict] = None) -> Dict:
+        """
+        Process an already decoded frame with AI detection
+        
+        Args:
+            frame: RGB frame as a HxWx3 uint8 array
+            options: Quality options (input_size, light_model, annotate, speak)
             
-            logger.info(f"Found {len(detections)} objects")
+        Returns:
+            Dict containing detections, description, image_url, and audio_url
+        """
+        try:
+            if not self.model_loaded:
+                self.load_model()
             
-            # Draw bounding boxes on image
-            output_image = self.draw_bounding_boxes(image, detections)
+            return self._detect(Image.fromarray(frame), metrics.timings(), options or {})
             
-            # Save detected image
-            image_path = self.output_dir / "detected_image.jpg"
-            output_image.save(image_path)
+        except Exception as e:
+            logger.error(f"Error processing frame: {e}")
+            raise
+    
+    def _class_ids(self, model, classes: Optional[Iterable[str]]) -> Optional[Tuple[int, ...]]:
+        """Class filter for the model, None (every class) when no name matches"""
+        if not classes:
+            return None
+        ids = class_ids(model.names, classes)
+        if not ids:
+            key = tuple(sorted(classes))
+            if key not in self._unknown_classes_warned:
+                self._unknown_classes_warned.add(key)
+                logger.warning(f"None of the classes {list(key)} are known to the model; detecting every class")
+            return None
+        return tuple(ids)
+    
+    def _detect(self, image: Image.Image, timings: StageTimings, options: Dict) -> Dict:
+        """
+        Run detection, annotation and speech on an RGB image
+        
+        Options (all optional): input_size (model resolution), light_model,
+        annotate (draw and save the boxed image), speak (TTS audio), classes
+        (class names to keep, filtered before NMS) and roi (x0, y0, x1, y1
+        fractions of the frame; only that region is run through the model),
+        tiled (detect on full-resolution tiles when the frame is larger than
+        TILE_SIZE) and tile_key (source of the frame, for tile change skipping).
+        """
+        model = self._model_for(options.get("light_model", False))
+        size = options.get("input_size")
+        
+        roi = options.get("roi")
+        offset_x = offset_y = 0
+        model_image = image
+        if roi is not None:
+            with timings.stage("roi_crop"):
+                box = roi_box(image.size, roi)
+                offset_x, offset_y = box[0], box[1]
+                model_image = image.crop(box)
+            # The model letterboxes to `size`; never upscale the crop past its own size
+            size = min(size or DEFAULT_INPUT_SIZE, _round_up(max(model_image.size), 32))
+        
+        # Run detection
+        logger.info("Running object detection...")
+        ids = self._class_ids(model, options.get("classes"))
+        tiled = options.get("tiled", False) and self.tiler.applies(model_image)
+        tiles = None
+        started = time.perf_counter()
+        self._class_filter.acquire(model, ids)
+        try:
+            if tiled:
+                # Tiles cached under other settings (mode, quality level) must not come back
+                context = (id(model), options.get("input_size"), ids, roi)
+                rows, split, tiles = self.tiler.run(model, model_image, options.get("input_size"),
+                                                    options.get("tile_key"), context)
+            else:
+                results = model(model_image, size=size) if size else model(model_image)
+                rows = [pred.tolist() for pred in results.xyxy[0]]
+                # YOLOv5 reports its own preprocess / inference / NMS split in ms
+                split = getattr(results, "t", None)
+        finally:
+            self._class_filter.release()
+        model_seconds = time.perf_counter() - started
+        
+        nms_seconds = 0.0
+        if split and len(split) == 3:
+            timings.add("preprocess", split[0] / 1000)
+            timings.add("inference", split[1] / 1000)
+            nms_seconds = split[2] / 1000
+        else:
+            timings.add("inference", model_seconds)
+        
+        started = time.perf_counter()
+        
+        # Extract detections
+        detections = []
+        for x1, y1, x2, y2, conf, cls in rows:  # xyxy format: [x1, y1, x2, y2, conf, class]
             
-            # Generate text description
-            description = self.generate_description(detections)
+            # Convert to [x, y, width, height] in frame coordinates
+            x, y = int(x1) + offset_x, int(y1) + offset_y
+            w, h = int(x2 - x1), int(y2 - y1)
             
-            # Generate audio
-            audio_path = self.output_dir / "detected_audio.mp3"
-            self.text_to_speech(description, audio_path)
+            class_name = model.names[int(cls)]
+            confidence = float(conf)
             
-            return {
-                "detections": detections,
-                "description": description,
-                "image_url": "/api/ai/detected_image.jpg",
-                "audio_url": "/api/ai/detected_audio.mp3",
-                "count": len(detections)
-            }
+            detections.append({
+                'class': class_name,
+                'confidence': confidence,
+                'bbox': [x, y, w, h]
+            })
+        
+        timings.add("postprocess", nms_seconds + time.perf_counter() - started)
+        
+        logger.info(f"Found {len(detections)} objects")
+        
+        image_url = audio_url = None
+        if options.get("annotate", True):
+            # Draw bounding boxes on image
+            with timings.stage("draw"):
+                output_image = self.draw_bounding_boxes(image, detections)
             
-        except Exception as e:
-            logger.error(f"Error processing image: {e}")
-            raise
+            # Save detected image
+            with timings.stage("jpeg_encode"):
+                buffer = BytesIO()
+                output_image.save(buffer, format="JPEG")
+            with timings.stage("disk_write"):
+                self.output_dir.mkdir(exist_ok=True)
+                image_path = self.output_dir / "detected_image.jpg"
+                image_path.write_bytes(buffer.getvalue())
+            image_url = "/api/ai/detected_image.jpg"
+        
+        # Generate text description
+        description = self.generate_description(detections)
+        
+        # Generate audio
+        if options.get("speak", True):
+            with timings.stage("tts"):
+                self.output_dir.mkdir(exist_ok=True)
+                audio_path = self.output_dir / "detected_audio.mp3"
+                self.text_to_speech(description, audio_path)
+            audio_url = "/api/ai/detected_audio.mp3"
+        
+        processing_time_ms = timings.total_ms()
+        metrics.record_stage("total", processing_time_ms / 1000)
+        
+        result = {
+            "detections": detections,
+            "description": description,
+            "image_url": image_url,
+            "audio_url": audio_url,
+            "count": len(detections),
+            "frame_size": {"width": image.width, "height": image.height},
+            "processing_time_ms": round(processing_time_ms, 3),
+            "timings_ms": timings.as_ms()
+        }
+        if roi is not None:
+            result["roi"] = [offset_x, offset_y, model_image.width, model_image.height]
+        if tiles is not None:
+            result["tiles"] = tiles
+        return result
     
     def draw_bounding_boxes(self, image: Image.Image, detections: List[Dict]) -> Image.Image:
         """Draw bounding boxes and labels on image"""
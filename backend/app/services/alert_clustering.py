@@ -0,0 +1,239 @@
+"""
+Obstacle alert clustering
+Folds crowd reports of the same hazard into one canonical alert on ingest,
+so ten canes passing the same scaffolding make one alert with ten reports
+instead of ten alerts to list, announce and reroute around
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+import time
+
+from app.services.geo import geohash_bbox, geohash_encode, geohash_neighbors, haversine_m
+from app.services.metrics import metrics
+from app.services.records import AlertState, GeoPoint
+from app.services.storage import Collection
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_ORDER = ("low", "medium", "high", "critical")
+# Reporters remembered per alert, for counting distinct reporters
+MAX_REPORTERS = 32
+
+alert_reports = metrics.counter(
+    "snc_alert_reports_total", "Obstacle reports by outcome (new alert, merged, unlocated)", ("outcome",)
+)
+
+
+def severity_rank(severity: Optional[str]) -> int:
+    return SEVERITY_ORDER.index(severity) if severity in SEVERITY_ORDER else -1
+
+
+def bucket_precision(radius_m: float) -> int:
+    """Finest geohash precision whose cells are at least radius_m on each side (at the equator)"""
+    precision = 1
+    for candidate in range(2, 10):
+        min_lat, min_lon, max_lat, max_lon = geohash_bbox(geohash_encode(0.0, 0.0, candidate))
+        if min(max_lat - min_lat, max_lon - min_lon) * 111320.0 < radius_m:
+            break
+        precision = candidate
+    return precision
+
+
+class AlertClusterer:
+    """
+    Incremental DBSCAN-style clustering of obstacle reports
+
+    Active alerts are bucketed by geohash cells at least `radius_m` wide,
+    so everything within the radius of a report is in its own or the eight
+    neighbouring cells. A report joins the nearest active alert of the same type whose
+    centroid is within `radius_m` and that was last reported within `window`
+    seconds; otherwise it starts a new alert. Alerts it also reaches are
+    merged into the one it joins, as DBSCAN chains density-connected points.
+    Each report touches a constant number of buckets holding only live
+    alerts, so ingest is O(1) amortized. Alerts the clusterer handed out are
+    persisted through save() so the index stays in step with the store;
+    only changes from elsewhere (other workers) rebuild it, and a rebuild
+    walks just the alerts changed within `window`.
+
+    Confidence is the probability that at least one report is right,
+    1 - prod(1 - reliability), counting repeat reports from the same device
+    once.
+    """
+
+    def __init__(self, store: Collection, radius_m: float = 25.0, window: float = 1800.0,
+                 reliability: float = 0.5):
+        self.store = store
+        self.radius_m = radius_m
+        self.window = window
+        self.reliability = reliability
+        self.precision = bucket_precision(radius_m)
+        self._buckets: Dict[str, Set[str]] = {}
+        self._bucket_of: Dict[str, str] = {}
+        self._indexed_version: Optional[str] = None
+
+    def _bucket(self, latitude: float, longitude: float) -> str:
+        return geohash_encode(latitude, longitude, self.precision)
+
+    def _index(self):
+        """Bucket index of live alerts, rebuilt when the collection changed under us"""
+        if self._indexed_version == self.store.version:
+            return
+        self._buckets, self._bucket_of = {}, {}
+        now = time.time()
+        # Live alerts were reported, hence saved, within the window: only
+        # the tail of the collection's change index can hold them
+        recent, _, _ = self.store.changes((now - self.window, ""), limit=len(self.store))
+        for alert in recent:
+            if self._live(alert, now):
+                self._add(alert)
+        self._indexed_version = self.store.version
+
+    def _live(self, alert: AlertState, now: float) -> bool:
+        return (
+            alert.status == "active" and alert.location is not None
+            and now - (alert.last_reported or 0.0) <= self.window
+        )
+
+    def _add(self, alert: AlertState):
+        bucket = self._bucket(alert.location.latitude, alert.location.longitude)
+        self._buckets.setdefault(bucket, set()).add(alert.alert_id)
+        self._bucket_of[alert.alert_id] = bucket
+
+    def _remove(self, alert_id: str):
+        bucket = self._bucket_of.pop(alert_id, None)
+        if bucket is not None:
+            ids = self._buckets.get(bucket)
+            ids.discard(alert_id)
+            if not ids:
+                del self._buckets[bucket]
+
+    def _put(self, alert: AlertState):
+        in_sync = self._indexed_version == self.store.version
+        self.store.put(alert.alert_id, alert)
+        if in_sync:
+            self._indexed_version = self.store.version
+
+    def candidates(self, alert_type: str, location: GeoPoint) -> List[Tuple[float, AlertState]]:
+        """Live alerts of this type within the radius, nearest first"""
+        self._index()
+        now = time.time()
+        found = []
+        for bucket in geohash_neighbors(self._bucket(location.latitude, location.longitude)):
+            for alert_id in list(self._buckets.get(bucket, ())):
+                alert = self.store.get(alert_id)
+                if alert is None or not self._live(alert, now):
+                    # Expired or resolved since it was indexed
+                    self._remove(alert_id)
+                    continue
+                if alert.alert_type != alert_type:
+                    continue
+                distance = haversine_m(
+                    location.latitude, location.longitude, alert.location.latitude, alert.location.longitude
+                )
+                if distance <= self.radius_m:
+                    found.append((distance, alert))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def report(self, alert: AlertState, device_id: Optional[str] = None,
+               reliability: Optional[float] = None) -> Tuple[AlertState, str]:
+        """
+        Ingest a new report, given as a fresh AlertState
+
+        Args:
+            alert: The report as an alert record (alert_id already assigned)
+            device_id: Reporting device, so repeat reports aren't counted as corroboration
+            reliability: Chance this report is right (default: the clusterer's)
+
+        Returns:
+            The canonical alert and the outcome: "new", "unlocated" (a new
+            alert without a location), "merged" or "escalated" (merged and
+            raised the alert's severity)
+        """
+        reliability = self.reliability if reliability is None else reliability
+        now = time.time()
+        alert.report_count = 1
+        alert.reporters = [device_id] if device_id else []
+        alert.confidence = round(reliability, 4)
+        alert.last_reported = now
+
+        if alert.location is None:
+            # Nothing to cluster on
+            self._put(alert)
+            alert_reports.inc(1, "unlocated")
+            return alert, "unlocated"
+
+        matches = self.candidates(alert.alert_type, alert.location)
+        if not matches:
+            self._put(alert)
+            self._add(alert)
+            alert_reports.inc(1, "new")
+            return alert, "new"
+
+        canonical = matches[0][1]
+        severity = canonical.severity
+        self._absorb(canonical, alert, device_id, reliability)
+        for _, other in matches[1:]:
+            # The report connects them: one hazard
+            self._merge(canonical, other)
+        canonical.last_reported = now
+        self._remove(canonical.alert_id)
+        self._add(canonical)
+        self._put(canonical)
+        alert_reports.inc(1, "merged")
+        return canonical, "escalated" if severity_rank(canonical.severity) > severity_rank(severity) else "merged"
+
+    def _absorb(self, canonical: AlertState, report: AlertState, device_id: Optional[str], reliability: float):
+        count = canonical.report_count or 1
+        location = canonical.location
+        canonical.location = GeoPoint(
+            latitude=(location.latitude * count + report.location.latitude) / (count + 1),
+            longitude=(location.longitude * count + report.location.longitude) / (count + 1)
+        )
+        canonical.report_count = count + 1
+        if severity_rank(report.severity) > severity_rank(canonical.severity):
+            canonical.severity = report.severity
+            canonical.description = report.description
+        canonical.detected_objects = (canonical.detected_objects + report.detected_objects)[-20:]
+        if device_id is None or device_id not in canonical.reporters:
+            canonical.confidence = round(1 - (1 - (canonical.confidence or 0.0)) * (1 - reliability), 4)
+            if device_id is not None:
+                canonical.reporters = (canonical.reporters + [device_id])[-MAX_REPORTERS:]
+
+    def _merge(self, canonical: AlertState, other: AlertState):
+        count, other_count = canonical.report_count or 1, other.report_count or 1
+        canonical.location = GeoPoint(
+            latitude=(canonical.location.latitude * count + other.location.latitude * other_count) / (count + other_count),
+            longitude=(canonical.location.longitude * count + other.location.longitude * other_count) / (count + other_count)
+        )
+        canonical.report_count = count + other_count
+        if severity_rank(other.severity) > severity_rank(canonical.severity):
+            canonical.severity = other.severity
+            canonical.description = other.description
+        canonical.confidence = round(1 - (1 - (canonical.confidence or 0.0)) * (1 - (other.confidence or 0.0)), 4)
+        canonical.reporters = list(dict.fromkeys(canonical.reporters + other.reporters))[-MAX_REPORTERS:]
+        canonical.rerouted_routes = list(dict.fromkeys(canonical.rerouted_routes + other.rerouted_routes))
+
+        other.status = "merged"
+        other.merged_into = canonical.alert_id
+        other.resolved_at = datetime.utcnow()
+        self._remove(other.alert_id)
+        self._put(other)
+        logger.info(f"Alert {other.alert_id} merged into {canonical.alert_id}")
+
+    def save(self, alert: AlertState):
+        """Persist changes made to an alert after report() (reroutes, resolution)"""
+        if alert.status != "active":
+            self._remove(alert.alert_id)
+        self._put(alert)
+
+    def stats(self) -> Dict:
+        self._index()
+        return {
+            "live_alerts": len(self._bucket_of),
+            "buckets": len(self._buckets),
+            "precision": self.precision,
+            "radius_m": self.radius_m,
+            "window_s": self.window
+        }
@@ -0,0 +1,214 @@
+"""
+Camera health prober
+Polls each ESP32-CAM's lightweight /status JSON endpoint in the background
+and keeps the result, so status checks never open the camera's single-client
+MJPEG stream and never wait on the network
+"""
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "unknown"
+ONLINE = "online"
+OFFLINE = "offline"
+
+RTT_WINDOW = 20  # probes averaged into the rolling round-trip time
+
+probes = metrics.counter("snc_camera_probes_total", "Camera /status probes by outcome", ("outcome",))
+
+
+class CameraHealth:
+    """Cached health of one camera"""
+
+    __slots__ = (
+        "status_url", "client", "state", "last_seen", "last_probe", "failures",
+        "next_probe", "last_error", "info", "rtts"
+    )
+
+    def __init__(self, status_url: str, client: httpx.AsyncClient):
+        self.status_url = status_url
+        self.client = client
+        self.state = UNKNOWN
+        self.last_seen: Optional[float] = None  # time.time() of the last successful probe
+        self.last_probe: Optional[float] = None
+        self.failures = 0  # consecutive failed probes
+        self.next_probe = 0.0  # time.monotonic() the next probe is due
+        self.last_error: Optional[str] = None
+        self.info: Dict = {}  # body of the last /status response
+        self.rtts: Deque[float] = deque(maxlen=RTT_WINDOW)
+
+    @property
+    def online(self) -> bool:
+        return self.state == ONLINE
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """Rolling mean round-trip time in seconds"""
+        return sum(self.rtts) / len(self.rtts) if self.rtts else None
+
+    def to_dict(self) -> Dict:
+        rtt = self.rtt
+        return {
+            "status_url": self.status_url,
+            "state": self.state,
+            "last_seen": datetime.fromtimestamp(self.last_seen).isoformat() if self.last_seen else None,
+            "seconds_since_seen": round(time.time() - self.last_seen, 1) if self.last_seen else None,
+            "rtt_ms": round(rtt * 1000, 1) if rtt is not None else None,
+            "rtt_last_ms": round(self.rtts[-1] * 1000, 1) if self.rtts else None,
+            "consecutive_failures": self.failures,
+            "next_probe_in": round(max(self.next_probe - time.monotonic(), 0.0), 1),
+            "last_error": self.last_error,
+            "info": self.info
+        }
+
+
+class CameraHealthProber:
+    """
+    Probes cameras on a schedule
+
+    Healthy cameras are probed every `interval` seconds. After a failure the
+    delay doubles per consecutive failure up to `max_backoff`, with jitter,
+    so dead cameras cost almost nothing. A camera goes offline after
+    `offline_after` consecutive failures and back online on the first success.
+    """
+
+    def __init__(self, interval: float = 5.0, timeout: float = 2.0, max_backoff: float = 60.0,
+                 offline_after: int = 2):
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.offline_after = offline_after
+        self._cameras: Dict[str, CameraHealth] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def watch(self, status_url: str, client: httpx.AsyncClient) -> CameraHealth:
+        """Start probing a camera through its client (first probe is immediate)"""
+        health = self._cameras.get(status_url)
+        if health is None:
+            health = self._cameras[status_url] = CameraHealth(status_url, client)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return health
+
+    def unwatch(self, status_url: str):
+        self._cameras.pop(status_url, None)
+
+    def get(self, status_url: str) -> Optional[CameraHealth]:
+        return self._cameras.get(status_url)
+
+    def cameras(self) -> List[CameraHealth]:
+        return list(self._cameras.values())
+
+    def start(self):
+        """Start the background prober on the running event loop"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background prober"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            due = [health for health in self._cameras.values() if health.next_probe <= now]
+            if due:
+                await asyncio.gather(*(self.probe(health) for health in due))
+
+            pending = [health.next_probe for health in self._cameras.values()]
+            delay = min(pending) - time.monotonic() if pending else self.interval
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(delay, 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+    async def probe(self, health: CameraHealth):
+        """Probe one camera now and schedule its next probe"""
+        started = time.perf_counter()
+        try:
+            response = await health.client.get(health.status_url, timeout=self.timeout)
+            if response.status_code != 200:
+                raise httpx.HTTPStatusError(
+                    f"HTTP {response.status_code}", request=response.request, response=response
+                )
+            rtt = time.perf_counter() - started
+            try:
+                info = response.json()
+            except ValueError:
+                info = {}
+        except httpx.HTTPError as e:
+            self._failed(health, "timeout" if isinstance(e, httpx.TimeoutException) else str(e) or type(e).__name__)
+            return
+        except Exception as e:
+            logger.error(f"Probing {health.status_url} failed: {e}")
+            self._failed(health, str(e))
+            return
+
+        probes.inc(1, "ok")
+        if health.state != ONLINE:
+            logger.info(f"Camera {health.status_url} is online")
+        health.state = ONLINE
+        health.failures = 0
+        health.last_error = None
+        health.info = info if isinstance(info, dict) else {}
+        health.rtts.append(rtt)
+        health.last_seen = health.last_probe = time.time()
+        # Jittered so cameras watched together don't stay probed in lockstep
+        health.next_probe = time.monotonic() + self.interval * random.uniform(0.9, 1.1)
+
+    def _failed(self, health: CameraHealth, error: str):
+        probes.inc(1, "timeout" if error == "timeout" else "error")
+        health.failures += 1
+        health.last_error = error
+        health.last_probe = time.time()
+        if health.failures >= self.offline_after and health.state != OFFLINE:
+            logger.warning(f"Camera {health.status_url} is offline ({error})")
+            health.state = OFFLINE
+        backoff = min(self.interval * 2 ** (health.failures - 1), self.max_backoff)
+        health.next_probe = time.monotonic() + backoff * random.uniform(0.8, 1.2)
+
+    def state_counts(self) -> Dict[tuple, float]:
+        counts = {(UNKNOWN,): 0.0, (ONLINE,): 0.0, (OFFLINE,): 0.0}
+        for health in self._cameras.values():
+            counts[(health.state,)] += 1
+        return counts
+
+    def rtt_by_camera(self) -> Dict[tuple, float]:
+        return {
+            (health.status_url,): health.rtt
+            for health in self._cameras.values() if health.rtt is not None
+        }
+
+
+# Global instance
+camera_health = CameraHealthProber(
+    interval=settings.camera_probe_interval,
+    timeout=settings.camera_probe_timeout,
+    max_backoff=settings.camera_probe_max_backoff
+)
+
+metrics.gauge("snc_cameras", "Watched cameras by health state", camera_health.state_counts, ("state",))
+metrics.gauge(
+    "snc_camera_rtt_seconds", "Rolling mean /status round-trip time per camera",
+    camera_health.rtt_by_camera, ("camera",)
+)
@@ -0,0 +1,416 @@
+"""
+Camera registry
+One Camera per ESP32-CAM device registered through /api/device, each with its
+own HTTP connection pool, snapshot cache, MJPEG stream hub, health state and
+inference budget. Everything runs as asyncio tasks on the event loop, so a
+node can serve hundreds of cameras without a thread per camera.
+"""
+from typing import AsyncIterator, Dict, List, Optional, Set
+import asyncio
+import logging
+import time
+
+import httpx
+
+from app.config import settings
+from app.services.camera_health import CameraHealth, CameraHealthProber, camera_health
+from app.services.camera_snapshots import CameraUnavailable, JpegSplitter, SnapshotCache
+from app.services.metrics import metrics
+from app.services.records import DeviceState
+from app.services.storage import Collection, storage
+
+logger = logging.getLogger(__name__)
+
+CAMERA_DEVICE_TYPE = "esp32cam"
+# Camera configured through ESP32_CAM_URL, addressed by the legacy endpoints;
+# the same id the upload endpoints default to
+DEFAULT_CAMERA = "esp32_cam_default"
+
+stream_frames = metrics.counter(
+    "snc_stream_frames_total", "MJPEG frames read from cameras and frames dropped for slow viewers",
+    ("outcome",)
+)
+inference_requests = metrics.counter(
+    "snc_camera_inference_requests_total", "Per-camera inference budget decisions", ("outcome",)
+)
+
+
+class UnknownCamera(LookupError):
+    """No camera is registered under this device id"""
+
+
+def camera_url(device: DeviceState) -> Optional[str]:
+    """
+    Stream URL of a camera device, from its registration metadata
+
+    Accepts `stream_url` (as reported by the firmware's /status) or `ip`.
+    """
+    metadata = device.metadata or {}
+    if metadata.get("stream_url"):
+        return metadata["stream_url"]
+    if metadata.get("ip"):
+        return f"http://{metadata['ip']}/stream"
+    return None
+
+
+class InferenceBudget:
+    """
+    Token bucket capping how often one camera's frames may be run through
+    the detector, so a busy camera can't starve the others on the node
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "granted", "denied")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate  # inferences per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.granted = 0
+        self.denied = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, cost: float = 1.0) -> bool:
+        """Spend `cost` tokens if available"""
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            self.granted += 1
+            inference_requests.inc(1, "granted")
+            return True
+        self.denied += 1
+        inference_requests.inc(1, "denied")
+        return False
+
+    def retry_after(self, cost: float = 1.0) -> float:
+        """Seconds until `cost` tokens will be available"""
+        self._refill()
+        return max(cost - self.tokens, 0.0) / self.rate if self.rate > 0 else float("inf")
+
+    def stats(self) -> Dict:
+        self._refill()
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "available": round(self.tokens, 2),
+            "granted": self.granted,
+            "denied": self.denied
+        }
+
+
+class StreamHub:
+    """
+    Fans one upstream MJPEG connection out to any number of viewers
+
+    ESP32-CAM firmware serves a single streaming client, so viewers share
+    one connection, opened with the first viewer and closed `linger`
+    seconds after the last one leaves. Each viewer has a small queue; a
+    viewer that falls behind loses its oldest frames rather than slowing
+    the others. Frames also refresh the camera's snapshot cache.
+    """
+
+    def __init__(self, stream_url: str, client: httpx.AsyncClient, snapshots: SnapshotCache,
+                 linger: float = 5.0, queue_size: int = 2, max_backoff: float = 30.0):
+        self.stream_url = stream_url
+        self.client = client
+        self.snapshots = snapshots
+        self.linger = linger
+        self.queue_size = queue_size
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.frames = 0
+        self.last_error: Optional[str] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._idle_since = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def viewers(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """JPEG frames as they arrive, until the viewer stops iterating"""
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    return  # hub closed
+                yield frame
+        finally:
+            self._subscribers.discard(queue)
+            if not self._subscribers:
+                self._idle_since = time.monotonic()
+
+    def _publish(self, frame: bytes):
+        self.frames += 1
+        stream_frames.inc(1, "received")
+        self.snapshots.feed(frame)
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+                stream_frames.inc(1, "dropped")
+            queue.put_nowait(frame)
+
+    def _idle(self) -> bool:
+        return not self._subscribers and time.monotonic() - self._idle_since >= self.linger
+
+    async def _run(self):
+        failures = 0
+        while not self._idle():
+            try:
+                await self._pump()
+                failures = 0
+            except httpx.HTTPError as e:
+                self.last_error = "timeout" if isinstance(e, httpx.TimeoutException) else str(e) or type(e).__name__
+                failures += 1
+                logger.warning(f"Stream {self.stream_url} failed: {self.last_error}")
+            finally:
+                self.connected = False
+            await asyncio.sleep(min(0.5 * 2 ** failures, self.max_backoff) if failures else 0.1)
+
+    async def _pump(self):
+        splitter = JpegSplitter()
+        async with self.client.stream("GET", self.stream_url, timeout=httpx.Timeout(10.0)) as response:
+            if response.status_code != 200:
+                raise httpx.HTTPStatusError(
+                    f"HTTP {response.status_code}", request=response.request, response=response
+                )
+            self.connected = True
+            self.last_error = None
+            logger.info(f"Stream {self.stream_url} connected")
+            async for chunk in response.aiter_raw():
+                frame = splitter.feed(chunk)
+                if frame is not None:
+                    self._publish(frame)
+                if self._idle():
+                    return
+
+    async def close(self):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "viewers": self.viewers,
+            "connected": self.connected,
+            "frames": self.frames,
+            "last_error": self.last_error
+        }
+
+
+class Camera:
+    """Connection state of one ESP32-CAM"""
+
+    def __init__(self, device_id: str, stream_url: str, prober: CameraHealthProber):
+        self.device_id = device_id
+        self.stream_url = stream_url
+        base_url = stream_url[:-len("/stream")] if stream_url.endswith("/stream") else stream_url.rstrip("/")
+        self.capture_url = f"{base_url}/capture.jpg"
+        self.status_url = f"{base_url}/status"
+        self.trigger_url = f"{base_url}/trigger-capture"
+
+        # Own pool per camera, so a hung camera can't hold connections
+        # another camera needs; the stream hub and the snapshot fetcher
+        # each keep at most one connection open
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.camera_max_connections,
+                max_keepalive_connections=settings.camera_max_connections
+            ),
+            timeout=settings.snapshot_fetch_timeout
+        )
+        self.snapshots = SnapshotCache(
+            self.capture_url, self.client, settings.snapshot_max_age,
+            settings.snapshot_idle_after, settings.snapshot_fetch_timeout
+        )
+        self.hub = StreamHub(stream_url, self.client, self.snapshots)
+        self.budget = InferenceBudget(settings.camera_inference_fps, settings.camera_inference_burst)
+        self._prober = prober
+        self.health: CameraHealth = prober.watch(self.status_url, self.client)
+
+    async def trigger_capture(self) -> Dict:
+        """Ask the firmware to take a picture (its software button)"""
+        try:
+            response = await self.client.post(self.trigger_url, timeout=5.0)
+        except httpx.TimeoutException:
+            raise CameraUnavailable("Camera timeout", timeout=True)
+        except httpx.HTTPError as e:
+            raise CameraUnavailable(f"Cannot connect to camera: {e}")
+        if response.status_code != 200:
+            raise CameraUnavailable(f"Camera returned status {response.status_code}")
+        return response.json()
+
+    async def close(self):
+        self._prober.unwatch(self.status_url)
+        await self.hub.close()
+        await self.snapshots.close()
+        await self.client.aclose()
+
+    def stats(self) -> Dict:
+        return {
+            "device_id": self.device_id,
+            "stream_url": self.stream_url,
+            "health": self.health.to_dict(),
+            "stream": self.hub.stats(),
+            "snapshot": self.snapshots.stats(),
+            "inference_budget": self.budget.stats()
+        }
+
+
+class CameraRegistry:
+    """
+    Cameras by device id, kept in step with the devices collection
+
+    Cameras are created when an esp32cam device with a stream URL is first
+    addressed or seen by the periodic sync, replaced when its URL changes
+    and closed when the device is deleted. Cameras that aren't devices
+    (the ESP32_CAM_URL default) are pinned.
+    """
+
+    def __init__(self, devices: Collection, prober: CameraHealthProber, sync_interval: float = 5.0):
+        self.devices = devices
+        self.prober = prober
+        self.sync_interval = sync_interval
+        self._cameras: Dict[str, Camera] = {}
+        self.pinned: Dict[str, str] = {}  # device id -> stream URL of cameras that aren't devices
+        self._synced_version: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._cameras)
+
+    def cameras(self) -> List[Camera]:
+        return list(self._cameras.values())
+
+    def pin(self, device_id: str, stream_url: str) -> Camera:
+        """Register a camera by URL, independent of the devices collection"""
+        self.pinned[device_id] = stream_url
+        return self._attach(device_id, stream_url)
+
+    async def get(self, device_id: str) -> Camera:
+        """
+        The camera of a device
+
+        Raises:
+            UnknownCamera: Not an esp32cam device with a stream URL
+        """
+        camera = self._cameras.get(device_id)
+        if device_id in self.pinned:
+            return camera or self._attach(device_id, self.pinned[device_id])
+
+        device = await self.devices.fetch(device_id)
+        if device is None:
+            raise UnknownCamera(f"Device {device_id} not registered")
+        if device.device_type != CAMERA_DEVICE_TYPE:
+            raise UnknownCamera(f"Device {device_id} is not an {CAMERA_DEVICE_TYPE}")
+        url = camera_url(device)
+        if url is None:
+            raise UnknownCamera(f"Device {device_id} has no stream_url in its metadata")
+        if camera is None or camera.stream_url != url:
+            camera = self._attach(device_id, url)
+        return camera
+
+    def _attach(self, device_id: str, stream_url: str) -> Camera:
+        current = self._cameras.get(device_id)
+        if current is not None:
+            if current.stream_url == stream_url:
+                return current
+            self._detach(device_id)
+        camera = self._cameras[device_id] = Camera(device_id, stream_url, self.prober)
+        logger.info(f"Camera {device_id} attached at {stream_url}")
+        return camera
+
+    def _detach(self, device_id: str):
+        camera = self._cameras.pop(device_id, None)
+        if camera is not None:
+            logger.info(f"Camera {device_id} detached")
+            try:
+                asyncio.get_running_loop().create_task(camera.close())
+            except RuntimeError:
+                # Re-pinned outside the event loop (e.g. before startup); nothing is running yet
+                self.prober.unwatch(camera.status_url)
+
+    def sync(self):
+        """Attach, re-point and detach cameras to match the devices collection"""
+        version = self.devices.version
+        if version == self._synced_version:
+            return
+        self._synced_version = version
+
+        wanted: Dict[str, str] = {}
+        for device_id, device in self.devices.items():
+            if device.device_type == CAMERA_DEVICE_TYPE:
+                url = camera_url(device)
+                if url is not None:
+                    wanted[device_id] = url
+        for device_id in list(self._cameras):
+            if device_id not in self.pinned and device_id not in wanted:
+                self._detach(device_id)
+        for device_id, url in wanted.items():
+            if device_id not in self.pinned:
+                self._attach(device_id, url)
+
+    def start(self):
+        """Start health probing and the periodic device sync"""
+        self.sync()
+        self.prober.start()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Camera registry sync failed: {e}")
+
+    async def close(self):
+        """Stop background work and close every camera's connections"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.prober.stop()
+        cameras, self._cameras = list(self._cameras.values()), {}
+        await asyncio.gather(*(camera.close() for camera in cameras))
+
+    def stats(self) -> List[Dict]:
+        return [camera.stats() for camera in self._cameras.values()]
+
+    def totals(self) -> Dict[tuple, float]:
+        cameras = self._cameras.values()
+        return {
+            ("cameras",): float(len(self._cameras)),
+            ("streams_connected",): float(sum(camera.hub.connected for camera in cameras)),
+            ("viewers",): float(sum(camera.hub.viewers for camera in cameras))
+        }
+
+
+# Global instance
+camera_registry = CameraRegistry(
+    storage.collection("devices", DeviceState), camera_health, settings.camera_probe_interval
+)
+camera_registry.pin(DEFAULT_CAMERA, settings.esp32_cam_url)
+
+metrics.gauge("snc_camera_registry", "Registered cameras, live upstream streams and viewers",
+              camera_registry.totals, ("kind",))
@@ -0,0 +1,209 @@
+"""
+Camera snapshot cache
+Keeps the latest JPEG from each ESP32-CAM in memory so snapshot requests are
+served without touching the camera's single-client web server. One fetcher
+per camera polls /capture.jpg at a fixed rate while snapshots are being
+requested, and frames passing through the MJPEG proxy refresh it for free.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+import asyncio
+import logging
+import time
+
+import httpx
+
+from app.services.http_cache import content_digest
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+snapshot_requests = metrics.counter(
+    "snc_snapshot_requests_total", "Snapshot requests by how they were served (cached, fetched, shared)",
+    ("result",)
+)
+camera_fetches = metrics.counter(
+    "snc_camera_fetches_total", "Upstream /capture.jpg requests by outcome", ("outcome",)
+)
+
+
+class CameraUnavailable(Exception):
+    """The camera could not produce a frame"""
+
+    def __init__(self, message: str, timeout: bool = False):
+        super().__init__(message)
+        self.timeout = timeout
+
+
+@dataclass
+class Snapshot:
+    """One JPEG frame and when it was taken"""
+    data: bytes
+    digest: str
+    captured_at: float  # time.monotonic()
+    source: str  # "capture" or "stream"
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.captured_at
+
+
+class SnapshotCache:
+    """
+    Latest frame of one camera
+
+    Concurrent requests for a stale frame share a single upstream fetch. The
+    background fetcher keeps the frame fresh at 1 / max_age requests per
+    second and stops after idle_after seconds without snapshot requests.
+    """
+
+    def __init__(self, capture_url: str, client: httpx.AsyncClient, max_age: float = 0.5,
+                 idle_after: float = 10.0, fetch_timeout: float = 5.0):
+        self.capture_url = capture_url
+        self.client = client
+        self.max_age = max_age
+        self.idle_after = idle_after
+        self.fetch_timeout = fetch_timeout
+        self.latest: Optional[Snapshot] = None
+        self.last_error: Optional[str] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._fetcher: Optional[asyncio.Task] = None
+        self._last_request = 0.0
+
+    async def get(self, max_age: Optional[float] = None) -> Snapshot:
+        """
+        Latest frame no older than max_age (default: the cache's max_age)
+
+        max_age can only relax the cache's own: asking for fresher frames
+        would poll the camera faster than the rate the cache enforces.
+
+        Raises:
+            CameraUnavailable: No fresh frame and the camera didn't answer
+        """
+        max_age = self.max_age if max_age is None else max(max_age, self.max_age)
+        self._last_request = time.monotonic()
+        self._ensure_fetcher()
+
+        latest = self.latest
+        if latest is not None and latest.age <= max_age:
+            snapshot_requests.inc(1, "cached")
+            return latest
+
+        if self._inflight is not None:
+            snapshot_requests.inc(1, "shared")
+        else:
+            snapshot_requests.inc(1, "fetched")
+        return await asyncio.shield(self._fetch_once())
+
+    def feed(self, data: bytes, source: str = "stream"):
+        """Offer a frame seen elsewhere (e.g. the MJPEG proxy)"""
+        self.latest = Snapshot(data, content_digest(data), time.monotonic(), source)
+
+    def _fetch_once(self) -> "asyncio.Task[Snapshot]":
+        """The in-flight upstream fetch, starting one if none is running"""
+        if self._inflight is None:
+            self._inflight = asyncio.get_running_loop().create_task(self._fetch())
+            self._inflight.add_done_callback(self._fetch_done)
+        return self._inflight
+
+    def _fetch_done(self, task: asyncio.Task):
+        self._inflight = None
+        if not task.cancelled():
+            task.exception()  # retrieved here so unawaited failures aren't logged
+
+    async def _fetch(self) -> Snapshot:
+        try:
+            with metrics.timer("stream_snapshot_fetch"):
+                response = await self.client.get(self.capture_url, timeout=self.fetch_timeout)
+        except httpx.TimeoutException:
+            camera_fetches.inc(1, "timeout")
+            self.last_error = "timeout"
+            raise CameraUnavailable("Camera timeout", timeout=True)
+        except httpx.HTTPError as e:
+            camera_fetches.inc(1, "error")
+            self.last_error = str(e) or type(e).__name__
+            raise CameraUnavailable(f"Cannot connect to camera: {self.last_error}")
+
+        if response.status_code != 200:
+            camera_fetches.inc(1, "error")
+            self.last_error = f"HTTP {response.status_code}"
+            raise CameraUnavailable(f"Camera returned status {response.status_code}")
+
+        camera_fetches.inc(1, "ok")
+        self.last_error = None
+        self.feed(response.content, "capture")
+        return self.latest
+
+    def _ensure_fetcher(self):
+        if self._fetcher is None or self._fetcher.done():
+            self._fetcher = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        """Keep the frame fresh while it is in demand"""
+        while time.monotonic() - self._last_request < self.idle_after:
+            latest = self.latest
+            wait = self.max_age if latest is None else self.max_age - latest.age
+            if wait <= 0:
+                try:
+                    await self._fetch_once()
+                except CameraUnavailable:
+                    pass  # kept in last_error; retried next period
+                wait = self.max_age
+            await asyncio.sleep(max(wait, 0.01))
+
+    async def close(self):
+        for task in (self._fetcher, self._inflight):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, CameraUnavailable):
+                    pass
+
+    def stats(self) -> Dict:
+        latest = self.latest
+        return {
+            "capture_url": self.capture_url,
+            "age_s": round(latest.age, 3) if latest else None,
+            "source": latest.source if latest else None,
+            "bytes": len(latest.data) if latest else 0,
+            "fetcher_running": self._fetcher is not None and not self._fetcher.done(),
+            "last_error": self.last_error
+        }
+
+
+class JpegSplitter:
+    """Extracts complete JPEG frames (SOI..EOI) from an MJPEG byte stream"""
+
+    def __init__(self, max_frame_bytes: int = 2 * 1024 * 1024):
+        self.max_frame_bytes = max_frame_bytes
+        self._buffer = bytearray()
+        self._scanned = 0  # offset already searched for EOI; the buffer starts at an SOI
+
+    def feed(self, chunk: bytes) -> Optional[bytes]:
+        """Add a chunk; returns the newest frame it completed, if any"""
+        buffer = self._buffer
+        buffer += chunk
+        frame = None
+        while True:
+            if self._scanned == 0:
+                start = buffer.find(b"\xff\xd8")
+                if start < 0:
+                    # Keep a trailing 0xff that may begin the next marker
+                    del buffer[:max(len(buffer) - 1, 0)]
+                    break
+                del buffer[:start]
+                self._scanned = 2
+            end = buffer.find(b"\xff\xd9", self._scanned)
+            if end < 0:
+                if len(buffer) > self.max_frame_bytes:
+                    del buffer[:]
+                    self._scanned = 0
+                else:
+                    self._scanned = max(len(buffer) - 1, 2)
+                break
+            frame = bytes(buffer[:end + 2])
+            del buffer[:end + 2]
+            self._scanned = 0
+        return frame
+
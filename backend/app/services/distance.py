@@ -0,0 +1,245 @@
+"""
+Distance estimation
+Estimates how far detected objects are from the camera from the boxes alone:
+class height priors, the OV2640's intrinsics at the frame size and where the
+box meets the ground. No depth network; a frame's objects cost a few numpy
+operations.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.metrics import metrics
+from app.services.records import DeviceState
+from app.services.storage import Collection, storage
+
+# Typical height in meters and whether the box bottom rests on the ground
+CLASS_PRIORS: Dict[str, Tuple[float, bool]] = {
+    "person": (1.7, True),
+    "bicycle": (1.05, True),
+    "car": (1.5, True),
+    "motorcycle": (1.15, True),
+    "bus": (3.1, True),
+    "train": (3.8, True),
+    "truck": (3.0, True),
+    "traffic light": (0.9, False),
+    "fire hydrant": (0.75, True),
+    "stop sign": (0.75, False),
+    "parking meter": (1.3, True),
+    "bench": (0.85, True),
+    "dog": (0.55, True),
+    "horse": (1.6, True),
+    "cat": (0.3, True),
+    "chair": (0.9, True),
+    "potted plant": (0.6, True),
+    "suitcase": (0.65, True),
+    "skateboard": (0.12, True),
+    "dining table": (0.75, True),
+    "couch": (0.85, True),
+    "bed": (0.6, True),
+    "toilet": (0.75, True),
+    "tv": (0.6, False),
+    "refrigerator": (1.75, True),
+    "backpack": (0.5, False),
+    "umbrella": (1.0, False),
+    "handbag": (0.35, False),
+    "sports ball": (0.22, True),
+    "bird": (0.25, False),
+}
+
+# OV2640 native window (UXGA); smaller frame sizes are binned or scaled from
+# it and other aspect ratios crop it, so the focal length in pixels scales
+# with the frame width over the part of the window the frame covers
+SENSOR_WIDTH, SENSOR_HEIGHT = 1600, 1200
+
+_SIZE_ERROR = 0.25  # relative spread of real object heights around the prior
+_BOTTOM_EDGE_ERROR_PX = 3.0  # box bottom edge jitter
+_MIN_GROUND_ANGLE = math.radians(1.0)  # rays flatter than this never reach the ground usefully
+_EDGE_PX = 2  # boxes within this many pixels of the frame edge are truncated
+
+
+class CameraCalibration:
+    """Mounting and optics of one camera; focal lengths cached per frame size"""
+
+    __slots__ = ("height_m", "pitch", "hfov", "_focal")
+
+    def __init__(self, height_m: float, pitch_deg: float, hfov_deg: float):
+        self.height_m = height_m  # lens height above the ground
+        self.pitch = math.radians(pitch_deg)  # downward tilt of the optical axis
+        self.hfov = math.radians(hfov_deg)  # horizontal field of view of the full sensor window
+        self._focal: Dict[Tuple[int, int], float] = {}
+
+    @classmethod
+    def default(cls) -> "CameraCalibration":
+        return cls(settings.camera_height_m, settings.camera_pitch_deg, settings.camera_hfov_deg)
+
+    @classmethod
+    def from_metadata(cls, metadata: Optional[Dict]) -> "CameraCalibration":
+        calibration = (metadata or {}).get("camera_calibration") or {}
+        return cls(
+            calibration.get("height_m", settings.camera_height_m),
+            calibration.get("pitch_deg", settings.camera_pitch_deg),
+            calibration.get("hfov_deg", settings.camera_hfov_deg)
+        )
+
+    def focal(self, width: int, height: int) -> float:
+        """Focal length in pixels at a frame size"""
+        key = (width, height)
+        if key not in self._focal:
+            window = min(SENSOR_WIDTH, SENSOR_HEIGHT * width / height)
+            sensor_focal = (SENSOR_WIDTH / 2) / math.tan(self.hfov / 2)
+            self._focal[key] = sensor_focal * width / window
+        return self._focal[key]
+
+    def to_dict(self) -> Dict:
+        return {
+            "height_m": round(self.height_m, 3),
+            "pitch_deg": round(math.degrees(self.pitch), 2),
+            "hfov_deg": round(math.degrees(self.hfov), 2)
+        }
+
+
+def calibrate_from_reference(label: str, bbox: Sequence[float], frame_width: int, frame_height: int,
+                             distance_m: float, object_height_m: Optional[float] = None,
+                             camera_height_m: Optional[float] = None) -> CameraCalibration:
+    """
+    Solve field of view and pitch from one object at a measured distance
+
+    The object's apparent height gives the focal length, then where its
+    bottom edge sits in the frame gives the camera's tilt.
+
+    Raises:
+        ValueError: No height is known for the object or the box is degenerate
+    """
+    if object_height_m is None:
+        if label not in CLASS_PRIORS:
+            raise ValueError(f"No height prior for {label!r}; pass object_height_m")
+        object_height_m = CLASS_PRIORS[label][0]
+    x, y, w, h = bbox
+    if h <= 0 or distance_m <= 0:
+        raise ValueError("Reference box height and distance must be positive")
+    camera_height_m = camera_height_m if camera_height_m is not None else settings.camera_height_m
+
+    focal = distance_m * h / object_height_m
+    window = min(SENSOR_WIDTH, SENSOR_HEIGHT * frame_width / frame_height)
+    sensor_focal = focal * window / frame_width
+    hfov = 2 * math.atan((SENSOR_WIDTH / 2) / sensor_focal)
+    below_axis = math.atan((y + h - frame_height / 2) / focal)
+    pitch = math.atan2(camera_height_m, distance_m) - below_axis
+    return CameraCalibration(camera_height_m, math.degrees(pitch), math.degrees(hfov))
+
+
+def estimate_distances(calibration: CameraCalibration, labels: Sequence[str], boxes: np.ndarray,
+                       frame_width: int, frame_height: int) -> np.ndarray:
+    """
+    Distance in meters of each box (NaN where neither cue applies)
+
+    Two cues, fused by inverse variance:
+    - size: focal * prior height / box height. Unreliable when the box is
+      cut by the top or bottom of the frame;
+    - ground plane: the ray through the box's bottom edge meets the ground
+      at height_m / tan(angle below horizon). Only for classes standing on
+      the ground. Its error grows with distance, so it dominates up close.
+
+    Boxes cut by the bottom edge extend past the nearest visible ground
+    point, so they get that point's distance as an upper bound.
+
+    Args:
+        boxes: (N, 4) array of [x, y, width, height] in pixels
+    """
+    if not len(labels):
+        return np.empty(0)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    focal = calibration.focal(frame_width, frame_height)
+    priors = np.array([CLASS_PRIORS.get(label, (np.nan, False)) for label in labels], dtype=np.float64)
+    prior_height, grounded = priors[:, 0], priors[:, 1].astype(bool)
+    top, height = boxes[:, 1], np.maximum(boxes[:, 3], 1.0)
+    bottom = top + boxes[:, 3]
+    cut_top = top <= _EDGE_PX
+    cut_bottom = bottom >= frame_height - _EDGE_PX
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        size = np.where(cut_top | cut_bottom, np.nan, focal * prior_height / height)
+        angle = calibration.pitch + np.arctan((bottom - frame_height / 2) / focal)
+        ground_ok = grounded & ~cut_bottom & (angle > _MIN_GROUND_ANGLE)
+        ground = np.where(ground_ok, calibration.height_m / np.tan(angle), np.nan)
+
+        size_error = _SIZE_ERROR
+        ground_error = _BOTTOM_EDGE_ERROR_PX / (focal * np.sin(angle) * np.cos(angle))
+        size_weight = np.where(np.isnan(size), 0.0, 1 / size_error ** 2)
+        ground_weight = np.where(np.isnan(ground), 0.0, 1 / ground_error ** 2)
+        fused = (np.nan_to_num(size) * size_weight + np.nan_to_num(ground) * ground_weight) / (
+            size_weight + ground_weight
+        )
+
+    nearest_visible = math.inf
+    frame_bottom_angle = calibration.pitch + math.atan((frame_height / 2) / focal)
+    if frame_bottom_angle > _MIN_GROUND_ANGLE:
+        nearest_visible = calibration.height_m / math.tan(frame_bottom_angle)
+    return np.where(cut_bottom & np.isfinite(nearest_visible), nearest_visible, fused)
+
+
+class DistanceEstimator:
+    """
+    Fills in `distance` on detections using each device's calibration
+
+    Calibrations come from the device's `camera_calibration` metadata (set
+    through the device camera-calibration endpoint), falling back to the
+    CAMERA_HEIGHT_M / CAMERA_PITCH_DEG / CAMERA_HFOV_DEG defaults. Each
+    device's calibration is parsed once and kept until its record changes.
+    """
+
+    def __init__(self, devices: Collection):
+        self.devices = devices
+        self._default = CameraCalibration.default()
+        self._calibrations: Dict[str, Tuple[Optional[float], CameraCalibration]] = {}
+
+    def calibration(self, device_id: Optional[str]) -> CameraCalibration:
+        if device_id is None:
+            return self._default
+        modified = self.devices.modified_at(device_id)
+        cached = self._calibrations.get(device_id)
+        if cached is not None and cached[0] == modified:
+            return cached[1]
+        device = self.devices.get(device_id)
+        calibration = CameraCalibration.from_metadata(device.metadata) if device is not None else self._default
+        self._calibrations[device_id] = (modified, calibration)
+        return calibration
+
+    def annotate(self, detections: List[Dict], frame_width: int, frame_height: int,
+                 device_id: Optional[str] = None) -> List[Dict]:
+        """Set `distance` (meters, or None) on detection dicts with `class` and [x, y, w, h] `bbox`"""
+        if not detections:
+            return detections
+        started = time.perf_counter()
+        distances = estimate_distances(
+            self.calibration(device_id), [d["class"] for d in detections],
+            np.array([d["bbox"] for d in detections]), frame_width, frame_height
+        )
+        for detection, distance in zip(detections, distances.tolist()):
+            detection["distance"] = round(distance, 2) if math.isfinite(distance) else None
+        metrics.record_stage("distance", time.perf_counter() - started)
+        return detections
+
+    def fill(self, objects: List, frame_width: int, frame_height: int, device_id: Optional[str] = None):
+        """Set `distance` on DetectedObject models that don't carry one"""
+        missing = [obj for obj in objects if obj.distance is None]
+        if not missing:
+            return
+        boxes = np.array([
+            [obj.bbox.get("x", 0.0), obj.bbox.get("y", 0.0), obj.bbox.get("width", 0.0), obj.bbox.get("height", 0.0)]
+            for obj in missing
+        ])
+        distances = estimate_distances(
+            self.calibration(device_id), [obj.label for obj in missing], boxes, frame_width, frame_height
+        )
+        for obj, distance in zip(missing, distances.tolist()):
+            if math.isfinite(distance):
+                obj.distance = round(distance, 2)
+
+
+# Global instance
+distance_estimator = DistanceEstimator(storage.collection("devices", DeviceState))
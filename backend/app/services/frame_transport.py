@@ -0,0 +1,132 @@
+"""
+Shared-memory frame transport
+Ring of multiprocessing.shared_memory slots holding decoded frames, so only
+small descriptors cross process boundaries
+"""
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional, Tuple
+import logging
+import multiprocessing
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RingFullError(Exception):
+    """Raised when every slot is still referenced"""
+
+
+class FrameDescriptor(NamedTuple):
+    """Small, picklable handle to a frame stored in the ring"""
+    slot: int
+    generation: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class SharedFrameRing:
+    """
+    Fixed ring of shared-memory frame slots with reference counting
+
+    put() copies a frame into a free slot and returns a descriptor that owns
+    one reference. Each additional reader calls acquire(), and every holder
+    calls release() when done; the slot is reused once its count drops to
+    zero. Passing a descriptor to another process transfers the reference
+    created by put(), so the consumer releases it after processing.
+    """
+
+    def __init__(self, slots: int = 8, slot_bytes: int = 1920 * 1080 * 3,
+                 lock=None, data_name: Optional[str] = None, header_name: Optional[str] = None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = data_name is None
+        self._lock = lock or multiprocessing.Lock()
+
+        if self.owner:
+            self._data = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+            self._header = shared_memory.SharedMemory(create=True, size=2 * slots * 8)
+        else:
+            self._data = shared_memory.SharedMemory(name=data_name)
+            self._header = shared_memory.SharedMemory(name=header_name)
+
+        # Row 0: reference counts, row 1: generation of the frame in each slot
+        self._meta = np.ndarray((2, slots), dtype=np.int64, buffer=self._header.buf)
+        if self.owner:
+            self._meta[:] = 0
+        self._cursor = 0
+
+    def handle(self) -> Tuple:
+        """Arguments for attach() in another process"""
+        return (self.slots, self.slot_bytes, self._lock, self._data.name, self._header.name)
+
+    @classmethod
+    def attach(cls, slots: int, slot_bytes: int, lock, data_name: str,
+               header_name: str) -> "SharedFrameRing":
+        """Open a ring created by another process"""
+        return cls(slots, slot_bytes, lock, data_name, header_name)
+
+    def put(self, frame: np.ndarray) -> FrameDescriptor:
+        """
+        Copy a frame into a free slot
+
+        Raises:
+            ValueError: The frame is larger than a slot
+            RingFullError: No slot is free
+        """
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds slot size {self.slot_bytes}")
+
+        with self._lock:
+            for i in range(self.slots):
+                slot = (self._cursor + i) % self.slots
+                if self._meta[0, slot] == 0:
+                    self._meta[0, slot] = 1
+                    self._meta[1, slot] += 1
+                    generation = int(self._meta[1, slot])
+                    break
+            else:
+                raise RingFullError("All frame slots are in use")
+        self._cursor = (slot + 1) % self.slots
+
+        view = self._view(slot, frame.shape, frame.dtype)
+        np.copyto(view, frame, casting="no")
+        return FrameDescriptor(slot, generation, tuple(frame.shape), frame.dtype.str)
+
+    def acquire(self, descriptor: FrameDescriptor) -> np.ndarray:
+        """Take an extra reference and return a zero-copy view of the frame"""
+        with self._lock:
+            self._check(descriptor)
+            self._meta[0, descriptor.slot] += 1
+        return self.view(descriptor)
+
+    def view(self, descriptor: FrameDescriptor) -> np.ndarray:
+        """Zero-copy view of a frame the caller holds a reference to"""
+        return self._view(descriptor.slot, descriptor.shape, np.dtype(descriptor.dtype))
+
+    def release(self, descriptor: FrameDescriptor):
+        """Drop a reference; the slot becomes reusable at zero"""
+        with self._lock:
+            self._check(descriptor)
+            if self._meta[0, descriptor.slot] > 0:
+                self._meta[0, descriptor.slot] -= 1
+
+    def in_use(self) -> int:
+        """Number of slots currently referenced"""
+        return int(np.count_nonzero(self._meta[0]))
+
+    def close(self):
+        """Detach from the shared memory; the owner also unlinks it"""
+        self._meta = None
+        self._data.close()
+        self._header.close()
+        if self.owner:
+            self._data.unlink()
+            self._header.unlink()
+
+    def _view(self, slot: int, shape, dtype) -> np.ndarray:
+        return np.ndarray(shape, dtype=dtype, buffer=self._data.buf, offset=slot * self.slot_bytes)
+
+    def _check(self, descriptor: FrameDescriptor):
+        if self._meta[1, descriptor.slot] != descriptor.generation:
+            raise ValueError(f"Stale frame descriptor for slot {descriptor.slot}")
@@ -0,0 +1,133 @@
+"""
+Geospatial helpers
+Geohash encoding, cell neighbourhoods and great-circle distances used by the
+navigation services for snapping and spatial lookups
+"""
+import math
+from typing import Iterable, List, Set, Tuple
+
+EARTH_RADIUS_M = 6371000.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {c: i for i, c in enumerate(_BASE32)}
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def point_segment_distance_m(
+    lat: float, lon: float,
+    lat1: float, lon1: float,
+    lat2: float, lon2: float
+) -> float:
+    """
+    Distance in meters from a point to a segment
+
+    Uses a local equirectangular projection, which is accurate enough at the
+    street-level scales we deal with.
+    """
+    k = math.cos(math.radians(lat))
+    px, py = lon * k, lat
+    ax, ay = lon1 * k, lat1
+    bx, by = lon2 * k, lat2
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    cx, cy = ax + t * dx, ay + t * dy
+    return haversine_m(lat, lon, cy, cx / k if k else lon1)
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 7) -> str:
+    """Encode a coordinate as a geohash string of the given precision"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch |= 1 << (4 - bit)
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        if bit < 4:
+            bit += 1
+        else:
+            chars.append(_BASE32[ch])
+            bit, ch = 0, 0
+
+    return "".join(chars)
+
+
+def geohash_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """Decode a geohash to its (min_lat, min_lon, max_lat, max_lon) bounding box"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for c in geohash:
+        cd = _BASE32_INDEX[c]
+        for mask in (16, 8, 4, 2, 1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if cd & mask:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def geohash_neighbors(geohash: str) -> List[str]:
+    """Return the geohash together with its eight surrounding cells"""
+    min_lat, min_lon, max_lat, max_lon = geohash_bbox(geohash)
+    dlat, dlon = max_lat - min_lat, max_lon - min_lon
+    lat_c, lon_c = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+    cells = []
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            lat = max(-90.0, min(90.0, lat_c + i * dlat))
+            lon = (lon_c + j * dlon + 180.0) % 360.0 - 180.0
+            cell = geohash_encode(lat, lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def polyline_cells(points: Iterable[Tuple[float, float]], precision: int = 7) -> Set[str]:
+    """
+    Geohash cells covered by a polyline
+
+    Each segment is sampled at roughly half the cell size so that no cell the
+    path crosses is skipped.
+    """
+    min_lat, min_lon, max_lat, max_lon = geohash_bbox(geohash_encode(0.0, 0.0, precision))
+    step_m = min(max_lat - min_lat, max_lon - min_lon) * 111320.0 / 2
+
+    cells: Set[str] = set()
+    prev = None
+    for lat, lon in points:
+        if prev is not None:
+            length = haversine_m(prev[0], prev[1], lat, lon)
+            steps = max(1, int(length / step_m))
+            for s in range(1, steps):
+                t = s / steps
+                cells.add(geohash_encode(
+                    prev[0] + (lat - prev[0]) * t,
+                    prev[1] + (lon - prev[1]) * t,
+                    precision
+                ))
+        cells.add(geohash_encode(lat, lon, precision))
+        prev = (lat, lon)
+    return cells
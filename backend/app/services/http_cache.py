@@ -0,0 +1,199 @@
+"""
+HTTP caching and compression
+Conditional GET (ETag / Last-Modified -> 304) keyed on content versions, and
+negotiated gzip/brotli compression of large responses
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional
+import gzip
+import hashlib
+import logging
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from starlette.datastructures import MutableHeaders
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Bodies of these types are worth compressing; images and audio already are
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/javascript", "application/xml", "image/svg+xml"
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # fast setting, most of the ratio at a fraction of the CPU of 11
+
+compressed_bytes = metrics.counter(
+    "snc_http_compressed_bytes_total", "Response bytes before and after compression",
+    ("encoding", "stage")
+)
+not_modified_responses = metrics.counter(
+    "snc_http_not_modified_total", "Conditional GETs answered with 304 Not Modified"
+)
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag from the parts a response's content depends on"""
+    digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def content_digest(data: bytes) -> str:
+    """Digest of a body with no version of its own (e.g. a camera snapshot)"""
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """Whether the client's cached copy is current (If-None-Match, else If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        return _strip_weak(etag) in {_strip_weak(tag) for tag in if_none_match.split(",")}
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have one-second resolution
+        return int(last_modified) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[float] = None) -> Dict[str, str]:
+    """ETag/Last-Modified, with Cache-Control asking clients to revalidate"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> Optional[Response]:
+    """A 304 response when the client's copy is current, else None"""
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    not_modified_responses.inc()
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def with_validators(response: Response, etag: str, last_modified: Optional[float] = None) -> Response:
+    """Attach ETag/Last-Modified to a full response"""
+    response.headers.update(validator_headers(etag, last_modified))
+    return response
+
+
+def file_response(request: Request, path: Path, media_type: str) -> Response:
+    """Serve a file, or a 304 when the client's copy matches its mtime and size"""
+    stat = path.stat()
+    etag = make_etag(path, stat.st_mtime_ns, stat.st_size)
+    return not_modified(request, etag, stat.st_mtime) or FileResponse(
+        path, media_type=media_type, headers=validator_headers(etag, stat.st_mtime)
+    )
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values"""
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    wildcard = weights.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing large, compressible responses
+
+    Only single-message bodies are compressed; streamed responses (MJPEG,
+    file downloads) pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = negotiate_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            response_start, start = start, None
+            headers = MutableHeaders(raw=response_start["headers"])
+            body = message.get("body", b"")
+            compressible = "content-encoding" not in headers and self._compressible_type(headers)
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if not compressible or message.get("more_body") or len(body) < self.minimum_size:
+                await send(response_start)
+                await send(message)
+                return
+
+            compressed = self._compress(body, encoding)
+            compressed_bytes.inc(len(body), encoding, "in")
+            compressed_bytes.inc(len(compressed), encoding, "out")
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            await send(response_start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _compressible_type(headers: MutableHeaders) -> bool:
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+    @staticmethod
+    def _compress(body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,112 @@
+"""
+Image variants
+Downscaled / re-encoded JPEG variants of snapshots and detection artifacts,
+requested with ?max_width=&quality= and cached per source version
+"""
+from collections import OrderedDict
+from io import BytesIO
+from typing import Annotated, Hashable, Optional, Tuple
+import asyncio
+import threading
+
+from fastapi import Query
+
+from app.services.metrics import metrics
+
+MaxWidth = Annotated[Optional[int], Query(
+    ge=16, le=4096, description="Downscale to at most this width (keeps aspect ratio)"
+)]
+Quality = Annotated[Optional[int], Query(ge=10, le=95, description="JPEG quality of the re-encoded image")]
+
+DEFAULT_QUALITY = 75
+
+VariantKey = Tuple[Hashable, Optional[int], Optional[int]]
+
+
+def encode_variant(data: bytes, max_width: Optional[int], quality: Optional[int]) -> bytes:
+    """Decode a JPEG, downscale it to max_width and re-encode it at quality"""
+    from PIL import Image
+
+    image = Image.open(BytesIO(data))
+    if max_width is not None and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        # Let libjpeg decode at a reduced scale before the exact resize
+        image.draft("RGB", (max_width, height))
+        image = image.convert("RGB").resize((max_width, height), Image.BILINEAR)
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality or DEFAULT_QUALITY)
+    return buffer.getvalue()
+
+
+class ImageVariantCache:
+    """
+    LRU of encoded variants, bounded by total bytes
+
+    Keys include the source's version (ETag or file mtime), so a new
+    snapshot or detection simply misses and old variants age out.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[VariantKey, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, source: Hashable, data: bytes,
+                  max_width: Optional[int], quality: Optional[int]) -> bytes:
+        """
+        Variant of an image, encoded off the event loop on a miss
+
+        Args:
+            source: Version of the source image (part of the cache key)
+            data: Source JPEG bytes
+            max_width: Maximum width, or None to keep the size
+            quality: JPEG quality, or None for DEFAULT_QUALITY
+
+        Returns:
+            The source bytes unchanged when no variant was asked for
+        """
+        if max_width is None and quality is None:
+            return data
+
+        key = (source, max_width, quality)
+        with self._lock:
+            variant = self._entries.get(key)
+            if variant is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return variant
+            self.misses += 1
+
+        with metrics.timer("image_variant_encode"):
+            variant = await asyncio.to_thread(encode_variant, data, max_width, quality)
+        # Never serve a "variant" bigger than the original
+        if len(variant) >= len(data) and max_width is None:
+            variant = data
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = variant
+                self._bytes += len(variant)
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return variant
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Global instance
+image_variants = ImageVariantCache()
@@ -0,0 +1,245 @@
+"""
+Out-of-process inference
+Runs AIDetectionService in a dedicated process fed through the shared-memory
+frame ring, keeping inference off the API event loop
+"""
+from typing import Dict, Optional
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.metrics import metrics
+from app.services.frame_transport import FrameDescriptor, SharedFrameRing
+
+logger = logging.getLogger(__name__)
+
+_STOP = None
+
+
+class InferenceTimeoutError(Exception):
+    """Raised when the inference process does not answer in time"""
+
+
+def _inference_main(ring_handle, requests, responses):
+    """Entry point of the inference process"""
+    from app.services.ai_detection import ai_service
+
+    ring = SharedFrameRing.attach(*ring_handle)
+    try:
+        while True:
+            item = requests.get()
+            if item is _STOP:
+                break
+
+            request_id, payload, options = item
+            try:
+                if isinstance(payload, FrameDescriptor):
+                    try:
+                        result = ai_service.process_frame(ring.view(payload), options)
+                    finally:
+                        # The descriptor carried the producer's reference
+                        ring.release(payload)
+                else:
+                    result = ai_service.process_frame(payload, options)
+                responses.put((request_id, result, None))
+            except Exception as e:
+                responses.put((request_id, None, str(e)))
+    finally:
+        ring.close()
+
+
+class InferenceClient:
+    """
+    Submits decoded frames to the inference process
+
+    Frames are copied once into the shared ring and only their descriptors
+    go over the request queue. A reader thread resolves the awaiting futures
+    as results come back.
+
+    If the process dies, its pending requests fail and it is restarted on a
+    fresh ring, up to `max_restarts` times; after that `running` stays False
+    and callers fall back to in-process detection.
+    """
+
+    def __init__(self, slots: int = 8, slot_bytes: int = 1920 * 1080 * 3,
+                 timeout: float = 30.0, max_restarts: int = 3):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.ring: Optional[SharedFrameRing] = None
+        self._process: Optional[multiprocessing.Process] = None
+        self._requests = None
+        self._responses = None
+        self._reader: Optional[threading.Thread] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def queue_depth(self) -> int:
+        """Requests submitted but not answered yet"""
+        return len(self._pending)
+
+    def start(self):
+        """Create the ring and start the inference process"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._spawn()
+
+    def _spawn(self):
+        # Fork so the process inherits weights preloaded by the launcher
+        ctx = multiprocessing.get_context("fork")
+        self.ring = SharedFrameRing(self.slots, self.slot_bytes, lock=ctx.Lock())
+        self._requests = ctx.Queue()
+        self._responses = ctx.Queue()
+
+        self._process = ctx.Process(
+            target=_inference_main,
+            args=(self.ring.handle(), self._requests, self._responses),
+            name="snc-inference",
+            daemon=True
+        )
+        self._process.start()
+
+        self._reader = threading.Thread(
+            target=self._read_responses, args=(self._process, self._responses),
+            name="snc-inference-reader", daemon=True
+        )
+        self._reader.start()
+        logger.info(f"Inference process started (pid {self._process.pid}, {self.slots} frame slots)")
+
+    def stop(self):
+        """Stop the inference process and free the ring"""
+        if self._process is None:
+            return
+
+        self._stopping = True
+        self._requests.put(_STOP)
+        self._process.join(timeout=10)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._responses.put(_STOP)
+        self._reader.join(timeout=5)
+
+        self._fail_pending("Inference process stopped")
+        self._teardown()
+
+    def _recover(self, process: multiprocessing.Process):
+        """Fail what a dead inference process held, then restart it or fall back to in-process"""
+        if self._stopping or process is not self._process:
+            return
+        logger.error(f"Inference process {process.pid} died (exit code {process.exitcode})")
+        self._fail_pending("Inference process died")
+        # A fresh ring drops the references the dead process held, and any lock it died holding
+        self._teardown()
+        if self.restarts < self.max_restarts:
+            self.restarts += 1
+            self._spawn()
+        else:
+            logger.error(f"Inference process died {self.restarts + 1} times, detecting in-process from now on")
+
+    def _fail_pending(self, reason: str):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError(reason))
+        self._pending.clear()
+
+    def _teardown(self):
+        self._requests.cancel_join_thread()
+        self._requests.close()
+        self._responses.close()
+        self.ring.close()
+        self.ring = None
+        self._process = None
+
+    async def process_frame(self, frame: np.ndarray, options: Optional[Dict] = None) -> Dict:
+        """
+        Run detection on an RGB frame in the inference process
+        
+        Args:
+            frame: RGB frame as a HxWx3 uint8 array
+            options: Quality options passed to AIDetectionService.process_frame
+
+        Raises:
+            RingFullError: Every frame slot is busy
+            InferenceTimeoutError: No result within `timeout` seconds
+            RuntimeError: Detection failed, or the inference process died
+        """
+        request_id = next(self._ids)
+        submitted = time.perf_counter()
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+
+        try:
+            with metrics.timer("frame_copy"):
+                payload = self.ring.put(frame)
+        except ValueError:
+            # Oversized frames fall back to a pickled copy
+            logger.warning(f"Frame {frame.shape} does not fit a ring slot, sending by value")
+            payload = frame
+        except Exception:
+            del self._pending[request_id]
+            raise
+
+        self._requests.put((request_id, payload, options))
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(request_id, None)
+            raise InferenceTimeoutError(f"No inference result within {self.timeout:g} s")
+        
+        # Stages ran in the inference process; record them here so /metrics sees them
+        for stage, ms in result.get("timings_ms", {}).items():
+            metrics.record_stage(stage, ms / 1000)
+        metrics.record_stage(
+            "ipc_overhead",
+            time.perf_counter() - submitted - result.get("processing_time_ms", 0.0) / 1000
+        )
+        return result
+
+    def _read_responses(self, process: multiprocessing.Process, responses):
+        while True:
+            try:
+                item = responses.get(timeout=1.0)
+            except queue.Empty:
+                if not process.is_alive():
+                    self._loop.call_soon_threadsafe(self._recover, process)
+                    break
+                continue
+            if item is _STOP:
+                break
+            request_id, result, error = item
+            self._loop.call_soon_threadsafe(self._resolve, request_id, result, error)
+
+    def _resolve(self, request_id: int, result: Optional[Dict], error: Optional[str]):
+        future = self._pending.pop(request_id, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+
+# Global instance
+inference_client = InferenceClient(
+    slots=settings.frame_ring_slots,
+    slot_bytes=settings.frame_ring_slot_bytes,
+    timeout=settings.inference_timeout,
+    max_restarts=settings.inference_max_restarts
+)
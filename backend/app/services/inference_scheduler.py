@@ -0,0 +1,249 @@
+"""
+Inference scheduler
+Orders detection work by priority class and shares the model fairly between
+devices, so frames from walking users never wait behind dashboard uploads or
+batch jobs and one chatty camera can't monopolize the model
+"""
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+LIVE = "live"  # frames of a user who is walking; only the newest frame per device matters
+INTERACTIVE = "interactive"  # someone is waiting on the response (dashboard, test uploads)
+BACKGROUND = "background"  # batch and maintenance work
+PRIORITIES = (LIVE, INTERACTIVE, BACKGROUND)
+
+inference_jobs = metrics.counter(
+    "snc_inference_jobs_total", "Scheduled inference jobs by priority and outcome", ("priority", "outcome")
+)
+
+
+class FrameSuperseded(Exception):
+    """A newer live frame from the same device replaced this one before it ran"""
+
+
+class SchedulerFull(Exception):
+    """Too many jobs of this priority are waiting"""
+
+
+class _Job:
+    __slots__ = ("work", "priority", "device_id", "weight", "finish", "seq", "future", "submitted", "started", "cancelled")
+
+    def __init__(self, work: Callable[[], Awaitable], priority: str, device_id: str, weight: float,
+                 finish: float, seq: int, future: asyncio.Future):
+        self.work = work
+        self.priority = priority
+        self.device_id = device_id
+        self.weight = weight
+        self.finish = finish  # virtual finish time within its class
+        self.seq = seq
+        self.future = future
+        self.submitted = time.perf_counter()
+        self.started = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.finish, self.seq) < (other.finish, other.seq)
+
+
+class _ClassQueue:
+    """
+    Weighted fair queue of one priority class
+
+    Each device is a flow. A job's virtual finish time is its flow's last
+    finish time (or the class's virtual clock, if the flow was idle) plus
+    1 / weight, and jobs run in finish-time order. A device that submits
+    ten frames therefore interleaves with a device that submits one instead
+    of running ahead of it.
+    """
+
+    def __init__(self):
+        self.heap: List[_Job] = []
+        self.flows: Dict[str, float] = {}  # device id -> virtual finish time of its last job
+        self.virtual_time = 0.0
+        self.waiting = 0
+        self.live_job: Dict[str, _Job] = {}  # device id -> its queued job (live class only)
+
+    def finish_time(self, device_id: str, weight: float) -> float:
+        start = max(self.virtual_time, self.flows.get(device_id, 0.0))
+        finish = start + 1.0 / weight
+        self.flows[device_id] = finish
+        return finish
+
+    def pop(self) -> Optional[_Job]:
+        while self.heap:
+            job = heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+            job.started = True
+            self.waiting -= 1
+            if self.live_job.get(job.device_id) is job:
+                del self.live_job[job.device_id]
+            # The clock follows the start time of the job entering service
+            self.virtual_time = max(self.virtual_time, job.finish - 1.0 / job.weight)
+            if not self.waiting:
+                # Idle class: forget flows so the table stays bounded by active devices
+                self.flows.clear()
+            return job
+        return None
+
+
+class InferenceScheduler:
+    """
+    Priority scheduler in front of the detector
+
+    Classes are served in strict priority order (live, interactive,
+    background) with weighted fair queuing across devices inside each
+    class. At most `concurrency` jobs run at once. A live frame replaces
+    the same device's live frame that is still waiting; the replaced
+    request fails with FrameSuperseded. A running job is never
+    interrupted, so the worst case wait of a live frame is one job.
+    """
+
+    def __init__(self, concurrency: int = 1, queue_limit: int = 64):
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self._queues: Dict[str, _ClassQueue] = {priority: _ClassQueue() for priority in PRIORITIES}
+        self._running = 0
+        self._seq = itertools.count()
+        self._waits: Deque[Tuple[float, float]] = deque(maxlen=256)  # (started at, seconds waited)
+
+    async def submit(self, work: Callable[[], Awaitable], priority: str = INTERACTIVE,
+                     device_id: Optional[str] = None, weight: float = 1.0):
+        """
+        Run `work` when its turn comes and return its result
+
+        Args:
+            work: Coroutine function doing the inference
+            priority: live, interactive or background
+            device_id: Flow the job is accounted to (anonymous jobs share one)
+            weight: Share of the class this device gets relative to others
+
+        Raises:
+            FrameSuperseded: A newer live frame from the device replaced this one
+            SchedulerFull: queue_limit jobs of this priority are already waiting
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority {priority!r}")
+        queue = self._queues[priority]
+        device_id = device_id or ""
+        future = asyncio.get_running_loop().create_future()
+
+        stale = queue.live_job.get(device_id) if priority == LIVE and device_id else None
+        if stale is not None:
+            # Take the stale frame's place in line instead of queuing behind it
+            stale.cancelled = True
+            queue.waiting -= 1
+            if not stale.future.done():
+                stale.future.set_exception(FrameSuperseded(f"Superseded by a newer frame from {device_id}"))
+            inference_jobs.inc(1, priority, "superseded")
+            finish = stale.finish
+        elif queue.waiting >= self.queue_limit:
+            inference_jobs.inc(1, priority, "rejected")
+            raise SchedulerFull(f"{queue.waiting} {priority} jobs already waiting")
+        else:
+            finish = queue.finish_time(device_id, weight)
+
+        job = _Job(work, priority, device_id, weight, finish, next(self._seq), future)
+        heapq.heappush(queue.heap, job)
+        queue.waiting += 1
+        if priority == LIVE and device_id:
+            queue.live_job[device_id] = job
+        self._dispatch()
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Caller went away (e.g. client disconnected); skip the job if it hasn't started
+            if not job.cancelled and not job.started:
+                job.cancelled = True
+                queue.waiting -= 1
+                if queue.live_job.get(device_id) is job:
+                    del queue.live_job[device_id]
+            raise
+
+    def _next_job(self) -> Optional[_Job]:
+        for priority in PRIORITIES:
+            job = self._queues[priority].pop()
+            if job is not None:
+                return job
+        return None
+
+    def _dispatch(self):
+        while self._running < self.concurrency:
+            job = self._next_job()
+            if job is None:
+                return
+            self._running += 1
+            asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job: _Job):
+        now = time.perf_counter()
+        self._waits.append((now, now - job.submitted))
+        metrics.record_stage(f"queue_{job.priority}", now - job.submitted)
+        try:
+            result = await job.work()
+        except BaseException as e:
+            inference_jobs.inc(1, job.priority, "failed")
+            if not job.future.done():
+                job.future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            inference_jobs.inc(1, job.priority, "done")
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running -= 1
+            self._dispatch()
+
+    def queue_wait(self, window: float = 5.0, quantile: float = 0.9) -> float:
+        """
+        Recent queueing delay in seconds
+
+        The `quantile` of waits of jobs started in the last `window` seconds,
+        or the wait of the oldest job still queued if that is longer (so a
+        stalled model shows up before anything completes).
+        """
+        now = time.perf_counter()
+        waits = sorted(wait for started, wait in self._waits if now - started <= window)
+        recent = waits[min(int(len(waits) * quantile), len(waits) - 1)] if waits else 0.0
+        oldest = min(
+            (job.submitted for queue in self._queues.values() for job in queue.heap if not job.cancelled),
+            default=now
+        )
+        return max(recent, now - oldest)
+
+    def queue_depths(self) -> Dict[Tuple[str], float]:
+        return {(priority,): float(queue.waiting) for priority, queue in self._queues.items()}
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._running,
+            "concurrency": self.concurrency,
+            "waiting": {priority: queue.waiting for priority, queue in self._queues.items()},
+            "devices_waiting": {
+                priority: len({job.device_id for job in queue.heap if not job.cancelled})
+                for priority, queue in self._queues.items()
+            }
+        }
+
+
+# Global instance
+inference_scheduler = InferenceScheduler(
+    concurrency=settings.inference_concurrency,
+    queue_limit=settings.inference_queue_limit
+)
+
+metrics.gauge("snc_inference_scheduler_waiting", "Inference jobs waiting for the model per priority class",
+              inference_scheduler.queue_depths, ("priority",))
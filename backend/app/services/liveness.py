@@ -0,0 +1,240 @@
+"""
+Device liveness monitor
+Expires device heartbeats with a hashed timing wheel so devices that stop
+reporting move to stale/offline without ever scanning the whole fleet
+"""
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+import math
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+ONLINE = "online"
+STALE = "stale"
+OFFLINE = "offline"
+
+TransitionListener = Callable[[Dict], None]
+SilenceProbe = Callable[[str], Optional[float]]
+DeviceDiscovery = Callable[[], Iterable[str]]
+
+
+class LivenessMonitor:
+    """
+    Tracks device heartbeats and emits online/stale/offline transitions
+
+    A heartbeat only records the time it was seen, so it is O(1) and never
+    touches the wheel for a device that is already scheduled. When a wheel
+    slot comes due, each device in it is checked against its real deadline:
+    devices that heartbeated since are re-armed, the rest transition.
+
+    With a silence probe (several workers sharing device records), stale
+    and offline devices are re-checked every `recheck_interval` seconds, so
+    heartbeats received by other workers bring them back online here too.
+    """
+
+    def __init__(self, stale_after: float = 30.0, offline_after: float = 120.0,
+                 tick: float = 1.0, max_events: int = 1000, recheck_interval: float = 10.0):
+        self.stale_after = stale_after
+        self.offline_after = offline_after
+        self.recheck_interval = recheck_interval
+        self.tick = tick
+        self.wheel_size = int(math.ceil(max(stale_after, offline_after) / tick)) + 2
+        self._wheel: List[Set[str]] = [set() for _ in range(self.wheel_size)]
+        self._current_tick = self._tick_of(time.monotonic())
+
+        self._last_seen: Dict[str, float] = {}
+        self._state: Dict[str, str] = {}
+        self._scheduled: Set[str] = set()
+        self.counts: Dict[str, int] = {ONLINE: 0, STALE: 0, OFFLINE: 0}
+
+        self.events: Deque[Dict] = deque(maxlen=max_events)
+        self._listeners: List[TransitionListener] = []
+        # Optional lookup of seconds since a device's last heartbeat in shared
+        # state, so heartbeats received by other workers are honoured
+        self.silence_probe: Optional[SilenceProbe] = None
+        # Optional lookup of devices changed in shared state since the last
+        # call, so devices registered by other workers are tracked too
+        self.discover: Optional[DeviceDiscovery] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: TransitionListener):
+        """Register a callback invoked with every transition event"""
+        self._listeners.append(listener)
+
+    def track(self, device_id: str):
+        """Start monitoring a device (counts as a heartbeat)"""
+        if device_id not in self._state:
+            self._state[device_id] = ONLINE
+            self.counts[ONLINE] += 1
+        self.heartbeat(device_id)
+
+    def untrack(self, device_id: str):
+        """Stop monitoring a device"""
+        state = self._state.pop(device_id, None)
+        if state is not None:
+            self.counts[state] -= 1
+        self._last_seen.pop(device_id, None)
+        # Any wheel entry is dropped lazily when its slot comes due
+
+    def heartbeat(self, device_id: str, now: Optional[float] = None):
+        """Record a heartbeat; O(1)"""
+        now = time.monotonic() if now is None else now
+        self._last_seen[device_id] = now
+
+        if self._state.get(device_id, ONLINE) != ONLINE:
+            self._transition(device_id, ONLINE)
+        if device_id not in self._scheduled:
+            self._schedule(device_id, now + self.stale_after)
+
+    def state_of(self, device_id: str) -> Optional[str]:
+        """Current liveness state of a device"""
+        return self._state.get(device_id)
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """
+        Process all wheel slots that came due up to now
+
+        Returns:
+            Number of transitions emitted
+        """
+        now = time.monotonic() if now is None else now
+        target = self._tick_of(now)
+        transitions = 0
+
+        # After a long stall every slot only needs visiting once
+        steps = min(target - self._current_tick, self.wheel_size)
+        self._current_tick = max(self._current_tick, target - steps)
+
+        for _ in range(steps):
+            self._current_tick += 1
+            slot = self._wheel[self._current_tick % self.wheel_size]
+            due = list(slot)
+            slot.clear()
+            self._scheduled.difference_update(due)
+            for device_id in due:
+                transitions += self._expire(device_id, now)
+
+        return transitions
+
+    def fleet_counts(self) -> Dict:
+        """Number of devices in each liveness state"""
+        return {
+            **self.counts,
+            "total": len(self._state)
+        }
+
+    def recent_events(self, limit: int = 50) -> List[Dict]:
+        """Most recent transition events, newest last"""
+        if limit <= 0:
+            return []
+        return list(self.events)[-limit:]
+
+    def start(self):
+        """Start the background sweeper on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background sweeper"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                if self.discover is not None:
+                    for device_id in self.discover():
+                        if device_id not in self._state:
+                            self.track(device_id)
+                self.advance()
+            except Exception as e:
+                logger.error(f"Liveness sweep failed: {e}")
+
+    def _expire(self, device_id: str, now: float) -> int:
+        last_seen = self._last_seen.get(device_id)
+        if last_seen is None:
+            return 0  # untracked since it was scheduled
+
+        silent_for = now - last_seen
+        if self.silence_probe is not None and silent_for >= self.stale_after:
+            probed = self.silence_probe(device_id)
+            if probed is not None and probed < silent_for:
+                silent_for = probed
+                last_seen = now - probed
+                self._last_seen[device_id] = last_seen
+        state = self._state[device_id]
+
+        if silent_for < self.stale_after:
+            self._schedule(device_id, last_seen + self.stale_after)
+            if state != ONLINE:
+                # Its heartbeats reached another worker
+                self._transition(device_id, ONLINE)
+                return 1
+            return 0
+        if silent_for < self.offline_after:
+            self._schedule(device_id, self._recheck(last_seen + self.offline_after, now))
+            if state != STALE:
+                self._transition(device_id, STALE)
+                return 1
+            return 0
+        if self.silence_probe is not None:
+            self._schedule(device_id, now + self.recheck_interval)
+        if state != OFFLINE:
+            self._transition(device_id, OFFLINE)
+            return 1
+        return 0
+
+    def _recheck(self, deadline: float, now: float) -> float:
+        """Deadline, brought forward to the next re-check when other workers may see heartbeats"""
+        if self.silence_probe is None:
+            return deadline
+        return min(deadline, now + self.recheck_interval)
+
+    def _schedule(self, device_id: str, deadline: float):
+        tick = max(self._tick_of(deadline), self._current_tick + 1)
+        self._wheel[tick % self.wheel_size].add(device_id)
+        self._scheduled.add(device_id)
+
+    def _tick_of(self, t: float) -> int:
+        return int(math.ceil(t / self.tick))
+
+    def _transition(self, device_id: str, new_state: str):
+        old_state = self._state.get(device_id)
+        self._state[device_id] = new_state
+        if old_state is not None:
+            self.counts[old_state] -= 1
+        self.counts[new_state] += 1
+
+        event = {
+            "device_id": device_id,
+            "from": old_state,
+            "to": new_state,
+            "timestamp": datetime.utcnow()
+        }
+        self.events.append(event)
+        logger.debug(f"Device {device_id} is now {new_state} (was {old_state})")
+
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Liveness listener failed: {e}")
+
+
+# Global instance
+liveness_monitor = LivenessMonitor(
+    stale_after=settings.heartbeat_stale_after,
+    offline_after=settings.heartbeat_offline_after
+)
@@ -0,0 +1,292 @@
+"""
+Metrics service
+Latency histograms, counters and gauges rendered in the Prometheus text
+exposition format
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import logging
+import threading
+import time
+
+from app.services.profiler import current_trace
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from 1 ms to 30 s
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5,
+    0.75, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram with interpolated quantiles"""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelValues, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        """Record one observation"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [bucket counts (+Inf last), sum, count]
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        series = self._series.get(labels)
+        if series is None or series[2] == 0:
+            return None
+
+        rank = q * series[2]
+        cumulative = 0
+        lower = 0.0
+        for i, count in enumerate(series[0]):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if cumulative + count >= rank and count:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[LabelValues, Dict]:
+        """Count, sum and quantiles per label set"""
+        return {
+            labels: {
+                "count": series[2],
+                "sum": series[1],
+                **{f"p{int(q * 100)}": self.quantile(q, *labels) for q in QUANTILES}
+            }
+            for labels, series in list(self._series.items())
+        }
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[0]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_str = _format_labels(self.label_names, labels, f'le="{le}"')
+                yield f"{self.name}_bucket{label_str} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {series[1]}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {series[2]}"
+
+        # Quantiles as a companion gauge so dashboards don't need histogram_quantile()
+        quantile_name = f"{self.name}_quantile"
+        yield f"# HELP {quantile_name} Estimated quantiles of {self.name}"
+        yield f"# TYPE {quantile_name} gauge"
+        for labels in list(self._series):
+            for q in QUANTILES:
+                value = self.quantile(q, *labels)
+                if value is not None:
+                    label_str = _format_labels(self.label_names, labels, f'quantile="{q}"')
+                    yield f"{quantile_name}{label_str} {value}"
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name: str, help: str, callback: Callable[[], GaugeValue],
+                 label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.label_names = tuple(label_names)
+
+    def render(self) -> Iterator[str]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return
+        if value is None:
+            return
+
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                yield f"{self.name}{_format_labels(self.label_names, labels)} {float(v)}"
+        else:
+            yield f"{self.name} {float(value)}"
+
+
+class MetricsRegistry:
+    """Holds every metric and renders the /metrics payload"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Histogram, Counter, Gauge]] = {}
+        self.stage_latency = self.histogram(
+            "snc_stage_latency_seconds",
+            "Latency of pipeline stages (decode, inference, tts, ...)",
+            ("stage",)
+        )
+        self.http_latency = self.histogram(
+            "snc_http_request_duration_seconds",
+            "HTTP request latency by route",
+            ("method", "route", "status")
+        )
+
+    def histogram(self, name: str, help: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, label_names, buckets))
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, callback: Callable[[], GaugeValue],
+              label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, callback, label_names))
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time a block into the stage latency histogram"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - started)
+
+    def record_stage(self, stage: str, seconds: float):
+        """Observe a stage duration, adding it to the request trace when one is active"""
+        self.stage_latency.observe(seconds, stage)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+    def timings(self) -> "StageTimings":
+        """Start collecting the stages of one pipeline run"""
+        return StageTimings(self)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+
+class StageTimings:
+    """Stage durations of one pipeline run, also fed to the registry"""
+
+    def __init__(self, registry: "MetricsRegistry"):
+        self.registry = registry
+        self.seconds: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.registry.record_stage(name, seconds)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def as_ms(self) -> Dict[str, float]:
+        return {name: round(s * 1000, 3) for name, s in self.seconds.items()}
+
+
+def route_template(scope) -> str:
+    """Request path with path parameters put back as {name}, to bound label cardinality"""
+    if "route" not in scope and "endpoint" not in scope:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template"""
+
+    def __init__(self, app, registry: "MetricsRegistry"):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.registry.http_latency.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route_template(scope),
+                str(status_code)
+            )
+
+
+# Global instance
+metrics = MetricsRegistry()
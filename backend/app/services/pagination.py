@@ -0,0 +1,148 @@
+"""
+Cursor pagination
+Opaque keyset cursors over a storage Collection's ordered indexes, and the
+query parameters and response headers shared by the list endpoints
+"""
+from datetime import datetime
+from typing import Annotated, Any, Callable, List, Optional, Tuple
+import base64
+
+from fastapi import HTTPException, Query, Request
+
+from app.services.http_cache import make_etag, not_modified, with_validators
+from app.services.serialization import dumps, json_response, loads
+from app.services.storage import SYNC_SLACK_SECONDS, Collection
+
+PAGE_LIMIT_DEFAULT = 100
+PAGE_LIMIT_MAX = 1000
+
+Limit = Annotated[int, Query(ge=1, le=PAGE_LIMIT_MAX, description="Maximum records per page")]
+Cursor = Annotated[Optional[str], Query(
+    description="X-Next-Cursor header of the previous page; omit for the first page"
+)]
+Since = Annotated[Optional[str], Query(
+    description="X-Sync-Cursor header of an earlier response; returns only records "
+                "changed since then, in the order they changed"
+)]
+CreatedFrom = Annotated[Optional[datetime], Query(description="Only records created at or after this time")]
+CreatedBefore = Annotated[Optional[datetime], Query(description="Only records created before this time")]
+
+
+def encode_cursor(kind: str, position: tuple) -> str:
+    """Opaque cursor for an index position ("c" creation order, "u" change order)"""
+    return base64.urlsafe_b64encode(dumps([kind, *position])).decode().rstrip("=")
+
+
+def decode_cursor(token: str, kind: str) -> tuple:
+    """Position encoded in a cursor; 400 if it is malformed or of another kind"""
+    try:
+        value = loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if value[0] == kind and len(value) in (3, 4):
+            return tuple(value[1:])
+    except (ValueError, TypeError, IndexError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_sync_cursor(collection: Collection, position: tuple) -> str:
+    """Change-order cursor, tagged with the worker whose change clock it is on"""
+    return encode_cursor("u", (*position[:2], collection.storage.instance))
+
+
+def decode_sync_cursor(collection: Collection, token: str) -> tuple:
+    """
+    Position in this worker's change order to resume a sync after
+
+    Cursors from another worker (or from before a restart) are on another
+    change clock: rows that worker had not seen yet may sit slightly behind
+    the position here, so the sync resumes SYNC_SLACK_SECONDS earlier.
+    Records may repeat; none are skipped.
+    """
+    changed, key, *instance = decode_cursor(token, "u")
+    if not isinstance(changed, (int, float)) or not isinstance(key, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if instance != [collection.storage.instance]:
+        return (changed - SYNC_SLACK_SECONDS, "")
+    return (changed, key)
+
+
+def matches_any(field: str, values: Optional[str]) -> Optional[Callable[[Any], bool]]:
+    """Filter on a field against a comma-separated list of accepted values"""
+    if not values:
+        return None
+    accepted = {value.strip() for value in values.split(",")}
+    return lambda record: record.get(field) in accepted
+
+
+def status_filter(status: Optional[str], since: Optional[str],
+                  default: str = "active") -> Optional[Callable[[Any], bool]]:
+    """
+    Filter on status ("all" for none)
+
+    Listings default to `default`; incremental syncs don't, so clients see
+    records leave that status.
+    """
+    if status is None:
+        status = None if since is not None else default
+    if status == "all":
+        return None
+    return matches_any("status", status)
+
+
+def all_of(*predicates: Optional[Callable[[Any], bool]]) -> Optional[Callable[[Any], bool]]:
+    """Combine filters, ignoring unset ones"""
+    active: List[Callable[[Any], bool]] = [p for p in predicates if p is not None]
+    if not active:
+        return None
+    if len(active) == 1:
+        return active[0]
+    return lambda record: all(p(record) for p in active)
+
+
+def paginate(request: Request, collection: Collection, limit: int = PAGE_LIMIT_DEFAULT,
+             cursor: Optional[str] = None, since: Optional[str] = None,
+             where: Optional[Callable[[Any], bool]] = None,
+             created_from: Optional[datetime] = None, created_before: Optional[datetime] = None,
+             newest_first: bool = False, fields: Optional[str] = None,
+             partition: Optional[Tuple[str, Any]] = None):
+    """
+    One page of a collection as a JSON array response
+
+    Without `since`, records are listed in creation order starting after
+    `cursor`; X-Next-Cursor is set when more records follow and
+    X-Sync-Cursor marks the latest change seen. With `since`, records
+    changed after that point are listed in change order and X-Sync-Cursor
+    advances past the last one examined. `partition` lists one
+    partition_by index of the collection (e.g. one device's records).
+
+    Responses carry an ETag from the collection's version and the query, so
+    polling an unchanged listing costs a 304.
+    """
+    etag = make_etag(collection.name, collection.version, request.url.query)
+    cached = not_modified(request, etag, collection.last_modified)
+    if cached is not None:
+        return cached
+
+    if since is not None:
+        after = decode_sync_cursor(collection, since)
+        items, resume, more = collection.changes(after, limit, where)
+        headers = {"X-Sync-Cursor": encode_sync_cursor(collection, resume or after)}
+        if more:
+            headers["X-Next-Cursor"] = headers["X-Sync-Cursor"]
+    else:
+        high_water = collection.high_water()
+        items, resume, more = collection.page(
+            decode_cursor(cursor, "c") if cursor else None, limit, where,
+            created_from.isoformat() if created_from else None,
+            created_before.isoformat() if created_before else None,
+            newest_first, partition
+        )
+        headers = {}
+        if more:
+            headers["X-Next-Cursor"] = encode_cursor("c", resume)
+        if high_water is not None:
+            headers["X-Sync-Cursor"] = encode_sync_cursor(collection, high_water)
+
+    response = json_response(items, fields=fields)
+    response.headers.update(headers)
+    return with_validators(response, etag, collection.last_modified)
@@ -0,0 +1,271 @@
+"""
+Profiling service
+Sampling profiles exported as collapsed stacks, tracemalloc snapshots and
+per-request stage traces for investigating latency and memory in production
+"""
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+import asyncio
+import hmac
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Set only while a traced request runs; stage timers add spans to it
+current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a sampling profile is already running"""
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler over every thread of the worker
+
+    A background thread reads sys._current_frames() at a fixed interval and
+    counts each distinct stack. Nothing is hooked into the interpreter, so
+    the cost is confined to the profiling window.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, seconds: float, interval: float = 0.005) -> Counter:
+        """
+        Sample all threads for the given duration (blocking)
+
+        Returns:
+            Counter of collapsed stacks ("thread;outer;...;inner") to sample counts
+
+        Raises:
+            ProfilerBusyError: Another profile is in progress
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running")
+
+        try:
+            own_id = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks: Counter = Counter()
+            deadline = time.perf_counter() + seconds
+
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self._lock.release()
+
+    async def profile(self, seconds: float, interval: float = 0.005) -> Counter:
+        """Sample from a worker thread so the event loop keeps serving (and gets sampled)"""
+        return await asyncio.to_thread(self.sample, seconds, interval)
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        parts.append(thread_name.replace(";", "_").replace(" ", "_"))
+        return ";".join(reversed(parts))
+
+
+def render_collapsed(stacks: Counter) -> str:
+    """Brendan Gregg's collapsed format, as read by flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class MemoryProfiler:
+    """tracemalloc snapshots with a diff against the previous snapshot"""
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        """Start tracing allocations (adds overhead to every allocation until stopped)"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._previous = None
+            logger.info(f"tracemalloc started ({frames} frames)")
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._previous = None
+            logger.info("tracemalloc stopped")
+
+    def snapshot(self, limit: int = 20) -> Dict:
+        """
+        Take a snapshot and log the top allocation sites
+
+        Returns:
+            Current/peak traced memory, top sites by size and the largest growth
+            since the previous snapshot
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+
+        top = [
+            {"site": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+        growth: List[Dict] = []
+        if self._previous is not None:
+            growth = [
+                {
+                    "site": str(stat.traceback[0]),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count_diff": stat.count_diff
+                }
+                for stat in snapshot.compare_to(self._previous, "lineno")[:limit]
+            ]
+        self._previous = snapshot
+
+        logger.info(f"tracemalloc: {current / 1e6:.1f} MB traced, {peak / 1e6:.1f} MB peak")
+        for entry in growth[:5] or top[:5]:
+            logger.info(f"tracemalloc: {entry}")
+
+        return {
+            "traced_mb": round(current / 1e6, 2),
+            "peak_mb": round(peak / 1e6, 2),
+            "top": top,
+            "growth": growth
+        }
+
+
+class RequestTrace:
+    """Stage spans recorded while one request is handled"""
+
+    __slots__ = ("trace_id", "method", "path", "started_at", "spans", "total_ms", "status")
+
+    def __init__(self, trace_id: str, method: str, path: str):
+        self.trace_id = trace_id
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.spans: List[tuple] = []
+        self.total_ms: Optional[float] = None
+        self.status: Optional[int] = None
+
+    def add(self, name: str, seconds: float):
+        self.spans.append((name, seconds * 1000))
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, shown by browser dev tools"""
+        entries = [f"{name};dur={ms:.2f}" for name, ms in self.spans]
+        if self.total_ms is not None:
+            entries.append(f"total;dur={self.total_ms:.2f}")
+        return ", ".join(entries)
+
+    def as_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "status": self.status,
+            "total_ms": self.total_ms,
+            "spans": [{"stage": name, "ms": round(ms, 3)} for name, ms in self.spans]
+        }
+
+
+class TraceLog:
+    """Most recent request traces of this worker"""
+
+    def __init__(self, max_traces: int = 200):
+        self._traces: Deque[RequestTrace] = deque(maxlen=max_traces)
+
+    def add(self, trace: RequestTrace):
+        self._traces.append(trace)
+
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        for trace in self._traces:
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+    def recent(self, limit: int = 50) -> List[RequestTrace]:
+        return list(self._traces)[-limit:][::-1]
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware tracing requests that carry the debug header
+
+    The header value must equal the admin token. Traced responses get a
+    Server-Timing header with every stage span and an X-Trace-Id that can be
+    looked up under /api/debug/traces.
+    """
+
+    HEADER = b"x-debug-trace"
+
+    def __init__(self, app, token: Optional[str], log: "TraceLog"):
+        self.app = app
+        self.token = token.encode() if token else None
+        self.log = log
+        self._ids = itertools.count(1)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.token is None or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(f"{os.getpid()}-{next(self._ids)}", scope["method"], scope["path"])
+        token = current_trace.set(trace)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                trace.total_ms = (time.perf_counter() - started) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode()))
+                headers.append((b"x-trace-id", trace.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            if trace.total_ms is None:
+                trace.total_ms = (time.perf_counter() - started) * 1000
+            self.log.add(trace)
+
+    def _requested(self, scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == self.HEADER:
+                return hmac.compare_digest(value, self.token)
+        return False
+
+
+# Global instances
+sampling_profiler = SamplingProfiler()
+memory_profiler = MemoryProfiler()
+trace_log = TraceLog()
@@ -0,0 +1,207 @@
+"""
+Adaptive quality control
+Steps detection quality down when inference queueing delay or CPU usage
+climbs and back up once there is headroom, so overload degrades answers
+instead of delaying them
+"""
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+from app.config import settings
+from app.services.inference_scheduler import LIVE, InferenceScheduler, inference_scheduler
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    """What detection does at one degradation level (0 = full quality)"""
+    level: int
+    input_size: int  # model input resolution (longest side)
+    light_model: bool  # use the lighter model variant
+    frame_skip: int  # run 1 of every N live frames per device
+    stream_extras: bool  # annotated image and TTS audio for live (streaming) requests
+
+
+def build_levels(input_size: int) -> tuple:
+    """Degradation ladder: cheapest savings first, model swap last"""
+    return (
+        QualityLevel(0, input_size, False, 1, True),
+        QualityLevel(1, input_size, False, 1, False),
+        QualityLevel(2, max(input_size * 3 // 4 // 32 * 32, 160), False, 2, False),
+        QualityLevel(3, max(input_size // 2 // 32 * 32, 160), False, 2, False),
+        QualityLevel(4, max(input_size // 2 // 32 * 32, 160), True, 3, False),
+    )
+
+
+class CpuSampler:
+    """Machine-wide CPU utilization between calls (process CPU where /proc is unavailable)"""
+
+    def __init__(self):
+        self._last = self._read()
+
+    @staticmethod
+    def _read():
+        try:
+            with open("/proc/stat") as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+            idle = values[3] + (values[4] if len(values) > 4 else 0)
+            return ("system", sum(values), idle)
+        except (OSError, ValueError, IndexError):
+            return ("process", time.monotonic(), time.process_time())
+
+    def sample(self) -> float:
+        current, previous = self._read(), self._last
+        self._last = current
+        if current[0] != previous[0]:
+            return 0.0
+        if current[0] == "system":
+            total = current[1] - previous[1]
+            return 1.0 - (current[2] - previous[2]) / total if total > 0 else 0.0
+        wall = current[1] - previous[1]
+        busy = current[2] - previous[2]
+        return busy / wall / (os.cpu_count() or 1) if wall > 0 else 0.0
+
+
+class QualityController:
+    """
+    Control loop choosing the quality level
+
+    Every `interval` seconds it reads the scheduler's recent queueing delay
+    and CPU utilization. It steps down one level after `down_after`
+    consecutive pressured ticks (wait or CPU above the high marks) and up
+    one level after `up_after` consecutive calm ticks (both below the low
+    marks). The gap between the marks and the longer wait before stepping
+    up are the hysteresis that keeps it from oscillating.
+
+    Live requests are never queued longer or dropped by this controller;
+    skipped live frames are answered with the device's latest result, so
+    hazard detections keep flowing at the frame rate the node can sustain.
+    """
+
+    def __init__(self, scheduler: InferenceScheduler, levels: tuple, interval: float = 1.0,
+                 wait_high: float = 0.5, wait_low: float = 0.15, cpu_high: float = 0.9,
+                 cpu_low: float = 0.6, down_after: int = 2, up_after: int = 10,
+                 cpu: Optional[Callable[[], float]] = None):
+        self.scheduler = scheduler
+        self.levels = levels
+        self.interval = interval
+        self.wait_high = wait_high
+        self.wait_low = wait_low
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.down_after = down_after
+        self.up_after = up_after
+        self._cpu = cpu or CpuSampler().sample
+        self.current: QualityLevel = levels[0]
+        self.last_wait = 0.0
+        self.last_cpu = 0.0
+        self._pressured = 0
+        self._calm = 0
+        self._frames: Dict[str, int] = {}  # device id -> live frames seen, for frame skipping
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def level(self) -> int:
+        return self.current.level
+
+    def tick(self):
+        """Take one reading and move at most one level"""
+        self.last_wait = self.scheduler.queue_wait(window=max(self.interval * 5, 5.0))
+        self.last_cpu = self._cpu()
+        pressured = self.last_wait > self.wait_high or self.last_cpu > self.cpu_high
+        calm = self.last_wait < self.wait_low and self.last_cpu < self.cpu_low
+
+        self._pressured = self._pressured + 1 if pressured else 0
+        self._calm = self._calm + 1 if calm else 0
+        if self._pressured >= self.down_after and self.level < len(self.levels) - 1:
+            self._set(self.level + 1)
+        elif self._calm >= self.up_after and self.level > 0:
+            self._set(self.level - 1)
+
+    def _set(self, level: int):
+        previous, self.current = self.current, self.levels[level]
+        self._pressured = self._calm = 0
+        if self.current.frame_skip <= 1:
+            self._frames.clear()
+        logger.info(
+            f"Quality level {previous.level} -> {level} "
+            f"(queue wait {self.last_wait * 1000:.0f} ms, cpu {self.last_cpu:.0%})"
+        )
+
+    def skip_frame(self, device_id: str) -> bool:
+        """Whether to skip this live frame of a device under the current frame-skip ratio"""
+        skip = self.current.frame_skip
+        if skip <= 1:
+            return False
+        seen = self._frames.get(device_id, 0)
+        self._frames[device_id] = seen + 1
+        return seen % skip != 0
+
+    def options(self, priority: str) -> Dict:
+        """Detection options for a request of this priority at the current level"""
+        current = self.current
+        extras = current.stream_extras or priority != LIVE
+        return {
+            "input_size": current.input_size,
+            "light_model": current.light_model,
+            "annotate": extras,
+            "speak": extras
+        }
+
+    def describe(self) -> Dict:
+        return {**asdict(self.current), "max_level": len(self.levels) - 1}
+
+    def stats(self) -> Dict:
+        return {
+            **self.describe(),
+            "queue_wait_ms": round(self.last_wait * 1000, 1),
+            "cpu": round(self.last_cpu, 3)
+        }
+
+    def start(self):
+        """Start the control loop on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the control loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Quality control tick failed: {e}")
+
+
+# Global instance
+quality_controller = QualityController(
+    inference_scheduler,
+    build_levels(settings.model_input_size),
+    interval=settings.quality_interval,
+    wait_high=settings.quality_wait_high,
+    wait_low=settings.quality_wait_low,
+    cpu_high=settings.quality_cpu_high,
+    cpu_low=settings.quality_cpu_low
+)
+
+metrics.gauge("snc_quality_level", "Current detection quality level (0 = full quality)",
+              lambda: quality_controller.level)
+metrics.gauge("snc_quality_input_size", "Model input size at the current quality level",
+              lambda: quality_controller.current.input_size)
+metrics.gauge("snc_quality_frame_skip", "Live frames per device per inference at the current quality level",
+              lambda: quality_controller.current.frame_skip)
@@ -0,0 +1,264 @@
+"""
+Internal record types
+Compact __slots__ records for hot-path state (routes, devices, alerts, frames)
+and an array-backed waypoint polyline. Pydantic models stay at the API edge;
+these are what the routers, services and storage hold in memory.
+"""
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+LatLon = Tuple[float, float]
+
+
+class Waypoints:
+    """
+    Route polyline stored as interleaved float64 lat/lon pairs
+
+    One contiguous array per route instead of a list of dicts: ~16 bytes per
+    waypoint and cheap to copy.
+    """
+
+    __slots__ = ("_coords",)
+
+    def __init__(self, coords: Iterable[float] = ()):
+        self._coords = array("d", coords)
+
+    @classmethod
+    def of(cls, points: Iterable[LatLon]) -> "Waypoints":
+        """Build from (latitude, longitude) pairs"""
+        waypoints = cls()
+        for lat, lon in points:
+            waypoints._coords.append(lat)
+            waypoints._coords.append(lon)
+        return waypoints
+
+    @classmethod
+    def from_list(cls, items: Optional[List[Dict]]) -> Optional["Waypoints"]:
+        """Build from the API/storage form, a list of {latitude, longitude} dicts"""
+        if items is None:
+            return None
+        return cls.of((item["latitude"], item["longitude"]) for item in items)
+
+    def __len__(self) -> int:
+        return len(self._coords) // 2
+
+    def __getitem__(self, index: int) -> LatLon:
+        if index < 0:
+            index += len(self)
+        return self._coords[2 * index], self._coords[2 * index + 1]
+
+    def __iter__(self) -> Iterator[LatLon]:
+        coords = iter(self._coords)
+        return zip(coords, coords)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Waypoints) and self._coords == other._coords
+
+    def set(self, index: int, lat: float, lon: float):
+        if index < 0:
+            index += len(self)
+        self._coords[2 * index] = lat
+        self._coords[2 * index + 1] = lon
+
+    def insert(self, index: int, lat: float, lon: float):
+        self._coords[2 * index:2 * index] = array("d", (lat, lon))
+
+    def segments(self) -> Iterator[Tuple[float, float, float, float]]:
+        """Consecutive (lat1, lon1, lat2, lon2) edges"""
+        c = self._coords
+        for i in range(0, len(c) - 2, 2):
+            yield c[i], c[i + 1], c[i + 2], c[i + 3]
+
+    def copy(self) -> "Waypoints":
+        return Waypoints(self._coords)
+
+    def to_list(self) -> List[Dict]:
+        return [{"latitude": lat, "longitude": lon} for lat, lon in self]
+
+
+def to_plain(value: Any) -> Any:
+    """Convert records and waypoints (recursively) to JSON-ready builtins"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, Waypoints):
+        return value.to_list()
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    return value
+
+
+class Record:
+    """
+    Base for slotted records
+
+    Subclasses list their fields in __slots__, defaults in DEFAULTS (callables
+    are factories for mutable defaults) and nested types in CONVERTERS, used
+    when loading the dict form back. OMIT_NONE drops unset fields from the
+    dict form for records whose shape varies by source.
+    """
+
+    __slots__ = ()
+    DEFAULTS: Dict[str, Any] = {}
+    CONVERTERS: Dict[str, Callable[[Any], Any]] = {}
+    OMIT_NONE = False
+
+    def __init__(self, **values):
+        defaults = self.DEFAULTS
+        for name in self.__slots__:
+            if name in values:
+                value = values[name]
+            else:
+                value = defaults.get(name)
+                if callable(value):
+                    value = value()
+            setattr(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Record":
+        """Build from the dict form; unknown keys are ignored"""
+        converters = cls.CONVERTERS
+        values = {}
+        for name in cls.__slots__:
+            if name in data:
+                value = data[name]
+                if value is not None and name in converters:
+                    value = converters[name](value)
+                values[name] = value
+        return cls(**values)
+
+    def update_from(self, data: Dict):
+        """Replace every field in place from the dict form"""
+        fresh = self.from_dict(data)
+        for name in self.__slots__:
+            setattr(self, name, getattr(fresh, name))
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Dict-style read, used by generic code such as storage indexing"""
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def to_dict(self) -> Dict:
+        if self.OMIT_NONE:
+            return {
+                name: to_plain(value) for name in self.__slots__
+                if (value := getattr(self, name)) is not None
+            }
+        return {name: to_plain(getattr(self, name)) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__[:2])
+        return f"{type(self).__name__}({fields}, ...)"
+
+
+class GeoPoint(Record):
+    """A GPS fix, mirroring app.models.GPSLocation"""
+
+    __slots__ = ("latitude", "longitude", "altitude", "accuracy", "heading", "speed")
+
+    @classmethod
+    def from_model(cls, location) -> "GeoPoint":
+        """Copy a GPSLocation without a pydantic dump"""
+        return cls(
+            latitude=location.latitude, longitude=location.longitude,
+            altitude=location.altitude, accuracy=location.accuracy,
+            heading=location.heading, speed=location.speed
+        )
+
+
+class RouteState(Record):
+    """An active or completed navigation route"""
+
+    __slots__ = (
+        "route_id", "session_id", "origin", "destination", "profile", "instructions",
+        "distance_remaining", "duration_remaining", "current_step", "waypoints", "status",
+        "guidance_version", "created_at", "completed_at", "current_location",
+        "avoided_alerts", "pending_updates"
+    )
+    DEFAULTS = {
+        "profile": "walking",
+        "instructions": list,
+        "current_step": 0,
+        "status": "active",
+        "guidance_version": 0,
+        "avoided_alerts": list,
+        "pending_updates": list
+    }
+    CONVERTERS = {
+        "origin": GeoPoint.from_dict,
+        "destination": GeoPoint.from_dict,
+        "current_location": GeoPoint.from_dict,
+        "waypoints": Waypoints.from_list
+    }
+
+
+class DeviceState(Record):
+    """A registered Arduino, ESP32-CAM or mobile device"""
+
+    __slots__ = (
+        "device_id", "device_type", "registered_at", "last_heartbeat", "connectivity",
+        "connectivity_changed_at", "battery_level", "active_sensors", "errors", "metadata"
+    )
+    DEFAULTS = {
+        "connectivity": "online",
+        "battery_level": 100,
+        "active_sensors": list,
+        "errors": list,
+        "metadata": dict
+    }
+
+
+class AlertState(Record):
+    """An obstacle or hazard alert"""
+
+    __slots__ = (
+        "alert_id", "timestamp", "alert_type", "severity", "description", "location",
+        "detected_objects", "status", "rerouted_routes", "resolved_at", "report_count",
+        "confidence", "last_reported", "reporters", "merged_into"
+    )
+    DEFAULTS = {
+        "detected_objects": list,
+        "status": "active",
+        "rerouted_routes": list,
+        "report_count": 1,
+        "reporters": list
+    }
+    CONVERTERS = {"location": GeoPoint.from_dict}
+
+
+class SceneObjectState(Record):
+    """A static hazard remembered at a location (see app.services.scene_memory)"""
+
+    __slots__ = ("object_id", "label", "location", "cell", "score", "sightings", "last_seen", "created_at")
+    DEFAULTS = {"sightings": 0, "score": 0.0}
+    CONVERTERS = {"location": GeoPoint.from_dict}
+
+
+class DetectedObjectState(Record):
+    """One detected object, mirroring app.models.DetectedObject"""
+
+    __slots__ = ("object_id", "label", "confidence", "bbox", "distance", "position")
+
+    @classmethod
+    def from_model(cls, obj) -> "DetectedObjectState":
+        return cls(
+            object_id=obj.object_id, label=obj.label, confidence=obj.confidence,
+            bbox=obj.bbox, distance=obj.distance, position=obj.position
+        )
+
+
+def _objects_from_list(items: List[Dict]) -> List[DetectedObjectState]:
+    return [DetectedObjectState.from_dict(item) for item in items]
+
+
+class FrameState(Record):
+    """A camera frame upload and/or its detection results"""
+
+    __slots__ = (
+        "frame_id", "device_id", "timestamp", "frame_path", "image_path", "image_info",
+        "metadata", "status", "objects", "frame_size", "processing_time_ms", "stored_at"
+    )
+    DEFAULTS = {"objects": list}
+    CONVERTERS = {"objects": _objects_from_list}
+    OMIT_NONE = True
@@ -0,0 +1,152 @@
+"""
+Obstacle-aware rerouting service
+Keeps a spatial index of active route paths so new high-severity obstacle
+alerts only recompute the routes that actually pass by them
+"""
+from datetime import datetime
+from typing import Dict, List, Set
+import logging
+
+from app.services.geo import (
+    geohash_encode, geohash_neighbors, point_segment_distance_m, polyline_cells
+)
+from app.services.metrics import metrics
+from app.services.records import AlertState, GeoPoint, RouteState
+from app.services.routing import (
+    INVALIDATION_RADIUS_M, SNAP_PRECISION, RoutingService, routing_service
+)
+
+logger = logging.getLogger(__name__)
+
+REROUTE_SEVERITIES = {"high", "critical"}
+# Guidance updates kept per route for clients that poll for them
+MAX_PENDING_UPDATES = 10
+
+
+class RerouteService:
+    """
+    Reroutes active navigation routes around newly reported obstacles
+
+    Routes are indexed by the geohash cells their remaining path crosses. An
+    alert is joined against the nine cells around it, and only candidates
+    whose segments actually pass within the radius are recomputed.
+    """
+
+    def __init__(self, routing: RoutingService, precision: int = SNAP_PRECISION,
+                 radius_m: float = INVALIDATION_RADIUS_M):
+        self.routing = routing
+        self.precision = precision
+        self.radius_m = radius_m
+        self._routes: Dict[str, RouteState] = {}
+        self._cell_index: Dict[str, Set[str]] = {}
+        self._cells_by_route: Dict[str, Set[str]] = {}
+        self.reroutes = 0
+
+    def track(self, route: RouteState):
+        """Index an active route's path"""
+        route_id = route.route_id
+        self.untrack(route_id)
+        self._routes[route_id] = route
+
+        cells = polyline_cells(route.waypoints, self.precision)
+        self._cells_by_route[route_id] = cells
+        for cell in cells:
+            self._cell_index.setdefault(cell, set()).add(route_id)
+
+    def untrack(self, route_id: str):
+        """Remove a route from the index (completed or cancelled)"""
+        self._routes.pop(route_id, None)
+        for cell in self._cells_by_route.pop(route_id, ()):
+            route_ids = self._cell_index.get(cell)
+            if route_ids is not None:
+                route_ids.discard(route_id)
+                if not route_ids:
+                    del self._cell_index[cell]
+
+    def affected_routes(self, latitude: float, longitude: float) -> List[RouteState]:
+        """Active routes whose path passes within the radius of a location"""
+        candidates: Set[str] = set()
+        for cell in geohash_neighbors(geohash_encode(latitude, longitude, self.precision)):
+            candidates.update(self._cell_index.get(cell, ()))
+
+        affected = []
+        for route_id in candidates:
+            route = self._routes[route_id]
+            for a_lat, a_lon, b_lat, b_lon in route.waypoints.segments():
+                if point_segment_distance_m(latitude, longitude, a_lat, a_lon, b_lat, b_lon) <= self.radius_m:
+                    affected.append(route)
+                    break
+        return affected
+
+    def handle_alert(self, alert: AlertState) -> List[str]:
+        """
+        Reroute active routes affected by an obstacle alert
+
+        Args:
+            alert: Obstacle alert record
+
+        Returns:
+            IDs of the rerouted routes
+        """
+        location = alert.location
+        if alert.severity not in REROUTE_SEVERITIES or location is None:
+            return []
+
+        with metrics.timer("reroute_spatial_join"):
+            affected = self.affected_routes(location.latitude, location.longitude)
+
+        rerouted = []
+        for route in affected:
+            if route.status != "active":
+                self.untrack(route.route_id)
+                continue
+            self._reroute(route, alert)
+            rerouted.append(route.route_id)
+
+        if rerouted:
+            self.reroutes += len(rerouted)
+            logger.info(f"Alert {alert.alert_id} rerouted {len(rerouted)} route(s)")
+        return rerouted
+
+    def _reroute(self, route: RouteState, alert: AlertState):
+        # Kept in the dict form so the route record stays storable as-is
+        route.avoided_alerts.append({"alert_id": alert.alert_id, "location": alert.location.to_dict()})
+
+        start = route.current_location or route.origin
+        plan = self.routing.reroute(
+            start, route.destination, route.profile or "walking",
+            avoid=[GeoPoint.from_dict(a["location"]) for a in route.avoided_alerts]
+        )
+
+        route.instructions = plan["instructions"]
+        route.waypoints = plan["waypoints"]
+        route.distance_remaining = plan["distance"]
+        route.duration_remaining = plan["duration"]
+        route.current_step = 0
+        route.guidance_version += 1
+
+        pending = route.pending_updates
+        pending.append({
+            "guidance_version": route.guidance_version,
+            "reason": "obstacle",
+            "alert_id": alert.alert_id,
+            "description": alert.description,
+            "instructions": plan["instructions"],
+            "distance_remaining": plan["distance"],
+            "timestamp": datetime.utcnow()
+        })
+        del pending[:-MAX_PENDING_UPDATES]
+
+        self.track(route)
+
+    def stats(self) -> Dict:
+        """Index and reroute statistics"""
+        return {
+            "tracked_routes": len(self._routes),
+            "indexed_cells": len(self._cell_index),
+            "reroutes": self.reroutes
+        }
+
+
+# Global instance
+reroute_service = RerouteService(routing_service)
@@ -0,0 +1,273 @@
+"""
+Route planning service
+Computes walking routes and caches them by snapped origin/destination so
+repeated commutes are served without recomputation
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import logging
+import math
+
+from app.services.geo import (
+    geohash_encode, geohash_neighbors, haversine_m, point_segment_distance_m,
+    polyline_cells
+)
+from app.services.metrics import metrics
+from app.services.records import GeoPoint, Waypoints
+
+logger = logging.getLogger(__name__)
+
+# Geohash precision used to snap origin/destination (~150 m cells)
+SNAP_PRECISION = 7
+# Obstacles closer than this to a cached route invalidate it
+INVALIDATION_RADIUS_M = 30.0
+# Lateral offset of the detour waypoint inserted around a penalized edge
+DETOUR_OFFSET_M = 60.0
+
+RouteKey = Tuple[str, str, str]
+
+
+class RoutePlanner:
+    """
+    Computes routes between two GPS locations
+
+    In production this would call the Google Maps Directions API; for now it
+    produces the same mock plan the navigation router always returned.
+    """
+
+    def plan(self, origin: GeoPoint, destination: GeoPoint, profile: str = "walking",
+             avoid: Optional[Sequence[GeoPoint]] = None) -> Dict:
+        """
+        Compute a route plan
+
+        Args:
+            origin: Origin location
+            destination: Destination location
+            profile: Routing profile (walking, wheelchair, ...)
+            avoid: Obstacle locations whose edges should be penalized
+
+        Returns:
+            Dict with instructions, waypoints (Waypoints), distance and duration
+        """
+        instructions = [
+            "Head north on Main Street for 500 meters",
+            "Turn right onto Market Avenue",
+            "Continue for 300 meters to destination",
+            "Destination is on your left"
+        ]
+
+        waypoints = Waypoints.of((
+            (origin.latitude, origin.longitude),
+            (origin.latitude + 0.005, origin.longitude),
+            (origin.latitude + 0.010, origin.longitude + 0.005),
+            (destination.latitude, destination.longitude)
+        ))
+
+        plan = {
+            "profile": profile,
+            "instructions": instructions,
+            "waypoints": waypoints,
+            "distance": 1200,  # meters
+            "duration": 900    # seconds (15 minutes)
+        }
+
+        for obstacle in avoid or []:
+            self._penalize_edge(plan, obstacle)
+
+        return plan
+
+    def _penalize_edge(self, plan: Dict, obstacle: GeoPoint):
+        """Detour the first edge passing next to an obstacle"""
+        waypoints: Waypoints = plan["waypoints"]
+        lat, lon = obstacle.latitude, obstacle.longitude
+
+        for i, (a_lat, a_lon, b_lat, b_lon) in enumerate(waypoints.segments()):
+            if point_segment_distance_m(lat, lon, a_lat, a_lon, b_lat, b_lon) > INVALIDATION_RADIUS_M:
+                continue
+
+            # Step sideways, perpendicular to the edge, past the obstacle
+            k = math.cos(math.radians(lat))
+            dx = (b_lon - a_lon) * k
+            dy = b_lat - a_lat
+            norm = math.hypot(dx, dy) or 1.0
+            offset_deg = DETOUR_OFFSET_M / 111320.0
+            detour_lat = lat + dx / norm * offset_deg
+            detour_lon = lon - dy / norm * offset_deg / (k or 1.0)
+            # A waypoint sitting on the obstacle is replaced, otherwise the
+            # detour is spliced into the edge
+            if i + 2 < len(waypoints) and haversine_m(lat, lon, b_lat, b_lon) <= INVALIDATION_RADIUS_M:
+                waypoints.set(i + 1, detour_lat, detour_lon)
+            else:
+                waypoints.insert(i + 1, detour_lat, detour_lon)
+
+            plan["instructions"].insert(
+                min(i + 1, len(plan["instructions"])),
+                "Detour around the reported obstacle ahead"
+            )
+            plan["distance"] += int(2 * DETOUR_OFFSET_M)
+            plan["duration"] += int(2 * DETOUR_OFFSET_M / 1.3)
+            return
+
+
+def _copy_plan(plan: Dict) -> Dict:
+    """Copy the mutable parts of a plan (far cheaper than a deepcopy)"""
+    return {**plan, "instructions": list(plan["instructions"]), "waypoints": plan["waypoints"].copy()}
+
+
+class RouteCache:
+    """
+    LRU cache of route plans keyed by snapped origin/destination and profile
+
+    Each cached plan is also indexed by the geohash cells its path crosses so
+    obstacle reports only have to look at routes in the surrounding cells.
+    """
+
+    def __init__(self, max_entries: int = 1024, precision: int = SNAP_PRECISION):
+        self.max_entries = max_entries
+        self.precision = precision
+        self._entries: "OrderedDict[RouteKey, Dict]" = OrderedDict()
+        self._cell_index: Dict[str, Set[RouteKey]] = {}
+        self._cells_by_key: Dict[RouteKey, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def make_key(self, origin: GeoPoint, destination: GeoPoint, profile: str) -> RouteKey:
+        """Snap origin and destination to geohash cells"""
+        return (
+            geohash_encode(origin.latitude, origin.longitude, self.precision),
+            geohash_encode(destination.latitude, destination.longitude, self.precision),
+            profile
+        )
+
+    def get(self, key: RouteKey) -> Optional[Dict]:
+        """Return a copy of the cached plan, or None on a miss"""
+        plan = self._entries.get(key)
+        if plan is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return _copy_plan(plan)
+
+    def put(self, key: RouteKey, plan: Dict):
+        """Store a plan, evicting the least recently used entry when full"""
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _copy_plan(plan)
+
+        cells = polyline_cells(plan["waypoints"], self.precision)
+        self._cells_by_key[key] = cells
+        for cell in cells:
+            self._cell_index.setdefault(cell, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_near(self, latitude: float, longitude: float,
+                        radius_m: float = INVALIDATION_RADIUS_M) -> int:
+        """
+        Drop cached routes passing within radius_m of a location
+
+        Returns:
+            Number of invalidated entries
+        """
+        candidates: Set[RouteKey] = set()
+        for cell in geohash_neighbors(geohash_encode(latitude, longitude, self.precision)):
+            candidates.update(self._cell_index.get(cell, ()))
+
+        invalidated = 0
+        for key in candidates:
+            for a_lat, a_lon, b_lat, b_lon in self._entries[key]["waypoints"].segments():
+                if point_segment_distance_m(latitude, longitude, a_lat, a_lon, b_lat, b_lon) <= radius_m:
+                    self._remove(key)
+                    invalidated += 1
+                    break
+
+        if invalidated:
+            self.invalidations += invalidated
+            logger.info(f"Invalidated {invalidated} cached route(s) near ({latitude}, {longitude})")
+        return invalidated
+
+    def clear(self):
+        """Remove all cached routes"""
+        self._entries.clear()
+        self._cell_index.clear()
+        self._cells_by_key.clear()
+
+    def stats(self) -> Dict:
+        """Cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+    def _remove(self, key: RouteKey):
+        self._entries.pop(key, None)
+        for cell in self._cells_by_key.pop(key, ()):
+            keys = self._cell_index.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._cell_index[cell]
+
+
+class RoutingService:
+    """Route planner fronted by the route cache"""
+
+    def __init__(self, planner: Optional[RoutePlanner] = None, cache: Optional[RouteCache] = None):
+        self.planner = planner or RoutePlanner()
+        self.cache = cache or RouteCache()
+
+    def get_route(self, origin: GeoPoint, destination: GeoPoint, profile: str = "walking") -> Dict:
+        """
+        Return a route plan, served from the cache when possible
+
+        The first and last waypoints are always the caller's exact origin and
+        destination, even when the plan was computed for nearby points.
+        """
+        key = self.cache.make_key(origin, destination, profile)
+        plan = self.cache.get(key)
+        cached = plan is not None
+
+        if plan is None:
+            with metrics.timer("route_plan"):
+                plan = self.planner.plan(origin, destination, profile)
+            self.cache.put(key, plan)
+
+        plan["waypoints"].set(0, origin.latitude, origin.longitude)
+        plan["waypoints"].set(-1, destination.latitude, destination.longitude)
+        plan["cached"] = cached
+        return plan
+
+    def reroute(self, origin: GeoPoint, destination: GeoPoint, profile: str,
+                avoid: List[GeoPoint]) -> Dict:
+        """
+        Compute a fresh plan that penalizes the edges next to obstacles
+
+        Obstacle-specific plans bypass the cache; they only apply to the
+        route being rerouted.
+        """
+        with metrics.timer("route_plan"):
+            plan = self.planner.plan(origin, destination, profile, avoid=avoid)
+        plan["waypoints"].set(0, origin.latitude, origin.longitude)
+        plan["waypoints"].set(-1, destination.latitude, destination.longitude)
+        plan["cached"] = False
+        return plan
+
+    def obstacle_reported(self, latitude: float, longitude: float) -> int:
+        """Invalidate cached routes affected by a new obstacle"""
+        return self.cache.invalidate_near(latitude, longitude)
+
+
+# Global instance
+routing_service = RoutingService()
@@ -0,0 +1,337 @@
+"""
+Scene memory
+Remembers where static hazards (benches, hydrants, signs, planters...)
+were seen along the streets users walk, so known hazards on a route can be
+sent to the client up front instead of being rediscovered frame by frame
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import math
+import time
+
+from app.config import settings
+from app.services.geo import (
+    geohash_encode, geohash_neighbors, haversine_m, point_segment_distance_m, polyline_cells
+)
+from app.services.metrics import metrics
+from app.services.records import GeoPoint, SceneObjectState, Waypoints
+from app.services.storage import Collection, storage
+
+logger = logging.getLogger(__name__)
+
+# ~150 m cells for the route corridor join, ~5 m cells for object keys
+INDEX_PRECISION = 7
+KEY_PRECISION = 9
+METERS_PER_DEGREE = 111320.0
+
+scene_sightings = metrics.counter(
+    "snc_scene_sightings_total", "Static hazard sightings by outcome (new, merged, throttled)", ("outcome",)
+)
+
+
+def project(latitude: float, longitude: float, bearing_deg: float, distance_m: float) -> Tuple[float, float]:
+    """Point `distance_m` away along a compass bearing (flat-earth, fine at street scale)"""
+    bearing = math.radians(bearing_deg)
+    lat = latitude + distance_m * math.cos(bearing) / METERS_PER_DEGREE
+    lon = longitude + distance_m * math.sin(bearing) / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+    return lat, lon
+
+
+class SceneMemory:
+    """
+    Persistent, geohash-indexed memory of static hazards
+
+    Sightings come from detections tagged with the walker's GPS fix. An
+    object is placed along the walker's heading at its estimated distance
+    (at the walker's position when either is unknown), then merged with an
+    object of the same class within `merge_radius_m`, or stored as a new
+    one. Each object has a score: every sighting adds its confidence (at
+    most one per `sighting_interval` seconds, so a bench filmed at 2 fps
+    while passing counts once) and the score halves every `half_life_days`
+    without sightings. Objects scoring `known_score` or more are "known";
+    objects decayed below `forget_score` are deleted by a background task
+    every `prune_interval` seconds.
+    """
+
+    def __init__(self, store: Collection, sessions: Collection, classes: Iterable[str], merge_radius_m: float = 4.0,
+                 half_life_days: float = 14.0, known_score: float = 1.5, forget_score: float = 0.2,
+                 max_range_m: float = 15.0, sighting_interval: float = 60.0, prune_interval: float = 3600.0):
+        self.store = store
+        self.sessions = sessions
+        self.classes = set(classes)
+        self.merge_radius_m = merge_radius_m
+        self.half_life = half_life_days * 86400
+        self.known_score = known_score
+        self.forget_score = forget_score
+        self.max_range_m = max_range_m
+        self.sighting_interval = sighting_interval
+        self.prune_interval = prune_interval
+        self._cells: Dict[str, Set[str]] = {}  # index cell -> object ids
+        self._indexed: Optional[Tuple[float, str]] = None  # scene change position folded into the index
+        self._device_sessions: Dict[str, str] = {}  # device id -> its active session id
+        self._session_devices: Dict[str, List[str]] = {}  # active session id -> its device ids
+        self._sessions_seen: Optional[Tuple[float, str]] = None  # sessions change position folded in
+        self._task: Optional[asyncio.Task] = None
+
+    def _index(self) -> Dict[str, Set[str]]:
+        """
+        Cell index, with the objects changed since the last lookup folded in
+        (startup hydration, other workers). Ids left behind by objects moved
+        or deleted elsewhere are dropped by _objects_in when it meets them.
+        """
+        changed, position, _ = self.store.changes(self._indexed, limit=len(self.store))
+        for obj in changed:
+            self._cells.setdefault(obj.cell, set()).add(obj.object_id)
+        if position is not None:
+            self._indexed = position
+        return self._cells
+
+    def _objects_in(self, cells: Dict[str, Set[str]], cell: str) -> Iterable[SceneObjectState]:
+        ids = cells.get(cell)
+        if not ids:
+            return
+        for object_id in list(ids):
+            obj = self.store.get(object_id)
+            if obj is None or obj.cell != cell:
+                ids.discard(object_id)
+            else:
+                yield obj
+        if not ids:
+            del cells[cell]
+
+    def locate(self, session_id: Optional[str] = None, device_id: Optional[str] = None) -> Optional[GeoPoint]:
+        """
+        Current GPS fix of a session, given directly or as the active
+        session the device was added to (None when unknown)
+        """
+        if session_id is None and device_id is not None:
+            self._sync_sessions()
+            session_id = self._device_sessions.get(device_id)
+        session = self.sessions.get(session_id) if session_id is not None else None
+        location = session.get("current_location") if session is not None else None
+        return GeoPoint.from_dict(location) if location else None
+
+    def _sync_sessions(self):
+        """
+        Fold the sessions changed since the last lookup into the device ->
+        session map; the position is in this worker's change order, so
+        sessions synced later from other workers still come after it
+        """
+        changed, position, _ = self.sessions.changes(self._sessions_seen, limit=len(self.sessions))
+        for session in changed:
+            session_id = session["session_id"]
+            for device_id in self._session_devices.pop(session_id, ()):
+                if self._device_sessions.get(device_id) == session_id:
+                    del self._device_sessions[device_id]
+            if session.get("status") == "active":
+                devices = [device["device_id"] for device in session.get("active_devices", ())]
+                self._session_devices[session_id] = devices
+                for device_id in devices:
+                    self._device_sessions[device_id] = session_id
+        if position is not None:
+            self._sessions_seen = position
+
+    def score(self, obj: SceneObjectState, now: Optional[float] = None) -> float:
+        """Decayed score of an object"""
+        elapsed = (now or time.time()) - obj.last_seen
+        return obj.score * 0.5 ** (max(elapsed, 0.0) / self.half_life)
+
+    def _nearby(self, latitude: float, longitude: float) -> Iterable[SceneObjectState]:
+        cells = self._index()
+        for cell in geohash_neighbors(geohash_encode(latitude, longitude, INDEX_PRECISION)):
+            yield from self._objects_in(cells, cell)
+
+    def observe(self, location: GeoPoint, detections: List[Dict], bearings: Optional[List[float]] = None) -> int:
+        """
+        Record the static hazards among one frame's detections
+
+        Args:
+            location: Walker's GPS fix when the frame was taken
+            detections: Detection dicts with `class`, `confidence` and `distance`
+            bearings: Horizontal angle of each detection off the camera axis in
+                degrees (positive to the right), used with location.heading
+
+        Returns:
+            Number of sightings recorded
+        """
+        now = time.time()
+        recorded = 0
+        for i, detection in enumerate(detections):
+            label = detection["class"]
+            distance = detection.get("distance")
+            if label not in self.classes or (distance is not None and distance > self.max_range_m):
+                continue
+            if location.heading is not None and distance is not None:
+                bearing = location.heading + (bearings[i] if bearings else 0.0)
+                lat, lon = project(location.latitude, location.longitude, bearing, distance)
+            else:
+                lat, lon = location.latitude, location.longitude
+            recorded += self._sight(label, lat, lon, detection["confidence"], now)
+        return recorded
+
+    def _sight(self, label: str, lat: float, lon: float, confidence: float, now: float) -> int:
+        match, best = None, self.merge_radius_m
+        for obj in self._nearby(lat, lon):
+            if obj.label != label:
+                continue
+            distance = haversine_m(lat, lon, obj.location.latitude, obj.location.longitude)
+            if distance <= best:
+                match, best = obj, distance
+
+        if match is not None:
+            if now - match.last_seen < self.sighting_interval:
+                scene_sightings.inc(1, "throttled")
+                return 0
+            # Running mean of the position, weighted by how established the object is
+            weight = min(match.sightings, 9)
+            match.location = GeoPoint(
+                latitude=(match.location.latitude * weight + lat) / (weight + 1),
+                longitude=(match.location.longitude * weight + lon) / (weight + 1)
+            )
+            match.score = self.score(match, now) + confidence
+            match.sightings += 1
+            match.last_seen = now
+            self._put(match)
+            scene_sightings.inc(1, "merged")
+            return 1
+
+        object_id = f"{label.replace(' ', '_')}@{geohash_encode(lat, lon, KEY_PRECISION)}"
+        existing = self.store.get(object_id)
+        if existing is not None:
+            # Same key but outside the merge radius of the old position: take it over
+            self._unindex(existing)
+        obj = SceneObjectState(
+            object_id=object_id,
+            label=label,
+            location=GeoPoint(latitude=lat, longitude=lon),
+            cell=geohash_encode(lat, lon, INDEX_PRECISION),
+            score=confidence,
+            sightings=1,
+            last_seen=now,
+            created_at=datetime.utcnow()
+        )
+        self._put(obj)
+        scene_sightings.inc(1, "new")
+        return 1
+
+    def _put(self, obj: SceneObjectState):
+        self._unindex(obj)
+        obj.cell = geohash_encode(obj.location.latitude, obj.location.longitude, INDEX_PRECISION)
+        self.store.put(obj.object_id, obj)
+        self._cells.setdefault(obj.cell, set()).add(obj.object_id)
+
+    def _unindex(self, obj: SceneObjectState):
+        ids = self._cells.get(obj.cell)
+        if ids is not None:
+            ids.discard(obj.object_id)
+            if not ids:
+                del self._cells[obj.cell]
+
+    def along_route(self, waypoints: Waypoints, corridor_m: Optional[float] = None) -> List[Dict]:
+        """
+        Known hazards within `corridor_m` of a route, in route order
+
+        Each hazard carries its label, location, decayed score, sightings
+        and the distance along the route to the point nearest it.
+        """
+        corridor_m = corridor_m if corridor_m is not None else settings.scene_corridor_m
+        segments = list(waypoints.segments())
+        if not segments:
+            return []
+        cells = self._index()
+        candidates: Dict[str, SceneObjectState] = {}
+        for cell in polyline_cells(waypoints, INDEX_PRECISION):
+            for neighbour in geohash_neighbors(cell):
+                for obj in self._objects_in(cells, neighbour):
+                    candidates[obj.object_id] = obj
+
+        now = time.time()
+        hazards = []
+        for object_id, obj in candidates.items():
+            score = self.score(obj, now)
+            if score < self.known_score:
+                continue
+            lat, lon = obj.location.latitude, obj.location.longitude
+            along, nearest = 0.0, None
+            for a_lat, a_lon, b_lat, b_lon in segments:
+                offset = point_segment_distance_m(lat, lon, a_lat, a_lon, b_lat, b_lon)
+                if offset <= corridor_m:
+                    # Approximate position along the segment from the distances to its ends
+                    nearest = along + max(haversine_m(a_lat, a_lon, lat, lon) ** 2 - offset ** 2, 0.0) ** 0.5
+                    break
+                along += haversine_m(a_lat, a_lon, b_lat, b_lon)
+            if nearest is None:
+                continue
+            hazards.append({
+                "object_id": object_id,
+                "label": obj.label,
+                "location": {"latitude": round(lat, 7), "longitude": round(lon, 7)},
+                "distance_along_route_m": round(nearest, 1),
+                "score": round(score, 2),
+                "sightings": obj.sightings,
+                "last_seen": datetime.utcfromtimestamp(obj.last_seen).isoformat()
+            })
+        hazards.sort(key=lambda hazard: hazard["distance_along_route_m"])
+        return hazards
+
+    def prune(self) -> int:
+        """Delete objects whose score decayed below forget_score"""
+        now = time.time()
+        stale = [obj for obj in self.store.values() if self.score(obj, now) < self.forget_score]
+        for obj in stale:
+            self._unindex(obj)
+            self.store.delete(obj.object_id)
+        if stale:
+            logger.info(f"Forgot {len(stale)} decayed scene object(s)")
+        return len(stale)
+
+    def start(self):
+        """Start periodic pruning on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop periodic pruning"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            try:
+                self.prune()
+            except Exception as e:
+                logger.error(f"Scene memory prune failed: {e}")
+
+    def stats(self) -> Dict:
+        now = time.time()
+        scores = [self.score(obj, now) for obj in self.store.values()]
+        return {
+            "objects": len(scores),
+            "known": sum(score >= self.known_score for score in scores),
+            "cells": len(self._index())
+        }
+
+
+# Global instance
+scene_memory = SceneMemory(
+    storage.collection("scene", SceneObjectState),
+    storage.collection("sessions"),
+    settings.static_hazard_classes,
+    merge_radius_m=settings.scene_merge_radius_m,
+    half_life_days=settings.scene_half_life_days,
+    known_score=settings.scene_known_score,
+    forget_score=settings.scene_forget_score,
+    max_range_m=settings.scene_max_range_m,
+    sighting_interval=settings.scene_sighting_interval,
+    prune_interval=settings.scene_prune_interval
+)
+
+metrics.gauge("snc_scene_objects", "Static hazards in scene memory", lambda: len(scene_memory.store))
@@ -0,0 +1,159 @@
+"""
+JSON serialization
+orjson-backed encoding for stored records and API responses, with a stdlib
+json fallback when orjson isn't installed, plus response field projection
+"""
+from datetime import datetime
+from typing import Annotated, Any, Callable, Dict, Optional
+import json
+import logging
+
+from fastapi import Query
+from fastapi.responses import JSONResponse
+
+from app.services.records import Record, Waypoints
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+    logger.info("orjson not installed, using the json module")
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, Waypoints):
+        return value.to_list()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    # NumPy arrays and scalars without importing numpy (orjson handles them
+    # natively; this covers the json fallback and other array-likes)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(value: Any, default: Optional[Callable[[Any], Any]] = None,
+          passthrough_datetime: bool = False) -> bytes:
+    """
+    Encode to compact JSON bytes
+
+    Args:
+        value: Object to encode; records and waypoints are supported natively
+        default: Hook for other types, tried before the built-in conversions
+        passthrough_datetime: Send datetimes to the hook instead of encoding
+            them as ISO strings (used by storage to tag them)
+    """
+    if default is None:
+        hook = _default
+    else:
+        def hook(v):
+            try:
+                return default(v)
+            except TypeError:
+                return _default(v)
+
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if passthrough_datetime:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(value, default=hook, option=option)
+    # json can't encode datetimes itself, so they always reach the hook
+    return json.dumps(value, default=hook, separators=(",", ":")).encode()
+
+
+def loads(data) -> Any:
+    """Decode JSON text or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class: encodes with orjson
+
+    Handles datetimes, NumPy values, slotted records and pydantic models
+    natively; a pydantic model is dumped once by pydantic-core instead of
+    being converted to a dict first.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if hasattr(content, "model_dump_json"):
+            return content.model_dump_json().encode()
+        return dumps(content)
+
+
+_MISSING = object()
+
+# `fields` query parameter shared by the read endpoints
+Fields = Annotated[Optional[str], Query(
+    description="Comma-separated fields to return, dotted for nested ones "
+                "(e.g. route_id,status,origin.latitude); all fields when omitted"
+)]
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict]:
+    """
+    Parse a `fields` query parameter into a projection tree
+
+    "route_id,origin.latitude" -> {"route_id": None, "origin": {"latitude": None}}
+    (None selects the whole value). Empty or missing means no projection.
+    """
+    if not fields:
+        return None
+    tree: Dict = {}
+    for path in fields.split(","):
+        path = path.strip()
+        if not path:
+            continue
+        node = tree
+        *parents, leaf = path.split(".")
+        for name in parents:
+            child = node.get(name, {})
+            if child is None:
+                break  # the whole parent is already selected
+            node = node.setdefault(name, child)
+        else:
+            node[leaf] = None
+    return tree or None
+
+
+def project(value: Any, tree: Optional[Dict]) -> Any:
+    """Keep only the projected fields of a record, model, dict or list of them"""
+    if tree is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        read = value.get
+    elif isinstance(value, Record) or hasattr(value, "model_fields"):
+        def read(name, default=None):
+            return getattr(value, name, default)
+    else:
+        return value
+    projected = {}
+    for name, subtree in tree.items():
+        field = read(name, _MISSING)
+        if field is not _MISSING:
+            projected[name] = project(field, subtree)
+    return projected
+
+
+def json_response(content: Any, status_code: int = 200, fields: Optional[str] = None) -> FastJSONResponse:
+    """
+    JSON response encoded directly, skipping FastAPI's jsonable_encoder pass
+
+    Args:
+        content: Records, models or builtins to encode
+        status_code: HTTP status code
+        fields: Optional comma-separated projection (see parse_fields)
+    """
+    return FastJSONResponse(project(content, parse_fields(fields)), status_code=status_code)
@@ -0,0 +1,681 @@
+"""
+Persistent storage service
+SQLite-backed record store for devices, sessions, routes, frames and alerts,
+fronted by in-memory write-through collections for hot reads
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from app.config import settings
+from app.services import serialization
+from app.services.records import Record
+
+logger = logging.getLogger(__name__)
+
+# Record fields that can provide the created_at column, in order of preference
+TIMESTAMP_FIELDS = ("created_at", "timestamp", "start_time", "registered_at")
+# Rows written by other workers are picked up with this much clock slack
+SYNC_SLACK_SECONDS = 5.0
+# IDs reserved from the shared counter per round trip
+ID_BLOCK_SIZE = 64
+# Deleted rows are kept as tombstones this long, so other workers sync the delete
+TOMBSTONE_TTL_SECONDS = 3600.0
+
+_UPSERT_SQL = (
+    "INSERT INTO {table} (id, device_id, session_id, route_id, status, created_at, updated_at, data, deleted) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0) "
+    "ON CONFLICT(id) DO UPDATE SET device_id=excluded.device_id, session_id=excluded.session_id, "
+    "route_id=excluded.route_id, status=excluded.status, created_at=excluded.created_at, "
+    "updated_at=excluded.updated_at, data=excluded.data, deleted=0"
+)
+# Deletes leave a tombstone so sync() can tell other workers
+_DELETE_SQL = (
+    "INSERT INTO {table} (id, updated_at, data, deleted) VALUES (?, ?, 'null', 1) "
+    "ON CONFLICT(id) DO UPDATE SET device_id=NULL, session_id=NULL, route_id=NULL, status=NULL, "
+    "created_at=NULL, updated_at=excluded.updated_at, data=excluded.data, deleted=1"
+)
+_PURGE_SQL = "DELETE FROM {table} WHERE deleted = 1 AND updated_at < ?"
+_SELECT_ONE_SQL = "SELECT data, updated_at FROM {table} WHERE id = ? AND deleted = 0"
+_SELECT_ALL_SQL = "SELECT id, data, updated_at FROM {table} WHERE deleted = 0 ORDER BY rowid"
+_SELECT_RECENT_SQL = (
+    "SELECT id, data, updated_at FROM (SELECT rowid AS position, id, data, updated_at FROM {table} "
+    "WHERE deleted = 0 ORDER BY rowid DESC LIMIT ?) ORDER BY position"
+)
+_SELECT_SINCE_SQL = (
+    "SELECT id, data, updated_at, deleted FROM {table} WHERE updated_at >= ? ORDER BY updated_at"
+)
+
+
+def _created_at(record: Any) -> Optional[str]:
+    """Creation timestamp of a record as an ISO string, from TIMESTAMP_FIELDS"""
+    for field in TIMESTAMP_FIELDS:
+        value = record.get(field)
+        if value is not None:
+            return value.isoformat() if isinstance(value, datetime) else str(value)
+    return None
+
+
+def _discard(index: List[tuple], item: tuple):
+    i = bisect_left(index, item)
+    if i < len(index) and index[i] == item:
+        del index[i]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if hasattr(value, "dict"):
+        return value.dict()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _revive(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and "__datetime__" in value:
+            return datetime.fromisoformat(value["__datetime__"])
+        return {k: _revive(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_revive(v) for v in value]
+    return value
+
+
+def dumps(record: Any) -> str:
+    """Serialize a record, preserving datetimes"""
+    return serialization.dumps(record, default=_encode, passthrough_datetime=True).decode()
+
+
+def loads(data: str) -> Dict:
+    """Deserialize a record written by dumps"""
+    return _revive(serialization.loads(data))
+
+
+class Collection:
+    """
+    Write-through cache for one table
+
+    Behaves like a read-only dict of records keyed by id. Writes go through
+    put/save/delete, which update the cache immediately and queue the row
+    for the next batched flush. With a record_type, rows are held as that
+    Record class instead of plain dicts.
+
+    Two sorted indexes back cursor pagination: (created_at, id) orders
+    records by creation, from the row itself so every worker agrees on the
+    order, and (changed, id) by when this worker saw each record change.
+    `changed` comes from the storage's monotonic clock when a row is written
+    or synced in, so a row synced from another worker with an older
+    updated_at still lands after every position handed out before it
+    arrived. Positions stay valid while records are inserted around them.
+
+    With partition_by, the creation order is also kept per value of those
+    fields (e.g. per device), so listing one partition doesn't scan the rest.
+
+    With max_records, only that many of the most recently inserted records
+    are held (for append-only tables such as frames); older ones are evicted
+    and read back from the database by fetch() without being cached again.
+    Listings and indexes cover the held records only.
+    """
+
+    def __init__(self, name: str, storage: "Storage", record_type: Optional[Type[Record]] = None,
+                 max_records: Optional[int] = None, partition_by: Tuple[str, ...] = ()):
+        self.name = name
+        self.storage = storage
+        self.record_type = record_type
+        self.max_records = max_records
+        self.partition_by = tuple(partition_by)
+        self._records: Dict[str, Any] = {}
+        self._updated_at: Dict[str, float] = {}
+        self._changed: Dict[str, float] = {}
+        self._created: Dict[str, Tuple[str, str]] = {}
+        self._by_created: List[Tuple[str, str]] = []
+        self._by_changed: List[Tuple[float, str]] = []
+        # field -> value -> (created_at, id) of the records with that value
+        self._partitions: Dict[str, Dict[Any, List[Tuple[str, str]]]] = {field: {} for field in self.partition_by}
+        self._partition_of: Dict[str, tuple] = {}
+        self._last_update = 0.0
+        self._last_delete = 0.0
+
+    def __getitem__(self, key: str) -> Dict:
+        return self._records[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._records
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, key: str, default: Optional[Dict] = None) -> Optional[Dict]:
+        return self._records.get(key, default)
+
+    def values(self):
+        return self._records.values()
+
+    def items(self):
+        return self._records.items()
+
+    def latest(self) -> Optional[Dict]:
+        """Most recently inserted record"""
+        if not self._records:
+            return None
+        return self._records[next(reversed(self._records))]
+
+    def put(self, key: str, record: Dict):
+        """Insert or replace a record"""
+        self._records[key] = record
+        self.save(key)
+        self._evict()
+
+    def save(self, key: str):
+        """Persist a record after it was mutated in place"""
+        now = time.time()
+        self._reindex(key, now)
+        self.storage.enqueue(self.name, key, self._records[key], now)
+
+    def delete(self, key: str) -> Optional[Dict]:
+        """Remove a record; returns it if it existed"""
+        record = self._records.pop(key, None)
+        self._unindex(key)
+        self._last_delete = time.time()
+        self.storage.enqueue(self.name, key, None, self._last_delete)
+        return record
+
+    def modified_at(self, key: str) -> Optional[float]:
+        """When a record last changed (epoch seconds)"""
+        return self._updated_at.get(key)
+
+    @property
+    def last_modified(self) -> Optional[float]:
+        """When any record last changed or was deleted"""
+        return max(self._last_update, self._last_delete) or None
+
+    @property
+    def version(self) -> str:
+        """
+        Content version of the whole collection, for ETags
+
+        Derived from the rows (count and latest change), so workers that
+        have synced the same rows report the same version.
+        """
+        return f"{len(self._records)}:{self.last_modified!r}"
+
+    def page(self, after: Optional[Tuple[str, str]] = None, limit: int = 100,
+             where: Optional[Callable[[Any], bool]] = None,
+             created_from: Optional[str] = None, created_before: Optional[str] = None,
+             newest_first: bool = False,
+             partition: Optional[Tuple[str, Any]] = None) -> Tuple[List, Optional[Tuple[str, str]], bool]:
+        """
+        Records in creation order, starting after a position
+
+        Args:
+            after: Position returned by the previous page, if any
+            limit: Maximum records to return
+            where: Optional filter applied while scanning
+            created_from: Inclusive lower bound on the creation timestamp (ISO)
+            created_before: Exclusive upper bound on the creation timestamp (ISO)
+            newest_first: Walk the index backwards
+            partition: (field, value) of a partition_by field, to list only
+                the records with that value
+
+        Returns:
+            (records, position to resume after, whether more records follow)
+        """
+        if partition is not None:
+            field, value = partition
+            index = self._partitions[field].get(value, [])
+        else:
+            index = self._by_created
+        lo = bisect_left(index, (created_from,)) if created_from else 0
+        hi = bisect_left(index, (created_before,)) if created_before else len(index)
+        if newest_first:
+            if after is not None:
+                hi = min(hi, bisect_left(index, after))
+            positions = range(hi - 1, lo - 1, -1)
+        else:
+            if after is not None:
+                lo = max(lo, bisect_right(index, after))
+            positions = range(lo, hi)
+        return self._scan(index, positions, limit, where)
+
+    def changes(self, after: Optional[Tuple[float, str]] = None, limit: int = 100,
+                where: Optional[Callable[[Any], bool]] = None) -> Tuple[List, Optional[Tuple[float, str]], bool]:
+        """Records this worker saw change after a position, in that order"""
+        index = self._by_changed
+        lo = bisect_right(index, after) if after is not None else 0
+        return self._scan(index, range(lo, len(index)), limit, where)
+
+    def high_water(self) -> Optional[Tuple[float, str]]:
+        """Position of the most recent change, the starting point for changes()"""
+        return self._by_changed[-1] if self._by_changed else None
+
+    def _scan(self, index: List[tuple], positions: range, limit: int,
+              where: Optional[Callable[[Any], bool]]) -> Tuple[List, Optional[tuple], bool]:
+        items = []
+        resume = None
+        for i in positions:
+            position = index[i]
+            record = self._records[position[1]]
+            if where is None or where(record):
+                if len(items) == limit:
+                    return items, resume, True
+                items.append(record)
+            # Filtered-out records are consumed too, so they aren't rescanned
+            resume = position
+        return items, resume, False
+
+    def _reindex(self, key: str, updated_at: float, changed: Optional[float] = None):
+        changed = self.storage.clock() if changed is None else changed
+        previous = self._changed.get(key)
+        if previous is not None:
+            _discard(self._by_changed, (previous, key))
+        self._changed[key] = changed
+        insort(self._by_changed, (changed, key))
+        self._updated_at[key] = updated_at
+        self._last_update = max(self._last_update, updated_at)
+
+        record = self._records[key]
+        created = (_created_at(record) or "", key)
+        previous_created = self._created.get(key)
+        if previous_created != created:
+            if previous_created is not None:
+                _discard(self._by_created, previous_created)
+            self._created[key] = created
+            insort(self._by_created, created)
+
+        if self.partition_by:
+            values = tuple(record.get(field) for field in self.partition_by)
+            if previous_created != created or self._partition_of.get(key) != values:
+                self._unpartition(key, previous_created)
+                self._partition_of[key] = values
+                for field, value in zip(self.partition_by, values):
+                    insort(self._partitions[field].setdefault(value, []), created)
+
+    def _unpartition(self, key: str, created: Optional[Tuple[str, str]]):
+        values = self._partition_of.pop(key, None)
+        if values is None:
+            return
+        for field, value in zip(self.partition_by, values):
+            index = self._partitions[field].get(value)
+            if index is not None:
+                _discard(index, created)
+                if not index:
+                    del self._partitions[field][value]
+
+    def _evict(self):
+        """Drop the oldest records beyond max_records (they stay in the database)"""
+        if self.max_records is None:
+            return
+        while len(self._records) > self.max_records:
+            key = next(iter(self._records))
+            del self._records[key]
+            self._unindex(key)
+
+    def _unindex(self, key: str):
+        self._updated_at.pop(key, None)
+        changed = self._changed.pop(key, None)
+        if changed is not None:
+            _discard(self._by_changed, (changed, key))
+        created = self._created.pop(key, None)
+        if created is not None:
+            _discard(self._by_created, created)
+        self._unpartition(key, created)
+
+    async def fetch(self, key: str) -> Optional[Dict]:
+        """
+        Read a record, falling back to the database on a cache miss
+
+        Lets a worker serve records that were created by another worker
+        since its last sync, and records evicted from a bounded collection.
+        """
+        record = self._records.get(key)
+        if record is not None:
+            return record
+
+        pending = self.storage.pending(self.name, key)
+        if pending is not None:
+            # Not flushed yet: an evicted record, or None for a delete the database doesn't know of
+            return pending[0]
+
+        row = await self.storage.fetch_row(self.name, key)
+        if row is None:
+            return None
+        data, updated_at = row
+        record = self.record_type.from_dict(data) if self.record_type else data
+        if self.max_records is not None:
+            # Old rows of a bounded collection would push out newer ones
+            return record
+        self._records[key] = record
+        self._reindex(key, updated_at)
+        return record
+
+    def apply_row(self, key: str, record: Dict, updated_at: float, changed: Optional[float] = None):
+        """
+        Merge a row read from the database; newer local writes win
+
+        `changed` defaults to now: the row is news to this worker.
+        """
+        if self._updated_at.get(key, 0.0) >= updated_at:
+            return
+        current = self._records.get(key)
+        if current is not None:
+            # Update in place so references held by services stay valid
+            if self.record_type:
+                current.update_from(record)
+            else:
+                current.clear()
+                current.update(record)
+        else:
+            self._records[key] = self.record_type.from_dict(record) if self.record_type else record
+        self._reindex(key, updated_at, changed)
+        self._evict()
+
+    def apply_delete(self, key: str, deleted_at: float):
+        """Drop a record another worker deleted; newer local writes win"""
+        if self._updated_at.get(key, 0.0) >= deleted_at:
+            return
+        self._records.pop(key, None)
+        self._unindex(key)
+        self._last_delete = max(self._last_delete, deleted_at)
+
+
+class Storage:
+    """
+    Async SQLite storage with batched writes
+
+    Runs in WAL mode so several uvicorn workers can share one database file.
+    Writes are coalesced per record and flushed in a single transaction with
+    executemany; every statement is a fixed parameterized string, so SQLite's
+    statement cache reuses the prepared statements.
+    """
+
+    def __init__(self, database_url: str, flush_interval: float = 0.05,
+                 batch_size: int = 256, sync_interval: float = 1.0):
+        self.database_url = database_url
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.collections: Dict[str, Collection] = {}
+        self.enabled = False
+
+        self._db = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[Tuple[str, str], Tuple[Optional[Dict], float]] = {}
+        self._flush_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_sync = 0.0
+        self._last_purge = 0.0
+        self._clock = 0.0
+        # Identifies this process's change clock in sync cursors; renewed on open (after forking)
+        self.instance = uuid.uuid4().hex[:12]
+        self._local_ids: Dict[str, int] = {}
+        self._id_blocks: Dict[str, Tuple[int, int]] = {}
+
+    def collection(self, name: str, record_type: Optional[Type[Record]] = None,
+                   max_records: Optional[int] = None, partition_by: Tuple[str, ...] = ()) -> Collection:
+        """Get or create the collection backing a table (see Collection for the options)"""
+        if name not in self.collections:
+            self.collections[name] = Collection(name, self, record_type, max_records, partition_by)
+        return self.collections[name]
+
+    def clock(self) -> float:
+        """Wall clock that never goes backwards, for Collection change positions"""
+        self._clock = max(time.time(), self._clock)
+        return self._clock
+
+    @property
+    def path(self) -> Optional[str]:
+        prefix = "sqlite:///"
+        if not self.database_url.startswith(prefix):
+            return None
+        return self.database_url[len(prefix):]
+
+    async def open(self):
+        """Open the database, create the schema and hydrate collections"""
+        if self.path is None:
+            logger.warning(f"Unsupported database URL {self.database_url}, using in-memory storage")
+            return
+
+        try:
+            import aiosqlite
+        except ImportError:
+            logger.warning("aiosqlite not installed, using in-memory storage")
+            return
+
+        self.instance = f"{os.getpid():x}{uuid.uuid4().hex[:8]}"
+        self._db = await aiosqlite.connect(self.path, isolation_level=None)
+        self._lock = asyncio.Lock()
+        self._flush_event = asyncio.Event()
+
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA synchronous=NORMAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._create_schema()
+
+        for collection in self.collections.values():
+            if collection.max_records is None:
+                query = self._db.execute(_SELECT_ALL_SQL.format(table=collection.name))
+            else:
+                query = self._db.execute(_SELECT_RECENT_SQL.format(table=collection.name), (collection.max_records,))
+            async with query as cursor:
+                async for key, data, updated_at in cursor:
+                    # Already in the database: every worker has them at their own time
+                    collection.apply_row(key, loads(data), updated_at, changed=updated_at)
+            logger.info(f"Loaded {len(collection)} {collection.name} record(s)")
+
+        self._last_sync = time.time()
+        self.enabled = True
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"Storage opened at {self.path}")
+
+    async def close(self):
+        """Flush pending writes and close the database"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            await self.flush()
+            await self._db.close()
+            self._db = None
+        self.enabled = False
+
+    def pending(self, table: str, key: str) -> Optional[Tuple[Optional[Dict], float]]:
+        """Queued write (record) or delete (None) of a row, with its time, if not flushed yet"""
+        return self._pending.get((table, key))
+
+    def enqueue(self, table: str, key: str, record: Optional[Dict], updated_at: float):
+        """Queue a write (record) or delete (None); later writes to a key win"""
+        if self._db is None:
+            return
+        self._pending[(table, key)] = (record, updated_at)
+        if len(self._pending) >= self.batch_size:
+            self._flush_event.set()
+
+    async def flush(self) -> int:
+        """
+        Write all pending rows in one transaction
+
+        Returns:
+            Number of rows written or deleted
+        """
+        if self._db is None or not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        upserts: Dict[str, List[tuple]] = {}
+        deletes: Dict[str, List[tuple]] = {}
+        for (table, key), (record, updated_at) in pending.items():
+            if record is None:
+                deletes.setdefault(table, []).append((key, updated_at))
+            else:
+                upserts.setdefault(table, []).append(self._row(key, record, updated_at))
+
+        async with self._lock:
+            await self._db.execute("BEGIN")
+            try:
+                for table, rows in upserts.items():
+                    await self._db.executemany(_UPSERT_SQL.format(table=table), rows)
+                for table, rows in deletes.items():
+                    await self._db.executemany(_DELETE_SQL.format(table=table), rows)
+                await self._db.execute("COMMIT")
+            except Exception:
+                await self._db.execute("ROLLBACK")
+                # Put the batch back unless newer writes superseded it
+                for item, value in pending.items():
+                    self._pending.setdefault(item, value)
+                raise
+
+        return len(pending)
+
+    async def sync(self) -> int:
+        """
+        Pull rows written and deleted by other workers since the last sync
+
+        Returns:
+            Number of rows examined
+        """
+        if self._db is None:
+            return 0
+
+        since = self._last_sync - SYNC_SLACK_SECONDS
+        self._last_sync = time.time()
+        count = 0
+        for collection in self.collections.values():
+            async with self._db.execute(
+                _SELECT_SINCE_SQL.format(table=collection.name), (since,)
+            ) as cursor:
+                async for key, data, updated_at, deleted in cursor:
+                    if (collection.name, key) not in self._pending:
+                        if deleted:
+                            collection.apply_delete(key, updated_at)
+                        else:
+                            collection.apply_row(key, loads(data), updated_at)
+                    count += 1
+
+        if self._last_sync - self._last_purge >= TOMBSTONE_TTL_SECONDS:
+            await self._purge_tombstones(self._last_sync - TOMBSTONE_TTL_SECONDS)
+            self._last_purge = self._last_sync
+        return count
+
+    async def _purge_tombstones(self, before: float):
+        """Drop tombstones every worker has long since synced"""
+        async with self._lock:
+            for table in self.collections:
+                await self._db.execute(_PURGE_SQL.format(table=table), (before,))
+
+    async def fetch_row(self, table: str, key: str) -> Optional[Tuple[Dict, float]]:
+        """Read a single row from the database"""
+        if self._db is None:
+            return None
+        async with self._db.execute(_SELECT_ONE_SQL.format(table=table), (key,)) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return loads(row[0]), row[1]
+
+    async def next_id(self, name: str) -> int:
+        """
+        Allocate a sequence number unique across all workers
+
+        Workers reserve blocks of IDs from a shared counter so only one in
+        ID_BLOCK_SIZE allocations touches the database.
+        """
+        if self._db is None:
+            value = self._local_ids.get(name, 0) + 1
+            self._local_ids[name] = value
+            return value
+
+        current, end = self._id_blocks.get(name, (0, 0))
+        if current >= end:
+            async with self._lock:
+                await self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    await self._db.execute(
+                        "INSERT INTO id_counters (name, value) VALUES (?, 0) ON CONFLICT(name) DO NOTHING",
+                        (name,)
+                    )
+                    await self._db.execute(
+                        "UPDATE id_counters SET value = value + ? WHERE name = ?",
+                        (ID_BLOCK_SIZE, name)
+                    )
+                    async with self._db.execute(
+                        "SELECT value FROM id_counters WHERE name = ?", (name,)
+                    ) as cursor:
+                        (end,) = await cursor.fetchone()
+                    await self._db.execute("COMMIT")
+                except Exception:
+                    await self._db.execute("ROLLBACK")
+                    raise
+            current = end - ID_BLOCK_SIZE
+
+        current += 1
+        self._id_blocks[name] = (current, end)
+        return current
+
+    async def _create_schema(self):
+        await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS id_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        for table in self.collections:
+            await self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "id TEXT PRIMARY KEY, device_id TEXT, session_id TEXT, route_id TEXT, "
+                "status TEXT, created_at TEXT, updated_at REAL NOT NULL, data TEXT NOT NULL, "
+                "deleted INTEGER NOT NULL DEFAULT 0)"
+            )
+            async with self._db.execute(f"PRAGMA table_info({table})") as cursor:
+                columns = {row[1] async for row in cursor}
+            if "deleted" not in columns:
+                # Databases created before deletes were synced
+                await self._db.execute(f"ALTER TABLE {table} ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+            for column in ("device_id", "session_id", "route_id", "created_at", "updated_at"):
+                await self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"
+                )
+
+    def _row(self, key: str, record: Dict, updated_at: float) -> tuple:
+        return (
+            key,
+            record.get("device_id"),
+            record.get("session_id"),
+            record.get("route_id"),
+            record.get("status"),
+            _created_at(record),
+            updated_at,
+            dumps(record)
+        )
+
+    async def _run(self):
+        next_sync = time.monotonic() + self.sync_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+
+            try:
+                await self.flush()
+                if time.monotonic() >= next_sync:
+                    await self.sync()
+                    next_sync = time.monotonic() + self.sync_interval
+            except Exception as e:
+                logger.error(f"Storage flush failed: {e}")
+
+
+# Global instance
+storage = Storage(
+    settings.database_url,
+    flush_interval=settings.storage_flush_interval,
+    batch_size=settings.storage_batch_size
+)
@@ -0,0 +1,560 @@
+"""
+Performance benchmark suite for the SNC backend
+Measures the detection, streaming and navigation paths offline and compares
+results against a saved baseline to catch regressions before deploy
+
+Usage (from backend/):
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+
+Detection benchmarks need torch plus YOLOV5_REPO / MODEL_WEIGHTS pointing at a
+local checkout and weights; they are reported as skipped otherwise.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Keep benchmark runs away from the real database and output folders
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import cv2
+import numpy as np
+
+from tools.esp32cam_simulator import CameraProfile, FrameSource, SimulatedCamera
+
+# Metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = ("throughput", "fps", "per_second", "mb_per_second", "recall", "precision", "detections_per_frame")
+
+
+def percentiles(samples_ms):
+    """Summary statistics for a list of latencies in ms"""
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(pick(0.50), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "samples": len(ordered)
+    }
+
+
+def synthetic_frames(count=8, width=640, height=480, seed=0):
+    """Deterministic street-like test frames encoded as JPEG bytes"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        img = np.zeros((height, width, 3), np.uint8)
+        img[:] = np.linspace(40, 200, width, dtype=np.uint8)[None, :, None]
+        for _ in range(6):
+            x, y = rng.integers(0, width - 80), rng.integers(0, height - 120)
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(img, (int(x), int(y)), (int(x) + 60, int(y) + 110), color, -1)
+        cv2.putText(img, f"frame {i}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append(buf.tobytes())
+    return frames
+
+
+def sample_images():
+    """Bundled test.jpg plus synthetic frames"""
+    images = []
+    test_jpg = BACKEND_DIR / "test.jpg"
+    if test_jpg.exists():
+        images.append(test_jpg.read_bytes())
+    return images + synthetic_frames()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class CameraThread:
+    """Runs a simulated ESP32-CAM in its own event loop thread"""
+
+    def __init__(self, fps=30.0):
+        profile = CameraProfile(fps=fps, resolution=(640, 480))
+        self.camera = SimulatedCamera("bench-cam", FrameSource.load(None, profile.resolution), profile)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.camera.start(), self._loop).result()
+        return self.camera.stream_url
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.camera.stop(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class AppServer:
+    """Runs the FastAPI app under uvicorn in a background thread"""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.port = free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def bench_single_frame(ai_service, images, iterations):
+    """End-to-end process_image latency, one frame at a time"""
+    for image in images[:2]:
+        ai_service.process_image(image)  # warm-up
+
+    samples = []
+    stages = {}
+    for i in range(iterations):
+        started = time.perf_counter()
+        result = ai_service.process_image(images[i % len(images)])
+        samples.append((time.perf_counter() - started) * 1000)
+        for stage, ms in result.get("timings_ms", {}).items():
+            stages.setdefault(stage, []).append(ms)
+
+    return {
+        **percentiles(samples),
+        "stages": {stage: percentiles(values) for stage, values in stages.items()}
+    }
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    inter = max(w, 0) * max(h, 0)
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _match(reference, detections, iou=0.5):
+    """Reference boxes found again (same class, IoU >= iou) in detections"""
+    found = 0
+    unused = list(detections)
+    for ref in reference:
+        for det in unused:
+            if det["class"] == ref["class"] and _iou(det["bbox"], ref["bbox"]) >= iou:
+                unused.remove(det)
+                found += 1
+                break
+    return found
+
+
+def bench_detection_modes(ai_service, images, iterations):
+    """
+    Latency and accuracy of the full, hazards and navigation detection modes
+
+    Accuracy is relative to full mode: its hazard-class detections are the
+    reference. Recall is reported over the whole frame and over references
+    centred in the walking corridor (what navigation mode is meant to keep).
+    """
+    from PIL import Image
+    from io import BytesIO
+    from app.config import settings
+    from app.services.ai_detection import mode_options, roi_box
+
+    fast = {"annotate": False, "speak": False}
+    modes = ("full", "hazards", "navigation")
+    hazards = set(settings.hazard_classes)
+    outputs = {mode: [] for mode in modes}
+    samples = {mode: [] for mode in modes}
+    for image in images[:2]:
+        for mode in modes:
+            ai_service.process_image(image, {**fast, **mode_options(mode)})  # warm-up
+    for i in range(iterations):
+        image = images[i % len(images)]
+        for mode in modes:
+            started = time.perf_counter()
+            result = ai_service.process_image(image, {**fast, **mode_options(mode)})
+            samples[mode].append((time.perf_counter() - started) * 1000)
+            if i < len(images):
+                outputs[mode].append(result["detections"])
+
+    sizes = [Image.open(BytesIO(image)).size for image in images[:len(outputs["full"])]]
+    results = {}
+    for mode in modes:
+        reference = found = in_corridor = found_in_corridor = kept = correct = 0
+        for size, full, got in zip(sizes, outputs["full"], outputs[mode]):
+            left, top, right, bottom = roi_box(size, settings.walking_corridor)
+            ref = [d for d in full if d["class"] in hazards]
+            centred = [
+                d for d in ref
+                if left <= d["bbox"][0] + d["bbox"][2] / 2 < right and top <= d["bbox"][1] + d["bbox"][3] / 2 < bottom
+            ]
+            got_hazards = [d for d in got if d["class"] in hazards]
+            reference += len(ref)
+            found += _match(ref, got_hazards)
+            in_corridor += len(centred)
+            found_in_corridor += _match(centred, got_hazards)
+            kept += len(got_hazards)
+            correct += _match(got_hazards, ref)
+        results[mode] = {
+            **percentiles(samples[mode]),
+            "accuracy": {
+                "recall": round(found / reference, 3) if reference else None,
+                "corridor_recall": round(found_in_corridor / in_corridor, 3) if in_corridor else None,
+                "precision": round(correct / kept, 3) if kept else None,
+                "samples": reference
+            }
+        }
+    return results
+
+
+def bench_tiled(ai_service, images, iterations):
+    """
+    Downscaled vs tiled detection on 1920x1080 uploads
+
+    Detections per frame stand in for recall. tiled_reuse sends the same
+    frame repeatedly under one source key, so unchanged tiles reuse their
+    last detections.
+    """
+    from PIL import Image
+    from io import BytesIO
+
+    frames = []
+    for image in images[:4]:
+        buf = BytesIO()
+        Image.open(BytesIO(image)).convert("RGB").resize((1920, 1080)).save(buf, format="JPEG", quality=90)
+        frames.append(buf.getvalue())
+
+    fast = {"annotate": False, "speak": False}
+    variants = {
+        "downscaled": fast,
+        "tiled": {**fast, "tiled": True},
+        "tiled_reuse": {**fast, "tiled": True, "tile_key": "bench"}
+    }
+    results = {}
+    for name, options in variants.items():
+        ai_service.process_image(frames[0], options)  # warm-up
+        samples, found = [], 0
+        for i in range(iterations):
+            frame = frames[0] if name == "tiled_reuse" else frames[i % len(frames)]
+            started = time.perf_counter()
+            result = ai_service.process_image(frame, options)
+            samples.append((time.perf_counter() - started) * 1000)
+            found += result["count"]
+        results[name] = {**percentiles(samples), "detections_per_frame": round(found / iterations, 2)}
+    return results
+
+
+def bench_batched_throughput(ai_service, images, batch_sizes, rounds):
+    """Raw model throughput for batched inputs"""
+    from PIL import Image
+    from io import BytesIO
+
+    decoded = [Image.open(BytesIO(b)).convert("RGB") for b in images]
+    results = {}
+    for batch_size in batch_sizes:
+        batch = [decoded[i % len(decoded)] for i in range(batch_size)]
+        ai_service.model(batch)  # warm-up
+        started = time.perf_counter()
+        for _ in range(rounds):
+            ai_service.model(batch)
+        elapsed = time.perf_counter() - started
+        results[f"batch_{batch_size}"] = {
+            "throughput_fps": round(batch_size * rounds / elapsed, 2),
+            "batch_latency_ms": round(elapsed / rounds * 1000, 3)
+        }
+    return results
+
+
+async def _drive(client, make_request, concurrency, total):
+    """Issue total requests with the given concurrency; returns latencies and wall time"""
+    samples = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            response = await make_request(client, i)
+            response.raise_for_status()
+            samples.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+async def bench_concurrency(app, images, levels, requests_per_level, detection):
+    """Request latency and throughput through the ASGI app at several concurrency levels"""
+    import httpx
+
+    origin = {"latitude": 43.6532, "longitude": -79.3832}
+    destination = {"latitude": 43.6629, "longitude": -79.3957}
+
+    async def start_route(client, i):
+        offset = (i % 50) * 0.002  # a mix of cache hits and misses
+        body = {
+            "origin": {"latitude": origin["latitude"] + offset, "longitude": origin["longitude"]},
+            "destination": destination
+        }
+        return await client.post("/api/navigation/navigation/start-route", json=body)
+
+    async def detect(client, i):
+        files = {"file": ("frame.jpg", images[i % len(images)], "image/jpeg")}
+        return await client.post("/api/ai/detect", files=files)
+
+    scenarios = {"start_route": start_route}
+    if detection:
+        scenarios["detect"] = detect
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, make_request in scenarios.items():
+            total = requests_per_level if name != "detect" else max(8, requests_per_level // 10)
+            for level in levels:
+                samples, elapsed = await _drive(client, make_request, level, total)
+                results[f"{name}_c{level}"] = {
+                    **percentiles(samples),
+                    "throughput_rps": round(len(samples) / elapsed, 2)
+                }
+    return results
+
+
+async def bench_gps_updates(app, updates, concurrency):
+    """Sustained update-location rate across many concurrently navigating users"""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        route_ids = []
+        for i in range(concurrency):
+            body = {
+                "origin": {"latitude": 43.65 + i * 0.001, "longitude": -79.38},
+                "destination": {"latitude": 43.66, "longitude": -79.39}
+            }
+            response = await client.post("/api/navigation/navigation/start-route", json=body)
+            route_ids.append(response.json()["route_id"])
+
+        async def update(client, i):
+            route_id = route_ids[i % len(route_ids)]
+            location = {"latitude": 43.65 + (i % 100) * 1e-5, "longitude": -79.38}
+            return await client.put(
+                f"/api/navigation/navigation/route/{route_id}/update-location", json=location
+            )
+
+        samples, elapsed = await _drive(client, update, concurrency, updates)
+
+    return {**percentiles(samples), "updates_per_second": round(len(samples) / elapsed, 2)}
+
+
+def bench_mjpeg_proxy(app, stream_module, duration):
+    """Bytes and frames per second through /api/stream/mjpeg from a simulated camera"""
+    import requests
+
+    registry, default_camera = stream_module.camera_registry, stream_module.DEFAULT_CAMERA
+    original_url = registry.pinned[default_camera]
+    try:
+        with CameraThread() as camera_url:
+            registry.pin(default_camera, camera_url)
+            with AppServer(app) as base_url:
+                received = 0
+                boundaries = 0
+                started = time.perf_counter()
+                first_byte_ms = None
+                with requests.get(f"{base_url}/api/stream/mjpeg", stream=True, timeout=10) as response:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        if first_byte_ms is None:
+                            first_byte_ms = (time.perf_counter() - started) * 1000
+                        received += len(chunk)
+                        boundaries += chunk.count(b"--frame")
+                        if time.perf_counter() - started >= duration:
+                            break
+                elapsed = time.perf_counter() - started
+    finally:
+        registry.pin(default_camera, original_url)
+
+    return {
+        "mb_per_second": round(received / elapsed / 1e6, 3),
+        "fps": round(boundaries / elapsed, 2),
+        "first_byte_ms": round(first_byte_ms or 0.0, 3)
+    }
+
+
+def flatten(results, prefix=""):
+    """Flatten nested results into dotted metric names"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against a baseline
+
+    Returns:
+        List of regressions, each a dict with metric, baseline, current and change
+    """
+    current = flatten(results["benchmarks"])
+    previous = flatten(baseline["benchmarks"])
+    regressions = []
+
+    for metric, old in previous.items():
+        new = current.get(metric)
+        if new is None or old == 0 or metric.endswith(".samples"):
+            continue
+        change = (new - old) / abs(old)
+        higher_is_better = any(token in metric for token in HIGHER_IS_BETTER)
+        worse = -change if higher_is_better else change
+        if worse > threshold:
+            regressions.append({
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change_pct": round(change * 100, 1)
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SNC backend benchmark suite")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write results")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="Also write results to this baseline path")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown counted as a regression (default 0.15)")
+    parser.add_argument("--iterations", type=int, default=30, help="Single-frame iterations")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Concurrency levels")
+    parser.add_argument("--batch-sizes", default="1,4,8", help="Batch sizes for throughput")
+    parser.add_argument("--stream-seconds", type=float, default=3.0, help="MJPEG proxy duration")
+    parser.add_argument("--skip", default="", help="Comma-separated benchmarks to skip")
+    args = parser.parse_args()
+
+    invoked_from = Path.cwd()
+    # AIDetectionService writes annotated outputs relative to the cwd
+    os.chdir(tempfile.mkdtemp(prefix="snc-bench-"))
+    skip = set(filter(None, args.skip.split(",")))
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    import main as backend_main
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # The proxy keeps writing for a moment after the benchmark client hangs up
+    logging.getLogger("asyncio").setLevel(logging.ERROR)
+    from app.routes import stream as stream_module
+    from app.services.ai_detection import ai_service
+
+    images = sample_images()
+    benchmarks = {}
+    skipped = {}
+
+    detection = False
+    if not {"single_frame", "modes", "tiled", "batched", "detect"} <= skip:
+        try:
+            ai_service.load_model()
+            detection = True
+            benchmarks["model_load_seconds"] = round(ai_service.model_load_seconds, 3)
+        except Exception as e:
+            skipped["detection"] = f"model unavailable: {e}"
+
+    if detection and "single_frame" not in skip:
+        print("Benchmarking single-frame latency...")
+        benchmarks["single_frame"] = bench_single_frame(ai_service, images, args.iterations)
+
+    if detection and "modes" not in skip:
+        print("Benchmarking detection modes...")
+        benchmarks["detection_modes"] = bench_detection_modes(ai_service, images, args.iterations)
+
+    if detection and "tiled" not in skip:
+        print("Benchmarking tiled detection...")
+        benchmarks["tiled"] = bench_tiled(ai_service, images, args.iterations)
+
+    if detection and "batched" not in skip:
+        print("Benchmarking batched throughput...")
+        sizes = [int(b) for b in args.batch_sizes.split(",")]
+        benchmarks["batched"] = bench_batched_throughput(ai_service, images, sizes, rounds=5)
+
+    if "concurrency" not in skip:
+        print("Benchmarking API concurrency scaling...")
+        benchmarks["concurrency"] = asyncio.run(bench_concurrency(
+            backend_main.app, images, levels, args.requests, detection and "detect" not in skip
+        ))
+
+    if "gps" not in skip:
+        print("Benchmarking GPS update rate...")
+        benchmarks["gps_updates"] = asyncio.run(bench_gps_updates(
+            backend_main.app, args.requests * 2, max(levels)
+        ))
+
+    if "mjpeg" not in skip:
+        print("Benchmarking MJPEG proxy throughput...")
+        benchmarks["mjpeg_proxy"] = bench_mjpeg_proxy(
+            backend_main.app, stream_module, args.stream_seconds
+        )
+
+    results = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "benchmarks": benchmarks,
+        "skipped": skipped
+    }
+
+    exit_code = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.threshold)
+        results["regressions"] = regressions
+        for r in regressions:
+            print(f"REGRESSION {r['metric']}: {r['baseline']} -> {r['current']} ({r['change_pct']:+}%)")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"No regressions against {args.baseline}")
+
+    output = json.dumps(results, indent=2)
+    for path in filter(None, (args.output, args.save_baseline)):
+        path = Path(path)
+        if not path.is_absolute():
+            path = invoked_from / path
+        path.write_text(output)
+        print(f"Results written to {path}")
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
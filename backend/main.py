@@ -3,10 +3,15 @@ Smart Navigation Cane (SNC) Backend API
 FastAPI server for AI-powered walking stick with object detection and live GPS guidance
 Main entry point for the API server
 """
-import uvicorn
+import time
+
+_started = time.perf_counter()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from typing import Dict
+import importlib
 import logging
 from dotenv import load_dotenv
 import os
@@ -18,23 +23,122 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Import routes
-from app.routes import health, detection, navigation, device, stream, ai
+# Import core routes; feature routers are loaded below per ENABLED_MODULES
+from app.routes import health, metrics as metrics_routes
+from app.services.storage import storage
+from app.services.metrics import metrics, MetricsMiddleware
+from app.services.profiler import TraceMiddleware, trace_log
+from app.services.serialization import FastJSONResponse
+from app.services.http_cache import CompressionMiddleware
+from app.config import settings
+
+# Feature modules: name -> [(router module, URL prefix, tag)]
+FEATURE_MODULES = {
+    "stream": [("app.routes.stream", "/api/stream", "ESP32-CAM Stream")],
+    "detection": [
+        ("app.routes.ai", "/api/ai", "AI Detection"),
+        ("app.routes.detection", "/api/detection", "Object Detection")
+    ],
+    "navigation": [("app.routes.navigation", "/api/navigation", "Navigation & GPS")],
+    "device": [("app.routes.device", "/api/device", "Device Management")]
+}
+
+MODULE_DESCRIPTIONS = {
+    "detection": "Camera and object detection from ESP32-CAM",
+    "stream": "ESP32-CAM MJPEG stream and snapshot proxy",
+    "navigation": "GPS-based navigation with Google Maps integration",
+    "device": "Device management for Arduino and ESP32-CAM"
+}
+
+startup_report: Dict = {"import_ms": {}}
+
+
+def load_feature_routers(app: FastAPI, enabled) -> Dict[str, object]:
+    """Import and mount the routers of each enabled module, timing each import"""
+    unknown = set(enabled) - FEATURE_MODULES.keys()
+    if unknown:
+        raise ValueError(f"Unknown modules in ENABLED_MODULES: {sorted(unknown)}")
+
+    loaded = {}
+    for name, routers in FEATURE_MODULES.items():
+        if name not in enabled:
+            continue
+        started = time.perf_counter()
+        for module_path, prefix, tag in routers:
+            module = importlib.import_module(module_path)
+            app.include_router(module.router, prefix=prefix, tags=[tag])
+            loaded[module_path.rsplit(".", 1)[1]] = module
+        startup_report["import_ms"][name] = round((time.perf_counter() - started) * 1000, 1)
+    return loaded
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events"""
     logger.info("Starting up Smart Navigation Cane Backend API Server")
-    logger.info("Available modules: Camera Detection, GPS Navigation, Device Management")
+    logger.info(f"Enabled modules: {', '.join(settings.enabled_modules)}")
+    await storage.open()
+
+    liveness_monitor = reroute_service = inference_client = camera_registry = quality_controller = None
+    scene_memory = None
+    if "device" in routers:
+        from app.services.liveness import liveness_monitor
+
+        for device_id in routers["device"].connected_devices:
+            liveness_monitor.track(device_id)
+        liveness_monitor.start()
+    if "navigation" in routers:
+        from app.services.rerouting import reroute_service
+
+        for route in routers["navigation"].active_routes.values():
+            if route.status == "active":
+                reroute_service.track(route)
+    if "stream" in routers or "ai" in routers:
+        from app.services.camera_registry import camera_registry
+
+        camera_registry.start()
+    if "ai" in routers and settings.inference_process:
+        from app.services.inference_process import inference_client
+
+        inference_client.start()
+    if "ai" in routers and settings.adaptive_quality:
+        from app.services.quality_control import quality_controller
+
+        quality_controller.start()
+    if ("ai" in routers or "navigation" in routers) and settings.scene_memory:
+        from app.services.scene_memory import scene_memory
+
+        scene_memory.start()
+
+    startup_report["ready_ms"] = round((time.perf_counter() - _started) * 1000, 1)
+    logger.info(
+        f"Ready in {startup_report['ready_ms']:.0f} ms "
+        f"(core imports {startup_report['core_import_ms']:.0f} ms, "
+        + ", ".join(f"{k} {v:.0f} ms" for k, v in startup_report["import_ms"].items()) + ")"
+    )
     yield
+    if scene_memory is not None:
+        await scene_memory.stop()
+    if quality_controller is not None:
+        await quality_controller.stop()
+    if inference_client is not None:
+        inference_client.stop()
+    if camera_registry is not None:
+        await camera_registry.close()
+    if liveness_monitor is not None:
+        await liveness_monitor.stop()
+    await storage.close()
     logger.info("Shutting down Smart Navigation Cane Backend API Server")
 
+startup_report["core_import_ms"] = round((time.perf_counter() - _started) * 1000, 1)
+
 # Create FastAPI application
 app = FastAPI(
     title="Smart Navigation Cane (SNC) Backend",
     description="Backend API for AI-powered walking stick with object detection and live GPS guidance",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware
@@ -44,15 +148,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor", "ETag", "Last-Modified"],
 )
 
+# Compress large JSON/text responses for the cane's metered link
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+
+# Record per-route request latency
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
+# Opt-in profiling; nothing is installed unless enabled
+if settings.profiling_enabled:
+    from app.routes import debug
+
+    app.add_middleware(TraceMiddleware, token=settings.admin_token, log=trace_log)
+
 # Include routers
 app.include_router(health.router, tags=["Health"])
-app.include_router(stream.router, prefix="/api/stream", tags=["ESP32-CAM Stream"])
-app.include_router(ai.router, prefix="/api/ai", tags=["AI Detection"])
-app.include_router(detection.router, prefix="/api/detection", tags=["Object Detection"])
-app.include_router(navigation.router, prefix="/api/navigation", tags=["Navigation & GPS"])
-app.include_router(device.router, prefix="/api/device", tags=["Device Management"])
+app.include_router(metrics_routes.router, tags=["Metrics"])
+routers = load_feature_routers(app, settings.enabled_modules)
+if settings.profiling_enabled:
+    app.include_router(debug.router, prefix="/api/debug", tags=["Debug"])
+
+metrics.gauge(
+    "snc_startup_seconds", "Time from interpreter import of main to serving requests",
+    lambda: startup_report["ready_ms"] / 1000 if "ready_ms" in startup_report else None
+)
 
 # Root endpoint
 @app.get("/")
@@ -63,19 +184,44 @@ async def root():
         "version": "2.0.0",
         "description": "AI-powered walking stick with object detection and live GPS guidance",
         "modules": {
-            "detection": "Camera and object detection from ESP32-CAM",
-            "navigation": "GPS-based navigation with Google Maps integration",
-            "device": "Device management for Arduino and ESP32-CAM"
+            name: MODULE_DESCRIPTIONS[name]
+            for name in FEATURE_MODULES if name in settings.enabled_modules
         },
+        "startup": startup_report,
         "docs": "/docs",
         "redoc": "/redoc"
     }
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the SNC backend")
+    parser.add_argument("--production", action="store_true",
+                        help="Preload the model and fork workers that share it")
+    parser.add_argument("--workers", type=int, default=settings.workers,
+                        help="Worker processes in production mode (0 = one per core)")
+    parser.add_argument("--torch-threads", type=int, default=settings.torch_threads,
+                        help="Torch intra-op threads per worker (0 = cores / workers)")
+    args = parser.parse_args()
+
+    if args.production:
+        from app.launcher import run_production
+
+        run_production(
+            "main:app",
+            host=settings.api_host,
+            port=settings.api_port,
+            workers=args.workers,
+            torch_threads=args.torch_threads,
+            preload_model="detection" in settings.enabled_modules
+        )
+    else:
+        import uvicorn
+
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
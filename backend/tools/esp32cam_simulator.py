@@ -0,0 +1,430 @@
+"""
+ESP32-CAM simulator
+Stands in for the firmware in esp32_cam_hotspot.ino / esp32_cam_station_mode.ino
+so the stream, snapshot and detection paths can be load-tested without hardware
+
+Serves the same endpoints as the firmware (/stream, /capture.jpg, /status,
+/trigger-capture) from a folder of images, a video file or synthetic frames,
+with injectable latency, jitter, stalls and disconnects. Hundreds of cameras
+run in one asyncio process, one port each.
+
+Usage (from backend/):
+    python tools/esp32cam_simulator.py --cameras 200 --base-port 9000 --fps 20
+    python tools/esp32cam_simulator.py --source ./clips/walk.mp4 --resolution 320x240 \\
+        --latency-ms 40 --jitter-ms 15 --stall-rate 0.01 --disconnect-rate 0.001
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import signal
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = "frame"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+# Firmware frame sizes (config.frame_size)
+FRAME_SIZES = {
+    "QQVGA": (160, 120),
+    "QVGA": (320, 240),
+    "VGA": (640, 480),
+    "SVGA": (800, 600),
+    "XGA": (1024, 768),
+    "UXGA": (1600, 1200)
+}
+
+
+@dataclass
+class CameraProfile:
+    """Frame rate, resolution and fault injection for one simulated camera"""
+    fps: float = 20.0
+    resolution: Tuple[int, int] = (640, 480)
+    jpeg_quality: int = 80
+    latency_ms: float = 0.0  # added before every response
+    jitter_ms: float = 0.0  # uniform +/- jitter on latency and frame interval
+    stall_rate: float = 0.0  # per-frame probability of a stall
+    stall_seconds: float = 2.0
+    disconnect_rate: float = 0.0  # per-frame probability of dropping the stream
+    capture_failure_rate: float = 0.0  # probability /capture.jpg returns 500
+
+
+class FrameSource:
+    """
+    Pre-encoded JPEG frames shared by every camera using the same input
+
+    Frames are decoded, resized and encoded once up front so serving them is
+    just a socket write, which is what lets one process host hundreds of
+    cameras.
+    """
+
+    _cache: Dict[Tuple, "FrameSource"] = {}
+
+    def __init__(self, frames: List[bytes]):
+        if not frames:
+            raise ValueError("Frame source produced no frames")
+        self.frames = frames
+
+    @classmethod
+    def load(cls, source: Optional[str], resolution: Tuple[int, int],
+             quality: int = 80, max_frames: int = 300) -> "FrameSource":
+        """Load (or reuse) frames from a folder, a video file or synthetic images"""
+        key = (source, resolution, quality, max_frames)
+        if key not in cls._cache:
+            if source is None:
+                images = cls._synthetic(resolution, count=min(max_frames, 60))
+            elif Path(source).is_dir():
+                images = cls._from_folder(Path(source), max_frames)
+            else:
+                images = cls._from_video(source, max_frames)
+            cls._cache[key] = cls([cls._encode(img, resolution, quality) for img in images])
+        return cls._cache[key]
+
+    def frame(self, index: int) -> bytes:
+        return self.frames[index % len(self.frames)]
+
+    @staticmethod
+    def _from_folder(folder: Path, max_frames: int) -> List[np.ndarray]:
+        paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        images = [cv2.imread(str(p)) for p in paths[:max_frames]]
+        return [img for img in images if img is not None]
+
+    @staticmethod
+    def _from_video(path: str, max_frames: int) -> List[np.ndarray]:
+        capture = cv2.VideoCapture(path)
+        images = []
+        try:
+            while len(images) < max_frames:
+                ok, img = capture.read()
+                if not ok:
+                    break
+                images.append(img)
+        finally:
+            capture.release()
+        return images
+
+    @staticmethod
+    def _synthetic(resolution: Tuple[int, int], count: int) -> List[np.ndarray]:
+        """A slowly panning street-like scene with a few moving blocks"""
+        width, height = resolution
+        base = np.zeros((height, width, 3), np.uint8)
+        base[: height // 2] = (200, 160, 110)  # sky
+        base[height // 2:] = (90, 90, 90)  # pavement
+        images = []
+        for i in range(count):
+            img = base.copy()
+            for j in range(4):
+                x = int((i * (3 + j) + j * width // 4) % width)
+                y = height // 2 + (j * height // 10) % (height // 3)
+                cv2.rectangle(img, (x, y), (x + width // 12, y + height // 5), (40 + 50 * j, 80, 160), -1)
+            cv2.putText(img, f"SIM {i:03d}", (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            images.append(img)
+        return images
+
+    @staticmethod
+    def _encode(img: np.ndarray, resolution: Tuple[int, int], quality: int) -> bytes:
+        if (img.shape[1], img.shape[0]) != resolution:
+            img = cv2.resize(img, resolution, interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return buf.tobytes()
+
+
+@dataclass
+class CameraStats:
+    stream_clients: int = 0
+    streams_served: int = 0
+    frames_sent: int = 0
+    bytes_sent: int = 0
+    captures_served: int = 0
+    stalls: int = 0
+    disconnects: int = 0
+    started_at: float = field(default_factory=time.time)
+
+
+class SimulatedCamera:
+    """One fake ESP32-CAM HTTP server"""
+
+    def __init__(self, name: str, source: FrameSource, profile: CameraProfile,
+                 host: str = "127.0.0.1", port: int = 0, seed: Optional[int] = None):
+        self.name = name
+        self.source = source
+        self.profile = profile
+        self.host = host
+        self.port = port
+        self.stats = CameraStats()
+        self._rng = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers = set()
+        self._frame_index = self._rng.randrange(len(source.frames))
+        self._last_capture: Optional[bytes] = None
+        self._last_capture_ms = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def stream_url(self) -> str:
+        return f"{self.base_url}/stream"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=128)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for task in list(self._handlers):
+            task.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    def _next_frame(self) -> bytes:
+        self._frame_index += 1
+        return self.source.frame(self._frame_index)
+
+    def _jittered(self, seconds: float) -> float:
+        jitter = self.profile.jitter_ms / 1000
+        return max(0.0, seconds + self._rng.uniform(-jitter, jitter))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._handlers.add(asyncio.current_task())
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            method, path = (parts[0], parts[1]) if len(parts) >= 2 else ("GET", "/")
+            path = path.split("?", 1)[0]
+
+            if self.profile.latency_ms or self.profile.jitter_ms:
+                await asyncio.sleep(self._jittered(self.profile.latency_ms / 1000))
+
+            if path == "/stream":
+                await self._stream(reader, writer)
+            elif path == "/capture.jpg":
+                await self._capture(writer)
+            elif path == "/trigger-capture":
+                await self._trigger(writer)
+            elif path == "/status":
+                await self._status(writer)
+            elif path == "/":
+                body = f"<html><body><h2>{self.name}</h2><img src='/stream'></body></html>".encode()
+                await self._respond(writer, 200, "text/html", body)
+            else:
+                await self._respond(writer, 404, "text/plain", b"Not found")
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Cancellation comes from stop(); finishing normally keeps asyncio quiet
+            pass
+        finally:
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, content_type: str,
+                       body: bytes, headers: Optional[Dict[str, str]] = None):
+        reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}.get(status, "")
+        lines = [
+            f"HTTP/1.1 {status} {reason}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            "Access-Control-Allow-Origin: *",
+            "Connection: close"
+        ]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    async def _stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        profile = self.profile
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            + f"Content-Type: multipart/x-mixed-replace; boundary={BOUNDARY}\r\n".encode()
+            + b"Access-Control-Allow-Origin: *\r\n\r\n"
+        )
+        self.stats.stream_clients += 1
+        self.stats.streams_served += 1
+        loop = asyncio.get_running_loop()
+        interval = 1 / profile.fps if profile.fps > 0 else 0.0
+        next_at = loop.time()
+
+        try:
+            while not (writer.is_closing() or reader.at_eof()):
+                if profile.disconnect_rate and self._rng.random() < profile.disconnect_rate:
+                    self.stats.disconnects += 1
+                    writer.transport.abort()
+                    return
+
+                if profile.stall_rate and self._rng.random() < profile.stall_rate:
+                    self.stats.stalls += 1
+                    await asyncio.sleep(profile.stall_seconds)
+                    next_at = loop.time()
+
+                jpg = self._next_frame()
+                writer.write(
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpg)}\r\n\r\n".encode()
+                    + jpg + b"\r\n"
+                )
+                await writer.drain()
+                self.stats.frames_sent += 1
+                self.stats.bytes_sent += len(jpg)
+
+                # Schedule against the ideal timeline so slow writes don't lower the rate
+                next_at += self._jittered(interval)
+                await asyncio.sleep(max(0.0, next_at - loop.time()))
+        finally:
+            self.stats.stream_clients -= 1
+
+    async def _capture(self, writer: asyncio.StreamWriter):
+        if self.profile.capture_failure_rate and self._rng.random() < self.profile.capture_failure_rate:
+            await self._respond(writer, 500, "text/plain", b"Camera capture failed")
+            return
+
+        if self._last_capture is not None:
+            body = self._last_capture
+            headers = {"X-Capture-Time": str(self._last_capture_ms)}
+        else:
+            body, headers = self._next_frame(), None
+        await self._respond(writer, 200, "image/jpeg", body, headers)
+        self.stats.captures_served += 1
+        self.stats.bytes_sent += len(body)
+
+    async def _trigger(self, writer: asyncio.StreamWriter):
+        self._last_capture = self._next_frame()
+        self._last_capture_ms = int((time.time() - self.stats.started_at) * 1000)
+        body = json.dumps({
+            "status": "captured",
+            "size": len(self._last_capture),
+            "time": self._last_capture_ms
+        }).encode()
+        await self._respond(writer, 200, "application/json", body)
+
+    async def _status(self, writer: asyncio.StreamWriter):
+        body = json.dumps({
+            "status": "online",
+            "ssid": "SNC-SIM",
+            "ip": f"{self.host}:{self.port}",
+            "stream_url": self.stream_url,
+            "name": self.name,
+            "uptime_ms": int((time.time() - self.stats.started_at) * 1000)
+        }).encode()
+        await self._respond(writer, 200, "application/json", body)
+
+
+class CameraFleet:
+    """Many simulated cameras on consecutive ports in one event loop"""
+
+    def __init__(self, count: int, profile: CameraProfile, source: Optional[str] = None,
+                 host: str = "127.0.0.1", base_port: int = 0, seed: Optional[int] = None):
+        frames = FrameSource.load(source, profile.resolution, profile.jpeg_quality)
+        self.cameras = [
+            SimulatedCamera(
+                f"esp32cam-sim-{i:03d}", frames, profile, host,
+                port=base_port + i if base_port else 0,
+                seed=None if seed is None else seed + i
+            )
+            for i in range(count)
+        ]
+
+    async def start(self):
+        await asyncio.gather(*(camera.start() for camera in self.cameras))
+
+    async def stop(self):
+        await asyncio.gather(*(camera.stop() for camera in self.cameras))
+
+    def urls(self) -> List[str]:
+        return [camera.stream_url for camera in self.cameras]
+
+    def stats(self) -> Dict:
+        totals = CameraStats().__dict__.copy()
+        totals.pop("started_at")
+        for camera in self.cameras:
+            for key in totals:
+                totals[key] += getattr(camera.stats, key)
+        return {"cameras": len(self.cameras), **totals}
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    if value.upper() in FRAME_SIZES:
+        return FRAME_SIZES[value.upper()]
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+async def _run(args):
+    profile = CameraProfile(
+        fps=args.fps,
+        resolution=parse_resolution(args.resolution),
+        jpeg_quality=args.quality,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        disconnect_rate=args.disconnect_rate,
+        capture_failure_rate=args.capture_failure_rate
+    )
+    fleet = CameraFleet(args.cameras, profile, args.source, args.host, args.base_port, args.seed)
+    await fleet.start()
+
+    for camera in fleet.cameras[:5]:
+        logger.info(f"{camera.name}: {camera.stream_url}")
+    if len(fleet.cameras) > 5:
+        logger.info(f"... {len(fleet.cameras) - 5} more, up to {fleet.cameras[-1].stream_url}")
+    if args.urls_file:
+        Path(args.urls_file).write_text("\n".join(fleet.urls()) + "\n")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=args.report_every)
+        except asyncio.TimeoutError:
+            logger.info(json.dumps(fleet.stats()))
+
+    await fleet.stop()
+    logger.info(f"Stopped: {json.dumps(fleet.stats())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of ESP32-CAM devices")
+    parser.add_argument("--cameras", type=int, default=1, help="Number of simulated cameras")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--base-port", type=int, default=9000, help="Port of the first camera (0 = ephemeral)")
+    parser.add_argument("--source", help="Folder of images or a video file (default: synthetic frames)")
+    parser.add_argument("--fps", type=float, default=20.0, help="Stream frame rate per client")
+    parser.add_argument("--resolution", default="VGA", help="WxH or a firmware size (QVGA, VGA, ...)")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality (1-100)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Latency and frame-interval jitter")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Per-frame stall probability")
+    parser.add_argument("--stall-seconds", type=float, default=2.0, help="Stall duration")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Per-frame disconnect probability")
+    parser.add_argument("--capture-failure-rate", type=float, default=0.0, help="/capture.jpg failure probability")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible fault injection")
+    parser.add_argument("--urls-file", help="Write every stream URL to this file")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between stats lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()